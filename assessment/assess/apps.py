@@ -21,8 +21,14 @@ class BaseAssessConfig(AppConfig):
         SUBJECT_ORDER_BY = settings.ASSESSMENT_SUBJECT_ORDER_BY,
         SCORE_CLASSES = settings.ASSESSMENT_SCORE_CLASSES,
         PERMISSIONS=settings.ASSESSMENT_PERMISSIONS,
+        DEDUPLICATE_FILES = settings.ASSESSMENT_DEDUPLICATE_FILES,
+        FILE_SERVER = settings.ASSESSMENT_FILE_SERVER,
+        X_ACCEL_REDIRECT_URL = settings.ASSESSMENT_X_ACCEL_REDIRECT_URL,
     )
 
+    def ready(self):
+        from assessment.assess import signals  # noqa: connect signal receivers
+
     @classmethod
     def get_assessment_subject_model(cls):
         """ Get swappable concrete Assessment Subject model """
@@ -0,0 +1,104 @@
+"""
+    Streamed ZIP archives of the supporting documents behind an AssessmentRecord or AssessmentGroup.
+    Attached files are read from storage one chunk at a time and written to an unseekable buffer that is drained after
+        every chunk, so the archive is never staged on disk or in memory.
+    Each archive has a manifest.csv listing every document:  the archived path of attached files, or the url of links.
+        Attachments the user may not access, or missing from storage, are listed in the manifest with a note.
+    Archive layout:  <category slug>/<metric slug>/<filename>
+"""
+import csv, functools, io, os, zipfile
+from assessment.assess import models, servers
+
+MANIFEST_NAME = 'manifest.csv'
+MANIFEST_COLUMNS = ('record', 'category', 'question', 'metric', 'document_type', 'description', 'file', 'url', 'note')
+
+
+def get_supporting_docs(**filters):
+    """ Return queryset of SupportingDocs matching filters, e.g., score__assessment=record, in archive order """
+    return models.SupportingDoc.objects.filter(**filters).select_related(
+        'score__assessment__category', 'score__metric__question'
+    ).order_by('score__assessment__category__topic__order', 'score__assessment__category__activity__order',
+               'score__metric__question__order', 'score__metric__order', 'pk')
+
+
+def get_file_access_check(request):
+    """ Return can_access(doc) for iter_zip that applies the private-storage auth function, if files are private """
+    if not models.appConfig.settings.USE_PRIVATE_FILES:
+        return None
+    return functools.partial(servers.can_access, request)
+
+
+class ZipStream(io.RawIOBase):
+    """ Unseekable, write-only file for zipfile that hands over the archive's bytes as they are written """
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self._chunks.append(bytes(b))
+        return len(b)
+
+    def drain(self):
+        """ Return list of chunks written since the last drain """
+        chunks, self._chunks = self._chunks, []
+        return chunks
+
+
+def unique_path(path, paths):
+    """ Return path, or a numbered variant of it, that is not already in the set of paths - add it to paths """
+    root, ext = os.path.splitext(path)
+    candidate, n = path, 1
+    while candidate in paths:
+        n += 1
+        candidate = '{root} ({n}){ext}'.format(root=root, n=n, ext=ext)
+    paths.add(candidate)
+    return candidate
+
+
+def manifest_row(doc):
+    score = doc.score
+    return dict(
+        record=score.assessment_id, category=score.assessment.category.slug,
+        question=score.metric.question.label, metric=score.metric.label,
+        document_type=doc.document_type, description=doc.description, url=doc.url,
+    )
+
+
+def iter_zip(docs, can_access=None):
+    """
+        Generate the bytes of a ZIP archive of the files attached to the given SupportingDocs, with a manifest.
+        can_access(doc) -> bool, if given, must be True for a doc's file to be included in the archive.
+    """
+    stream = ZipStream()
+    manifest = io.StringIO()
+    writer = csv.DictWriter(manifest, MANIFEST_COLUMNS)
+    writer.writeheader()
+    paths = {MANIFEST_NAME}
+    with zipfile.ZipFile(stream, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for doc in docs:
+            row = manifest_row(doc)
+            if doc.file and can_access is not None and not can_access(doc):
+                row['note'] = 'access denied'
+            elif doc.file:
+                try:
+                    content = doc.file.storage.open(doc.file.name, 'rb')
+                except OSError:
+                    row['note'] = 'file not found'
+                else:
+                    with content:
+                        path = unique_path('{category}/{metric}/{filename}'.format(
+                            category=row['category'], metric=doc.score.metric.slug,
+                            filename=os.path.basename(doc.file.name)
+                        ), paths)
+                        force_zip64 = content.size > zipfile.ZIP64_LIMIT * 0.9
+                        with archive.open(path, 'w', force_zip64=force_zip64) as entry:
+                            for chunk in content.chunks():
+                                entry.write(chunk)
+                                yield from stream.drain()
+                    row['file'] = path
+            writer.writerow(row)
+        archive.writestr(MANIFEST_NAME, manifest.getvalue())
+    yield from stream.drain()
@@ -0,0 +1,203 @@
+"""
+    Denormalized datasets of complete assessment data for bulk export:  record metadata, subject, category / topic /
+        activity, and the applicable / score / comments of every MetricScore.
+    Layouts:
+        long - one row per MetricScore, with its record's columns repeated
+        wide - one row per AssessmentRecord, with a score column for each metric (None where not applicable)
+    Datasets are assembled in chunks of records, 2 queries per chunk (records, then their scores), plus 2 queries
+        up front for the taxonomy labels, so memory use is bounded by the chunk size, not the size of the export.
+    Formats:  JSON Lines, or Arrow IPC stream / Parquet if pyarrow is installed.
+"""
+import datetime
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.serializers.json import DjangoJSONEncoder
+from assessment.assess import models
+
+LONG, WIDE = 'long', 'wide'
+LAYOUTS = (LONG, WIDE)
+
+RECORD_COLUMNS = ('record', 'group', 'status', 'assessment_type', 'created', 'last_edited', 'assessor',
+                  'subject', 'category', 'activity', 'topic')
+SCORE_COLUMNS = ('question', 'metric_id', 'metric', 'applicable', 'score', 'comments')
+
+
+class AssessmentDataset:
+    """ Denormalized dataset for the given AssessmentRecord queryset, generated in chunks of rows """
+    def __init__(self, records=None, layout=LONG, chunk_size=1000):
+        if layout not in LAYOUTS:
+            raise ValueError('Unknown dataset layout: {layout}'.format(layout=layout))
+        self.records = models.AssessmentRecord.summaries.all() if records is None else records
+        self.layout = layout
+        self.chunk_size = chunk_size
+        self._categories = {
+            category.pk: category for category in
+            models.AssessmentCategory._base_manager.select_related('activity', 'topic')
+        }
+        self._metrics = {
+            metric.pk: metric for metric in
+            models.AssessmentMetric._base_manager.select_related('question')
+                                                 .order_by('question__category__topic__order',
+                                                           'question__category__activity__order',
+                                                           'question__order', 'order')
+        }
+        self._metric_order = {pk: i for i, pk in enumerate(self._metrics)}
+        if layout == WIDE:
+            category_ids = set(self.records.order_by().values_list('category', flat=True).distinct())
+            self.wide_metrics = [metric for metric in self._metrics.values()
+                                 if metric.question.category_id in category_ids]
+
+    @property
+    def columns(self):
+        if self.layout == LONG:
+            return RECORD_COLUMNS + SCORE_COLUMNS
+        return RECORD_COLUMNS + tuple(self.metric_column(metric) for metric in self.wide_metrics)
+
+    @staticmethod
+    def metric_column(metric):
+        return '{question}: {metric} [{pk}]'.format(question=metric.question.label, metric=metric.label, pk=metric.pk)
+
+    def column_types(self):
+        """ Return the python type of the values in each column - dates and times are datetime types """
+        types = dict.fromkeys(self.columns, str)
+        types.update(record=int, group=int, created=datetime.date, last_edited=datetime.datetime,
+                     metric_id=int, applicable=bool, score=int)
+        if self.layout == WIDE:
+            types.update({self.metric_column(metric): int for metric in self.wide_metrics})
+        return types
+
+    def record_chunks(self):
+        """ Generate lists of records, in pk order, using keyset pagination so each chunk costs the same """
+        records = self.records.order_by('pk')
+        last_pk = None
+        while True:
+            chunk = records if last_pk is None else records.filter(pk__gt=last_pk)
+            chunk = list(chunk[:self.chunk_size])
+            if not chunk:
+                return
+            yield chunk
+            last_pk = chunk[-1].pk
+
+    def record_values(self, record):
+        category = self._categories[record.category_id]
+        return (record.pk, record.group_id, record.status, record.assessment_type, record.created,
+                record.last_edited, record.assessor.get_username(), str(record.subject) if record.has_subject else None,
+                category.label, category.activity.label, category.topic.label)
+
+    def chunks(self):
+        """ Generate lists of row tuples, one list per chunk of records """
+        for records in self.record_chunks():
+            scores = models.MetricScore._base_manager.filter(assessment__in=records)\
+                                                     .values_list('assessment_id', 'metric_id', 'applicable',
+                                                                  'score', 'comments')\
+                                                     .order_by()
+            scores_by_record = {}
+            for score in scores:
+                scores_by_record.setdefault(score[0], []).append(score)
+            rows = []
+            for record in records:
+                record_values = self.record_values(record)
+                record_scores = sorted(scores_by_record.get(record.pk, ()), key=lambda s: self._metric_order[s[1]])
+                if self.layout == LONG:
+                    for _, metric_id, applicable, score, comments in record_scores:
+                        metric = self._metrics[metric_id]
+                        rows.append(record_values + (metric.question.label, metric_id, metric.label,
+                                                     applicable, score, comments))
+                else:
+                    values = {metric_id: score if applicable else None
+                              for _, metric_id, applicable, score, _ in record_scores}
+                    rows.append(record_values + tuple(values.get(metric.pk) for metric in self.wide_metrics))
+            yield rows
+
+    def __iter__(self):
+        for rows in self.chunks():
+            yield from rows
+
+
+# -----------  Formats -------------- #
+
+
+def iter_jsonl(dataset):
+    """ Generate JSON Lines for the dataset:  one JSON object per row, encoded as one chunk of utf-8 lines at a time """
+    encoder, columns = DjangoJSONEncoder(), dataset.columns
+    for rows in dataset.chunks():
+        yield ''.join(encoder.encode(dict(zip(columns, row))) + '\n' for row in rows).encode()
+
+
+def get_pyarrow():
+    try:
+        import pyarrow
+    except ImportError:
+        raise ImproperlyConfigured('Arrow and Parquet exports require pyarrow:  pip install pyarrow')
+    return pyarrow
+
+
+def arrow_schema(dataset):
+    pa = get_pyarrow()
+    types = {
+        int: pa.int64(), bool: pa.bool_(), str: pa.string(), datetime.date: pa.date32(),
+        datetime.datetime: pa.timestamp('us', tz='UTC' if settings.USE_TZ else None),
+    }
+    return pa.schema([(name, types[column_type]) for name, column_type in dataset.column_types().items()])
+
+
+def arrow_batches(dataset, schema):
+    """ Generate an Arrow RecordBatch for each chunk of the dataset """
+    pa = get_pyarrow()
+    for rows in dataset.chunks():
+        if rows:
+            columns = [pa.array(column, type=field.type) for column, field in zip(zip(*rows), schema)]
+            yield pa.RecordBatch.from_arrays(columns, schema=schema)
+
+
+class ChunkBuffer:
+    """ Write-only file-like object that hands back everything written to it since it was last read """
+    def __init__(self):
+        self.chunks, self.position = [], 0
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def read(self):
+        data, self.chunks = b''.join(self.chunks), []
+        return data
+
+
+def iter_arrow(dataset):
+    """ Return a generator of the dataset as an Arrow IPC stream, one record batch per chunk """
+    pa = get_pyarrow()  # fail now, not part way through a response
+    schema = arrow_schema(dataset)
+
+    def stream():
+        buffer = ChunkBuffer()
+        with pa.ipc.new_stream(buffer, schema) as writer:
+            for batch in arrow_batches(dataset, schema):
+                writer.write_batch(batch)
+                yield buffer.read()
+        yield buffer.read()
+    return stream()
+
+
+def write_parquet(dataset, path):
+    """ Write the dataset to a Parquet file at path, one row group per chunk """
+    get_pyarrow()
+    import pyarrow.parquet as pq
+    schema = arrow_schema(dataset)
+    with pq.ParquetWriter(path, schema) as writer:
+        for batch in arrow_batches(dataset, schema):
+            writer.write_batch(batch)
+
+
+STREAM_FORMATS = {
+    # format: (generator of bytes, content type, file extension)
+    'jsonl': (iter_jsonl, 'application/x-ndjson', 'jsonl'),
+    'arrow': (iter_arrow, 'application/vnd.apache.arrow.stream', 'arrows'),
+}
@@ -36,7 +36,7 @@ class CategoryAssessmentsFilter(BaseAssessmentFilter, assessment_subject_filters
         fields = BaseAssessmentFilter.Meta.fields + assessment_subject_filterset.Meta.fields
 
 
-group_subject_accessor = 'assessment_set__{subject}'.format(subject=subject_accessor)
+group_subject_accessor = 'subject_record__{subject}'.format(subject=subject_accessor)
 group_subject_filterset = SubjectModel.get_related_subject_filterset(group_subject_accessor)
 
 
@@ -45,3 +45,28 @@ class GroupAssessmentsFilter(BaseAssessmentFilter, group_subject_filterset):
     class Meta:
         model = models.AssessmentGroup
         fields = BaseAssessmentFilter.Meta.fields + group_subject_filterset.Meta.fields
+
+
+class HeatmapFilter(filters.FilterSet):
+    """ Filter the complete assessment records summarized in the assessment matrix heatmap """
+    created = filters.DateFromToRangeFilter(label='Created between',
+                                            widget=filters.widgets.DateRangeWidget(attrs={'class': 'form-control',
+                                                                                          'type': 'date'}))
+    assessment_type = filters.ChoiceFilter(choices=choices.ASSESSMENT_TYPE_SHORT_CHOICES,
+                                           widget=forms.Select(attrs={'class':'form-control'}))
+    class Meta:
+        model = models.AssessmentRecord
+        fields = [
+            'created',
+            'assessment_type',
+        ]
+
+
+class DatasetFilter(HeatmapFilter):
+    """ Select the assessment records included in a bulk data export """
+    category = filters.ModelMultipleChoiceFilter(field_name='category__slug', to_field_name='slug',
+                                                queryset=models.AssessmentCategory.objects.all())
+    status = filters.ChoiceFilter(choices=choices.STATUS_CHOICES)
+
+    class Meta(HeatmapFilter.Meta):
+        fields = HeatmapFilter.Meta.fields + ['category', 'status']
@@ -0,0 +1,405 @@
+"""
+    Batched bulk import of assessment records from tabular data:  CSV, a JSON array of objects, or JSON Lines.
+    Rows use the long layout of an export (see assess.datasets):  one row per metric score, and every row for a
+        record shares the same 'record' key and follows the previous row for that record.
+    Columns (all but record, category, assessment_type optional):
+        record - import key shared by the rows of one record (e.g., the record id from an export)
+        category - slug or label;  assessment_type, status, created, last_edited, assessor (username)
+        subject - the subject's first form field (e.g., label);  subject_<field> for any other subject form field
+        metric_id, or question + metric labels;  applicable, score (DB value or choice label), comments
+        doc_url, doc_type, doc_description - a supporting document link for the row's metric score
+    Record and subject columns are read from a record's first row.  Metrics without a row get an 'empty' score.
+    Rows are validated in memory against the builder taxonomy and metric choice maps.  A record with any invalid row
+        is skipped and its errors reported;  valid records are created with bulk inserts, one transaction per batch.
+"""
+import csv, io, json, os
+from collections import namedtuple, Counter
+from itertools import groupby
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.db import transaction, connections, router, DatabaseError
+from django.utils import dateparse, timezone
+from assessment.builder import blueprints
+from assessment.assess import models, choices
+
+
+RowError = namedtuple('RowError', ('row', 'record', 'message'))
+
+ImportRecord = namedtuple('ImportRecord', ('key', 'rows', 'record', 'dates', 'subject', 'scores', 'docs'))
+
+TRUE_VALUES = ('true', 't', 'yes', 'y', '1')
+FALSE_VALUES = ('false', 'f', 'no', 'n', '0', 'n/a', 'na')
+
+
+# -----------  Formats -------------- #
+
+
+def read_csv(f):
+    """ Generate a dict for each row of a CSV file (binary or text) with a header row """
+    if not isinstance(f, io.TextIOBase):
+        f = io.TextIOWrapper(f, encoding='utf-8-sig', newline='')
+    return csv.DictReader(f)
+
+
+def read_json(f):
+    """ Generate each object from a file containing a JSON array of objects """
+    rows = json.load(f)
+    if not isinstance(rows, list):
+        raise ValueError('JSON import must be an array of row objects')
+    return iter(rows)
+
+
+def read_jsonl(f):
+    """ Generate each object from a JSON Lines file - a line that is not valid JSON generates None """
+    for line in f:
+        if line.strip():
+            try:
+                yield json.loads(line)
+            except ValueError:
+                yield None
+
+
+READERS = {
+    'csv': read_csv,
+    'json': read_json,
+    'jsonl': read_jsonl,
+}
+
+
+def get_format(filename, default='csv'):
+    """ Return the import format for a file name, from its extension """
+    extension = os.path.splitext(filename)[1].lstrip('.').lower()
+    extension = 'jsonl' if extension == 'ndjson' else extension
+    return extension if extension in READERS else default
+
+
+# -----------  Import -------------- #
+
+
+class ImportReport:
+    """ Outcome of an import:  counts of rows read and objects created, and a RowError for each rejected row """
+    def __init__(self, dry_run=False):
+        self.dry_run = dry_run
+        self.rows = self.records = self.scores = self.docs = 0
+        self.errors = []
+
+    @property
+    def ok(self):
+        return not self.errors
+
+    def as_dict(self):
+        return dict(
+            dry_run=self.dry_run, rows=self.rows, records=self.records, scores=self.scores, docs=self.docs,
+            errors=[error._asdict() for error in self.errors],
+        )
+
+
+class AssessmentImporter:
+    """
+        Import AssessmentRecords, their subjects, metric scores and supporting document links from rows of data.
+        assessor is the default user for rows with no assessor;  in a dry run rows are validated but nothing is saved.
+    """
+    def __init__(self, batch_size=500, assessor=None, dry_run=False, using=None):
+        self.batch_size = max(batch_size, 1)
+        self.assessor = assessor
+        self.dry_run = dry_run
+        self.using = using or router.db_for_write(models.AssessmentRecord)
+        self.subject_model = models.get_assessment_subject_model()
+        self.subject_form_class = self.subject_model.get_modelform()
+        self.subject_field = next(iter(self.subject_form_class.base_fields))
+        categories = list(models.AssessmentCategory._base_manager.all())
+        labels = Counter(category.label for category in categories)
+        self._categories = {category.label: category for category in categories  # only labels that identify a category
+                            if category.label and labels[category.label] == 1}
+        self._categories.update((category.slug, category) for category in categories)
+        self._metrics = {
+            metric.pk: metric for metric in models.AssessmentMetric._base_manager.select_related('question', 'choices')
+        }
+        self._metrics_by_label = {
+            (metric.question.category_id, metric.question.label, metric.label): metric
+            for metric in self._metrics.values()
+        }
+        self._blueprints = {
+            category_id: (blueprint.metric_ids, set(blueprint.metric_ids))
+            for category_id, blueprint in blueprints.get_blueprints(category.pk for category in categories).items()
+        }
+        self._choice_values = {}
+
+    def run(self, rows):
+        """ Import an iterable of row dicts, batch by batch, and return an ImportReport """
+        report = ImportReport(self.dry_run)
+        batch, seen = [], set()
+        for key, group in groupby(enumerate(rows, 1), key=lambda item: self.get_key(item[1])):
+            group = list(group)
+            report.rows += len(group)
+            if key in seen:
+                self.add_errors(report, key, group, 'record: rows for a record must be consecutive - already imported')
+                continue
+            if key is not None:
+                seen.add(key)
+            batch.append((key, group))
+            if len(batch) == self.batch_size:
+                self.import_batch(batch, report)
+                batch = []
+        if batch:
+            self.import_batch(batch, report)
+        return report
+
+    @staticmethod
+    def get_key(row):
+        key = row.get('record') if isinstance(row, dict) else None
+        return None if key in (None, '') else str(key).strip()
+
+    @staticmethod
+    def add_errors(report, key, rows, message):
+        report.errors.extend(RowError(row, key, message) for row, _ in rows)
+
+    def import_batch(self, batch, report):
+        """ Validate a batch of (key, rows) and create its valid records in one transaction """
+        users = self.get_users(row for _, rows in batch for _, row in rows[:1])
+        records = []
+        for key, rows in batch:
+            record, errors = self.parse_record(key, rows, users)
+            if errors:
+                report.errors.extend(errors)
+            else:
+                records.append(record)
+        if not self.dry_run:
+            try:
+                with transaction.atomic(using=self.using):
+                    self.create(records)
+            except DatabaseError as e:
+                for record in records:
+                    self.add_errors(report, record.key, record.rows, 'Batch not imported: {e}'.format(e=e))
+                return
+        report.records += len(records)
+        report.scores += sum(len(record.scores) for record in records)
+        report.docs += sum(len(record.docs) for record in records)
+
+    def get_users(self, rows):
+        """ Return dict of users, by username, for the assessors named in rows, in one query """
+        user_model = get_user_model()
+        names = {str(row['assessor']).strip() for row in rows if isinstance(row, dict) and row.get('assessor')}
+        users = user_model._default_manager.filter(**{'{}__in'.format(user_model.USERNAME_FIELD): names})
+        return {user.get_username(): user for user in users}
+
+    # -----------  Validation -------------- #
+
+    @staticmethod
+    def clean_field(model, name, value, column=None):
+        """ Return value cleaned by the model field - validates choices, lengths, URLs, etc. without any queries """
+        field = model._meta.get_field(name)
+        try:
+            return field.clean(field.get_default() if value in (None, '') else value, None)
+        except ValidationError as e:
+            raise ValidationError(['{column}: {message}'.format(column=column or name, message=message)
+                                   for message in e.messages])
+
+    def get_choice_value(self, metric, label):
+        """ Return the DB value for a metric choice label, or None """
+        values = self._choice_values.get(metric.choices_id)
+        if values is None:
+            values = self._choice_values[metric.choices_id] = {
+                str(choice_label): value for value, choice_label in metric.choices.choice_dict.items()
+            }
+        return values.get(label)
+
+    def parse_score(self, metric, value):
+        """ Return the score DB value for a score given as a DB value or a choice label """
+        if isinstance(value, bool) or not isinstance(value, (int, str)):
+            raise ValidationError('score: invalid score {value!r}'.format(value=value))
+        value = value.strip() if isinstance(value, str) else value
+        score = int(value) if isinstance(value, int) or value.isdigit() else self.get_choice_value(metric, value)
+        if not metric.validate(score):
+            raise ValidationError('score: invalid score {value!r} for metric {metric} - choices are {choices}'.format(
+                value=value, metric=metric, choices=', '.join(metric.choices.choice_dict.values())
+            ))
+        return score
+
+    @staticmethod
+    def parse_bool(value, name, default=True):
+        if value in (None, ''):
+            return default
+        if isinstance(value, bool):
+            return value
+        if str(value).strip().lower() in TRUE_VALUES:
+            return True
+        if str(value).strip().lower() in FALSE_VALUES:
+            return False
+        raise ValidationError('{name}: invalid true / false value {value!r}'.format(name=name, value=value))
+
+    @staticmethod
+    def parse_date(value, parse, name):
+        if value in (None, ''):
+            return None
+        try:
+            parsed = parse(str(value))
+        except ValueError:
+            parsed = None
+        if parsed is None:
+            raise ValidationError('{name}: invalid date {value!r}'.format(name=name, value=value))
+        return parsed
+
+    def get_metric(self, category, row):
+        """ Return the metric for the row, by metric_id or question / metric labels, or None if the row has no metric """
+        metric_id, question, label = row.get('metric_id'), row.get('question'), row.get('metric')
+        if metric_id in (None, '') and not label:
+            return None
+        if metric_id not in (None, ''):
+            try:
+                metric = self._metrics.get(int(metric_id))
+            except (TypeError, ValueError):
+                metric = None
+        else:
+            metric = self._metrics_by_label.get((category.pk, question, label))
+        if metric is None or metric.pk not in self._blueprints[category.pk][1]:
+            raise ValidationError('metric: no metric {metric} in category {category}'.format(
+                metric=metric_id if metric_id not in (None, '') else '{}: {}'.format(question, label),
+                category=category
+            ))
+        return metric
+
+    def parse_record(self, key, rows, users):
+        """ Return (ImportRecord, errors) for the rows of one record - the record is None if there are any errors """
+        errors = []
+
+        def error(row, e):
+            errors.extend(RowError(row, key, message) for message in e.messages)
+
+        first_row, first = rows[0]
+        if not isinstance(first, dict) or key is None:
+            for row, data in rows:
+                error(row, ValidationError('Row is not an object with a record key' if not isinstance(data, dict)
+                                           else 'record: this field is required'))
+            return None, errors
+
+        category = self._categories.get(first.get('category'))
+        if category is None:
+            error(first_row, ValidationError('category: no category {category!r}'.format(category=first.get('category'))))
+            return None, errors
+
+        record, dates = models.AssessmentRecord(category=category), {}
+        assessor = first.get('assessor')
+        user = users.get(str(assessor).strip()) if assessor else self.assessor
+        if user is None:
+            error(first_row, ValidationError('assessor: no user {user!r}'.format(user=assessor) if assessor else
+                                             'assessor: this field is required'))
+        record.assessor = record.last_edited_by = user
+        for name in ('assessment_type', 'status'):
+            try:
+                setattr(record, name, self.clean_field(models.AssessmentRecord, name, first.get(name)))
+            except ValidationError as e:
+                error(first_row, e)
+        try:
+            dates = {name: value for name, value in (
+                ('created', self.parse_date(first.get('created'), dateparse.parse_date, 'created')),
+                ('last_edited', self.parse_date(first.get('last_edited'), dateparse.parse_datetime, 'last_edited')),
+            ) if value is not None}
+        except ValidationError as e:
+            error(first_row, e)
+        if 'last_edited' in dates and timezone.is_naive(dates['last_edited']):
+            dates['last_edited'] = timezone.make_aware(dates['last_edited'])
+        record.created = dates.get('created', timezone.localdate())
+        record.last_edited = dates.get('last_edited', timezone.now())
+
+        subject_data = {self.subject_field: first.get('subject')}
+        subject_data.update((name, first['subject_{}'.format(name)]) for name in self.subject_form_class.base_fields
+                            if 'subject_{}'.format(name) in first)
+        subject_form = self.subject_form_class(data={k: v for k, v in subject_data.items() if v is not None})
+        subject = subject_form.save(commit=False) if subject_form.is_valid() else None
+        for name, messages in subject_form.errors.items():
+            error(first_row, ValidationError(['subject {name}: {message}'.format(name=name, message=message)
+                                              for message in messages]))
+
+        scores, docs = {}, []
+        for row, data in rows:
+            try:
+                metric = self.get_metric(category, data)
+                if metric is None:
+                    continue
+                if metric.pk in scores:
+                    raise ValidationError('Duplicate score for metric {metric}'.format(metric=metric))
+                applicable = self.parse_bool(data.get('applicable'), 'applicable')
+                score = data.get('score')
+                if score in (None, ''):
+                    if applicable:
+                        raise ValidationError('score: a score is required for an applicable metric')
+                    score = self.clean_field(models.MetricScore, 'score', None)
+                else:
+                    score = self.parse_score(metric, score)
+                scores[metric.pk] = models.MetricScore(
+                    metric=metric, applicable=applicable, score=score,
+                    comments=self.clean_field(models.MetricScore, 'comments', data.get('comments')),
+                )
+                if data.get('doc_url'):
+                    docs.append((metric.pk, models.SupportingDoc(
+                        document_location=choices.DOCUMENT_LOCATION_LINK,
+                        url=self.clean_field(models.SupportingDoc, 'url', data['doc_url'], 'doc_url'),
+                        document_type=self.clean_field(models.SupportingDoc, 'document_type', data.get('doc_type'),
+                                                       'doc_type'),
+                        description=self.clean_field(models.SupportingDoc, 'description', data.get('doc_description'),
+                                                     'doc_description'),
+                    )))
+            except ValidationError as e:
+                error(row, e)
+        if errors:
+            return None, errors
+
+        metric_ids = self._blueprints[category.pk][0]
+        scores = [scores.get(metric_id) or models.MetricScore(metric_id=metric_id) for metric_id in metric_ids]
+        return ImportRecord(key, rows, record, dates, subject, scores, docs), errors
+
+    # -----------  Creation -------------- #
+
+    def create(self, records):
+        """ Create the records, subjects, scores and supporting docs with a fixed number of bulk inserts """
+        if not records:
+            return
+        objs = [record.record for record in records]
+        if connections[self.using].features.can_return_rows_from_bulk_insert:
+            models.AssessmentRecord.objects.using(self.using).bulk_create(objs)
+            dated = [record for record in records if record.dates]
+            if dated:  # bulk_create applies auto_now / auto_now_add - restore dates given in the import
+                for record in dated:
+                    for name, value in record.dates.items():
+                        setattr(record.record, name, value)
+                models.AssessmentRecord.objects.using(self.using).bulk_update(
+                    [record.record for record in dated], ['created', 'last_edited']
+                )
+        else:  # DB backend does not return ids from bulk inserts - they are needed to relate subjects and scores
+            for obj in objs:
+                obj.save_base(raw=True, using=self.using)
+
+        for record in records:
+            record.subject.record = record.record
+            for score in record.scores:
+                score.assessment = record.record
+            applicable = [score.score for score in record.scores if score.applicable]
+            record.record.score_sum, record.record.score_count = sum(applicable), len(applicable)
+            record.record.avg_score = record.record.score_sum / record.record.score_count if applicable else None
+        self.subject_model.objects.using(self.using).bulk_create([record.subject for record in records])
+        scores = [score for record in records for score in record.scores]
+        models.MetricScore.objects.using(self.using).bulk_create(scores)  # Note: also updates stored score summaries
+
+        docs = [(record, metric_id, doc) for record in records for metric_id, doc in record.docs]
+        if docs:
+            score_ids = {(score.assessment_id, score.metric_id): score.pk for score in scores}
+            if scores[0].pk is None:
+                score_ids = {
+                    (assessment_id, metric_id): pk for assessment_id, metric_id, pk in
+                    models.MetricScore._base_manager.using(self.using).filter(assessment__in=objs)
+                                                    .values_list('assessment_id', 'metric_id', 'pk')
+                }
+            for record, metric_id, doc in docs:
+                doc.score_id = score_ids[(record.record.pk, metric_id)]
+            models.SupportingDoc.objects.using(self.using).bulk_create([doc for _, _, doc in docs])
+
+
+def import_rows(rows, **kwargs):
+    """ Import an iterable of row dicts and return an ImportReport - kwargs are passed to AssessmentImporter """
+    return AssessmentImporter(**kwargs).run(rows)
+
+
+def import_file(f, import_format='csv', **kwargs):
+    """ Import rows from a file object in the given format (csv, json, jsonl) and return an ImportReport """
+    return import_rows(READERS[import_format](f), **kwargs)
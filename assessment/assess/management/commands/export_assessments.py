@@ -0,0 +1,65 @@
+import sys
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+from assessment.assess import models, filters, datasets
+
+FORMATS = tuple(datasets.STREAM_FORMATS) + ('parquet', )
+
+
+class Command(BaseCommand):
+    help = 'Export a denormalized dataset of assessment records, subjects, categories and metric scores.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--layout', choices=datasets.LAYOUTS, default=datasets.LONG,
+                            help='long: one row per metric score;  wide: one row per record, a column per metric')
+        parser.add_argument('--format', choices=FORMATS, default='jsonl', dest='export_format',
+                            help='Output format - arrow and parquet require pyarrow')
+        parser.add_argument('--output', '-o', default='-',
+                            help='Output file path, or - for stdout (not available for parquet)')
+        parser.add_argument('--chunk-size', type=int, default=5000,
+                            help='Number of records loaded and written at a time')
+        parser.add_argument('--category', action='append', default=[],
+                            help='Slug of a category to export - may be repeated;  default: all categories')
+        parser.add_argument('--status', help='Only export records with this status, e.g., complete')
+        parser.add_argument('--assessment-type', help='Only export records of this assessment type')
+        parser.add_argument('--created-after', help='Only export records created on or after this date (YYYY-MM-DD)')
+        parser.add_argument('--created-before', help='Only export records created on or before this date (YYYY-MM-DD)')
+
+    def get_records(self, options):
+        data = {
+            'category': options['category'],
+            'status': options['status'],
+            'assessment_type': options['assessment_type'],
+            'created_after': options['created_after'],
+            'created_before': options['created_before'],
+        }
+        filterset = filters.DatasetFilter({k: v for k, v in data.items() if v},
+                                          queryset=models.AssessmentRecord.summaries.all())
+        if not filterset.is_valid():
+            raise CommandError('Invalid filter: {errors}'.format(errors=filterset.errors.as_text()))
+        return filterset.qs
+
+    def handle(self, *args, **options):
+        export_format, output = options['export_format'], options['output']
+        dataset = datasets.AssessmentDataset(self.get_records(options), layout=options['layout'],
+                                             chunk_size=max(options['chunk_size'], 1))
+        try:
+            if export_format == 'parquet':
+                if output == '-':
+                    raise CommandError('Parquet export must be written to a file:  use --output')
+                datasets.write_parquet(dataset, output)
+                return
+            generate, _, _ = datasets.STREAM_FORMATS[export_format]
+            content = generate(dataset)
+            if output == '-':
+                self.write_content(content, sys.stdout.buffer)
+            else:
+                with open(output, 'wb') as f:
+                    self.write_content(content, f)
+        except ImproperlyConfigured as e:
+            raise CommandError(str(e))
+
+    @staticmethod
+    def write_content(content, f):
+        for data in content:
+            f.write(data)
@@ -0,0 +1,59 @@
+import csv, sys
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from assessment.assess import importers
+
+
+class Command(BaseCommand):
+    help = 'Import assessment records, subjects, metric scores and supporting document links from CSV or JSON rows.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Path of the file to import, or - for stdin')
+        parser.add_argument('--format', choices=tuple(importers.READERS), dest='import_format',
+                            help='Input format;  default: from the file extension, csv for stdin')
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Number of records validated and created in each transaction')
+        parser.add_argument('--assessor', help='Username of the assessor for rows with no assessor')
+        parser.add_argument('--dry-run', action='store_true', help='Validate the rows but do not import anything')
+        parser.add_argument('--errors', help='Write the error report to this CSV file instead of stderr')
+
+    def get_assessor(self, username):
+        if not username:
+            return None
+        user_model = get_user_model()
+        try:
+            return user_model._default_manager.get_by_natural_key(username)
+        except user_model.DoesNotExist:
+            raise CommandError('No user with username {username}'.format(username=username))
+
+    def handle(self, *args, **options):
+        path = options['path']
+        import_format = options['import_format'] or importers.get_format(path)
+        kwargs = dict(batch_size=options['batch_size'], assessor=self.get_assessor(options['assessor']),
+                      dry_run=options['dry_run'])
+        try:
+            if path == '-':
+                report = importers.import_file(sys.stdin.buffer, import_format, **kwargs)
+            else:
+                with open(path, 'rb') as f:
+                    report = importers.import_file(f, import_format, **kwargs)
+        except (OSError, ValueError, csv.Error) as e:
+            raise CommandError('Unable to read {path}: {e}'.format(path=path, e=e))
+
+        self.stdout.write('{action} {records} records, {scores} scores, {docs} supporting docs from {rows} rows'.format(
+            action='Validated' if report.dry_run else 'Imported', records=report.records, scores=report.scores,
+            docs=report.docs, rows=report.rows,
+        ))
+        if report.ok:
+            return
+        if options['errors']:
+            with open(options['errors'], 'w', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(importers.RowError._fields)
+                writer.writerows(report.errors)
+        else:
+            for error in report.errors:
+                self.stderr.write('row {row} (record {record}): {message}'.format(**error._asdict()))
+        raise CommandError('{errors} errors - {rows} rows were not imported'.format(
+            errors=len(report.errors), rows=len({error.row for error in report.errors})
+        ))
@@ -0,0 +1,17 @@
+import datetime
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from assessment.assess import models
+
+
+class Command(BaseCommand):
+    help = 'Delete content-addressed attachment files (DEDUPLICATE_FILES) left in storage by rolled back transactions.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grace', type=int, default=60,
+                            help='Only delete files older than this many minutes, so uploads still in progress are kept')
+
+    def handle(self, *args, **options):
+        before = timezone.now() - datetime.timedelta(minutes=options['grace'])
+        for name in models.DocumentBlob.objects.sweep_orphans(before):
+            self.stdout.write('Deleted {name}'.format(name=name))
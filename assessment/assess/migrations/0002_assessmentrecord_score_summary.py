@@ -0,0 +1,42 @@
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def calculate_score_summaries(apps, schema_editor):
+    """ Populate the stored score summary for existing assessment records """
+    AssessmentRecord = apps.get_model('assess', 'AssessmentRecord')
+    MetricScore = apps.get_model('assess', 'MetricScore')
+    scores = MetricScore.objects.filter(assessment=models.OuterRef('pk'), applicable=True)\
+                                .order_by().values('assessment')
+    aggregate = lambda agg: models.Subquery(scores.annotate(value=agg).values('value'))
+    AssessmentRecord.objects.update(
+        score_sum=Coalesce(aggregate(models.Sum('score')), 0),
+        score_count=Coalesce(aggregate(models.Count('pk')), 0),
+        avg_score=aggregate(models.Avg('score')),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('assess', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='assessmentrecord',
+            name='score_sum',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='assessmentrecord',
+            name='score_count',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Number of applicable metric scores'),
+        ),
+        migrations.AddField(
+            model_name='assessmentrecord',
+            name='avg_score',
+            field=models.FloatField(blank=True, db_index=True, editable=False, null=True),
+        ),
+        migrations.RunPython(calculate_score_summaries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def set_subject_records(apps, schema_editor):
+    """ Reference the first assessment record in each existing group as the group's subject record """
+    AssessmentGroup = apps.get_model('assess', 'AssessmentGroup')
+    AssessmentRecord = apps.get_model('assess', 'AssessmentRecord')
+    first_record = AssessmentRecord.objects.filter(group=models.OuterRef('pk')).order_by('pk').values('pk')[:1]
+    AssessmentGroup.objects.update(subject_record=models.Subquery(first_record))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('assess', '0002_assessmentrecord_score_summary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='assessmentgroup',
+            name='subject_record',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='assess.AssessmentRecord'),
+        ),
+        migrations.RunPython(set_subject_records, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,43 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('assess', '0003_assessmentgroup_subject_record'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='assessmentgroup',
+            index=models.Index(fields=['activity', 'status', '-created'], name='assess_group_activity_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='assessmentgroup',
+            index=models.Index(fields=['topic', 'status', '-created'], name='assess_group_topic_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='assessmentgroup',
+            index=models.Index(fields=['status', '-created'], name='assess_group_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='assessmentrecord',
+            index=models.Index(fields=['category', 'status', 'assessment_type', '-created'], name='assess_record_category_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='assessmentrecord',
+            index=models.Index(fields=['status', '-created'], name='assess_record_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='assessmentrecord',
+            index=models.Index(condition=models.Q(('status', 'complete')), fields=['category', '-created'], name='assess_record_complete_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='assessmentrecord',
+            index=models.Index(fields=['group', '-last_edited'], name='assess_record_edited_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='metricscore',
+            index=models.Index(condition=models.Q(('applicable', True)), fields=['assessment', 'score'], name='assess_score_applicable_idx'),
+        ),
+    ]
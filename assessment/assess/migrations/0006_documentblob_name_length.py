@@ -0,0 +1,29 @@
+import assessment.assess.models
+from django.db import migrations, models
+import private_storage.fields
+import private_storage.storage.files
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('assess', '0005_documentblob'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='documentblob',
+            name='name',
+            field=models.CharField(help_text='Storage name of the file', max_length=255, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='documentblob',
+            name='size',
+            field=models.BigIntegerField(),
+        ),
+        migrations.AlterField(
+            model_name='supportingdoc',
+            name='file',
+            field=private_storage.fields.PrivateFileField(blank=True, max_length=255, null=True, storage=private_storage.storage.files.PrivateFileSystemStorage(), upload_to=assessment.assess.models.supporting_doc_directory_path),
+        ),
+    ]
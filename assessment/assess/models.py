@@ -1,7 +1,9 @@
-import datetime, statistics, bisect, os
+import datetime, statistics, bisect, math, os, re, hashlib, functools, contextlib
+from collections import Counter
 from django.utils.functional import cached_property
 from django.urls import reverse
-from django.db import models
+from django.db import models, transaction, IntegrityError
+from django.db.models.functions import Cast, Coalesce
 from django.contrib.auth import get_user_model
 from django.core.exceptions import ValidationError
 from assessment import settings
@@ -9,6 +11,7 @@ from assessment.builder.models import (  # import all builder models so they are
     Activity, Topic, AssessmentCategory,
     AssessmentQuestion, AssessmentMetric, ReferenceDocument
 )
+from assessment.builder import blueprints, taxonomy
 from assessment.assess import choices
 
 from django.apps import apps
@@ -47,24 +50,174 @@ class AssessmentQueryset(DraftsQueryset):
         return self.annotate(**annotation)
 
 
+class AssessmentRecordQueryset(AssessmentQueryset):
+    def adjust_score_summary(self, score_delta, count_delta):
+        """
+            Incrementally adjust the stored score summary for records in this queryset
+            score_delta / count_delta are added to the sum / count of applicable scores; avg_score is recalculated.
+        """
+        score_sum = models.F('score_sum') + score_delta
+        score_count = models.F('score_count') + count_delta
+        # Note: all column references in an UPDATE see the old row values, hence the offset in the When lookup
+        return self.update(
+            score_sum=score_sum,
+            score_count=score_count,
+            avg_score=models.Case(
+                models.When(score_count__gt=-count_delta, then=Cast(score_sum, models.FloatField()) / score_count),
+                default=None, output_field=models.FloatField(),
+            ),
+        )
+
+    def update_score_summaries(self):
+        """ Recalculate the stored score summary for records in this queryset from their applicable MetricScores """
+        scores = MetricScore._base_manager.filter(assessment=models.OuterRef('pk'), applicable=True)\
+                                          .order_by().values('assessment')
+        aggregate = lambda agg: models.Subquery(scores.annotate(value=agg).values('value'))
+        return self.update(
+            score_sum=Coalesce(aggregate(models.Sum('score')), 0),
+            score_count=Coalesce(aggregate(models.Count('pk')), 0),
+            avg_score=aggregate(models.Avg('score')),
+        )
+
+    def summarize(self, *fields):
+        """
+            Return a values queryset summarizing these records, grouped by the given fields, in one GROUP BY query:
+                records, score_sum, score_count (of applicable scores), and score_classes_<i> for each i in SCORE_CLASSES:
+                number of records in i-th score class (same classification as AbstractAssessmentRecord.score_class)
+        """
+        score_classes = {}
+        lower = None
+        zero_class = bisect.bisect(appConfig.settings.SCORE_CLASSES, (0, ))  # unscored records are classed as a zero
+        for i, (upper, name) in enumerate(appConfig.settings.SCORE_CLASSES):
+            in_class = models.Q() if lower is None else models.Q(avg_score__gt=lower)
+            if upper != math.inf:
+                in_class &= models.Q(avg_score__lte=upper)
+            if i == zero_class:
+                in_class |= models.Q(avg_score__isnull=True)
+            score_classes['score_classes_{i}'.format(i=i)] = models.Count('pk', filter=in_class)
+            lower = upper
+        return self.order_by().values(*fields).annotate(
+            records=models.Count('pk'),
+            score_sum=Coalesce(models.Sum('score_sum'), 0),
+            score_count=Coalesce(models.Sum('score_count'), 0),
+            **score_classes
+        )
+
+    def bulk_create_group_set(self, template, group, categories):
+        """
+            Create a copy of the template record, with a copy of its subject and an 'empty' set of MetricScores,
+                in the given group for each of the given categories, using a fixed number of bulk inserts.
+            Returns the list of new records, in category order.  Wrap in a transaction to create the set atomically.
+        """
+        categories = list(categories)
+        if not categories:
+            return []
+        record_fields = [field.attname for field in self.model._meta.concrete_fields
+                         if not field.primary_key and field.name not in self.model.SCORE_SUMMARY_FIELDS]
+        values = dict({name: getattr(template, name) for name in record_fields}, group_id=group.pk, status=group.status)
+        records = self.bulk_create([self.model(**dict(values, category_id=category.pk)) for category in categories])
+        if records[0].pk is None:  # DB backend does not return ids from bulk inserts - group has one record per category
+            pks = dict(self.model._base_manager.filter(group=group).values_list('category_id', 'pk'))
+            for record in records:
+                record.pk = pks[record.category_id]
+
+        subject = template.subject
+        subject_model = type(subject)
+        subject_fields = [field.attname for field in subject_model._meta.concrete_fields
+                          if not field.primary_key and field.name != 'record']
+        subject_model.objects.bulk_create([
+            subject_model(record=record, **{name: getattr(subject, name) for name in subject_fields})
+            for record in records
+        ])
+
+        category_blueprints = blueprints.get_blueprints(category.pk for category in categories)
+        scores = []
+        for record in records:
+            record_scores = [MetricScore(assessment=record, metric_id=metric_id)
+                             for metric_id in category_blueprints[record.category_id].metric_ids]
+            applicable = [score.score for score in record_scores if score.applicable]
+            record.score_sum, record.score_count = sum(applicable), len(applicable)
+            record.avg_score = record.score_sum / record.score_count if record.score_count else None
+            scores.extend(record_scores)
+        MetricScore.objects.bulk_create(scores)  # Note: also updates stored score summaries in DB
+        return records
+
+    def with_score_set(self):
+        """ Prefetch the full tree of metric scores, in question order, with metrics and supporting docs """
+        scores = MetricScore.objects.order_by('metric__question', 'metric')
+        return self.prefetch_related(models.Prefetch('score_set', queryset=scores), 'score_set__doc_set')
+
+
 class AssessmentManager(models.Manager):
     def get_queryset(self):
         subject = appConfig.get_assessment_subject_related_name()
         select = (subject, 'group', 'category', 'category__topic', 'category__activity')
-        prefetch = ('score_set', 'score_set__doc_set', 'score_set__metric')
-        return super().get_queryset().select_related(*select)\
-                                     .prefetch_related(*prefetch)\
-                                     .annotate_avg_score()
+        return super().get_queryset().select_related(*select)
+
+
+class AssessmentSummaryManager(models.Manager):
+    """ Lightweight queryset for listing records in tables: only the columns tables display, no prefetch trees """
+    record_fields = ('status', 'assessment_type', 'created', 'category', 'group', 'last_edited',
+                     'score_sum', 'score_count', 'avg_score')
+    assessor_fields = ('first_name', 'last_name', 'username')
+
+    def get_queryset(self):
+        subject = appConfig.get_assessment_subject_related_name()
+        subject_model = get_assessment_subject_model()
+        subject_fields = subject_model.summary_fields or \
+            tuple(field.name for field in subject_model._meta.concrete_fields)
+        return super().get_queryset().select_related(subject, 'assessor').only(
+            *self.record_fields,
+            *('assessor__{field}'.format(field=field) for field in self.assessor_fields),
+            *('{subject}__{field}'.format(subject=subject, field=field) for field in subject_fields),
+        )
+
+
+class AssessmentGroupQueryset(AssessmentQueryset):
+    def annotate_summary(self):
+        """
+            Annotate each group with a summary of its records, using correlated subqueries over the stored
+                record score summaries rather than joining groups x records x scores:
+            score_sum, score_count, avg_score (should match assessment_score()), record_count, latest_edit
+        """
+        records = AssessmentRecord._base_manager.filter(group=models.OuterRef('pk')).order_by().values('group')
+        aggregate = lambda agg: models.Subquery(records.annotate(value=agg).values('value'))
+        score_sum = Coalesce(aggregate(models.Sum('score_sum')), 0)
+        score_count = Coalesce(aggregate(models.Sum('score_count')), 0)
+        return self.annotate(
+            score_sum=score_sum,
+            score_count=score_count,
+            avg_score=models.Case(
+                models.When(score_count__gt=0, then=Cast('score_sum', models.FloatField()) / models.F('score_count')),
+                default=None, output_field=models.FloatField(),
+            ),
+            record_count=Coalesce(aggregate(models.Count('pk')), 0),
+            latest_edit=aggregate(models.Max('last_edited')),
+        )
+
+    def update_subject_records(self):
+        """ Refer each group in this queryset without a subject record (e.g., it was deleted) to its first record """
+        first_record = AssessmentRecord._base_manager.filter(group=models.OuterRef('pk')).order_by('pk').values('pk')[:1]
+        return self.filter(subject_record=None).update(subject_record=models.Subquery(first_record))
+
+    def with_score_set(self):
+        """ Prefetch the full tree of assessment records, each with its metric scores and supporting docs """
+        return self.prefetch_related(
+            models.Prefetch('assessment_set', queryset=AssessmentRecord.objects.with_score_set())
+        )
+
 
 class AssessmentSetManager(models.Manager):
     def get_queryset(self):
-        assessment_set_subject = 'assessment_set__{}'.format(appConfig.get_assessment_subject_related_name())
-        prefetch = ('assessment_set', assessment_set_subject, 'assessment_set__score_set',
-                    'assessment_set__score_set__doc_set', 'assessment_set__score_set__metric')
+        subject = 'subject_record__{}'.format(appConfig.get_assessment_subject_related_name())
+        return super().get_queryset().select_related('activity', 'topic', subject)\
+                                     .annotate_summary()
 
-        return super().get_queryset().select_related('activity', 'topic')\
-                                     .prefetch_related(*prefetch)\
-                                     .annotate_avg_score(field_name='assessment_set__score_set')
+
+class AssessmentSetSummaryManager(AssessmentSetManager):
+    """ Lightweight queryset for listing groups in tables """
+    def get_queryset(self):
+        return super().get_queryset().select_related('assessor')
 
 
 class AbstractAssessmentRecord(models.Model):
@@ -83,9 +236,14 @@ class AbstractAssessmentRecord(models.Model):
         """ Return iterable of applicable metric scores for this Assessment Record """
         raise NotImplementedError
 
+    @property
+    def is_scored(self):
+        """ Return True iff this record has any applicable metric scores """
+        return self.applicable_scores.exists()
+
     def assessment_score(self):
         """ Average metric scores on this assessment """
-        try:  # try getting query annotation first, calculate mean as a backup (force lazy eval to avoid extra queries)
+        try:  # try stored summary or query annotation first, calculate mean as a backup (force lazy eval to avoid extra queries)
             return self.avg_score
         except AttributeError:
             try:
@@ -110,8 +268,12 @@ class AssessmentGroup(AbstractAssessmentRecord):
                               null=True, blank=True, related_name='assessment_group_set')
     assessor = models.ForeignKey(get_user_model(), verbose_name='Assessed by',
                                  on_delete=models.DO_NOTHING, related_name='assessment_group_set')
+    # Every Assessment in a group has a copy of the same subject - keep a reference to one so it can be joined in SQL
+    subject_record = models.ForeignKey('AssessmentRecord', null=True, blank=True, editable=False,
+                                       on_delete=models.SET_NULL, related_name='+')
 
-    objects = AssessmentSetManager.from_queryset(AssessmentQueryset)()
+    objects = AssessmentSetManager.from_queryset(AssessmentGroupQueryset)()
+    summaries = AssessmentSetSummaryManager.from_queryset(AssessmentGroupQueryset)()
 
     class Meta:
         constraints = [
@@ -119,6 +281,11 @@ class AssessmentGroup(AbstractAssessmentRecord):
                                          (~models.Q(topic=None) | ~models.Q(activity=None)),
                                    name='group_exclusive_activity_or_topic'),
         ]
+        indexes = [  # group tables list one activity or topic, filtered by status, most recent first
+            models.Index(fields=['activity', 'status', '-created'], name='assess_group_activity_idx'),
+            models.Index(fields=['topic', 'status', '-created'], name='assess_group_topic_idx'),
+            models.Index(fields=['status', '-created'], name='assess_group_status_idx'),
+        ]
         verbose_name = 'Assessment Set'
 
     def __str__(self):
@@ -133,6 +300,9 @@ class AssessmentGroup(AbstractAssessmentRecord):
     def get_delete_url(self):
         return reverse('assessment.assess:group-delete', args=(self.pk, ))
 
+    def get_docs_url(self):
+        return reverse('assessment.assess:group-docs', args=(self.pk, ))
+
     def clean(self):
         # A group must define exactly one of activity or topic
         def xor(a, b): return (a or b) and not (a and b)
@@ -176,17 +346,24 @@ class AssessmentGroup(AbstractAssessmentRecord):
     @property
     def score_set(self):
         """ Return queryset for complete set of metric scores for all Assessments in this Group """
-        return MetricScore.objects.filter(assessment__group=self)
+        return MetricScore.objects.select_related('assessment', 'assessment__category').filter(assessment__group=self)
 
     @property
     def applicable_scores(self):
         """ Return queryset for set of applicable metric scores for all Assessments in this Group """
-        return MetricScore.applies.filter(assessment__group=self)
+        return MetricScore.applies.select_related('assessment', 'assessment__category').filter(assessment__group=self)
 
     @property
     def subject(self):
         """ Return the AssessmentSubject object from one of the Assessments in this group """
-        return getattr(self.assessment_set.first(), 'subject', None)
+        record = self.subject_record if self.subject_record_id else self.assessment_set.first()
+        return getattr(record, 'subject', None)
+
+    @property
+    def is_scored(self):
+        if hasattr(self, 'score_count'):  # annotated summary
+            return self.score_count > 0
+        return super().is_scored
 
     @cached_property
     def last_edited_assessment(self):
@@ -196,6 +373,8 @@ class AssessmentGroup(AbstractAssessmentRecord):
     @property
     def last_edited(self):
         """ Return the edit date of most recently edited Assessment in this group """
+        if hasattr(self, 'latest_edit'):  # annotated summary
+            return self.latest_edit
         return self.last_edited_assessment.last_edited
 
     @property
@@ -211,16 +390,11 @@ class AssessmentGroup(AbstractAssessmentRecord):
         # Exclude categories for which there is already an assessment in this group
         assert self.pk is not None, 'AssessmentSet must be saved before attempting to load with assessments'
         categories = self.category_set.exclude(pk__in=self.assessment_set.all().values_list('category__pk', flat=True))
-        assessment.group = self
-        assessment.status = self.status
-        subject = assessment.subject
-        for cat in categories:
-            assessment.pk = None
-            assessment.category = cat
-            assessment.save()
-            subject.pk = None
-            subject.record = assessment
-            subject.save()
+        with transaction.atomic():
+            records = AssessmentRecord.objects.bulk_create_group_set(assessment, self, categories)
+            if records and not self.subject_record_id:
+                self.subject_record = records[0]
+                AssessmentGroup.objects.filter(pk=self.pk).update(subject_record=records[0].pk)
 
 
 class AssessmentRecord(AbstractAssessmentRecord):
@@ -236,12 +410,27 @@ class AssessmentRecord(AbstractAssessmentRecord):
     last_edited = models.DateTimeField(auto_now=True)
     last_edited_by = models.ForeignKey(get_user_model(),
                                        on_delete=models.DO_NOTHING, related_name='+')
+    # Stored score summary, maintained incrementally as MetricScores are saved, updated, or deleted.
+    score_sum = models.PositiveIntegerField(default=0, editable=False)
+    score_count = models.PositiveIntegerField(default=0, editable=False,
+                                              help_text='Number of applicable metric scores')
+    avg_score = models.FloatField(null=True, blank=True, editable=False, db_index=True)
 
-    objects = AssessmentManager.from_queryset(AssessmentQueryset)()
+    SCORE_SUMMARY_FIELDS = ('score_sum', 'score_count', 'avg_score')
+
+    objects = AssessmentManager.from_queryset(AssessmentRecordQueryset)()
+    summaries = AssessmentSummaryManager.from_queryset(AssessmentRecordQueryset)()
 
     class Meta:
         ordering = ('category__topic__order', 'category__activity__order', '-created', )
         verbose_name = 'Assessment Record'
+        indexes = [  # category tables list one category, filtered by status / type, most recent first
+            models.Index(fields=['category', 'status', 'assessment_type', '-created'], name='assess_record_category_idx'),
+            models.Index(fields=['status', '-created'], name='assess_record_status_idx'),
+            models.Index(fields=['category', '-created'], condition=models.Q(status=choices.COMPLETE_STATUS),
+                         name='assess_record_complete_idx'),
+            models.Index(fields=['group', '-last_edited'], name='assess_record_edited_idx'),
+        ]
 
     def __str__(self):
         cat = str(self.group) if self.is_in_assessment_group() else str(self.category)
@@ -257,6 +446,9 @@ class AssessmentRecord(AbstractAssessmentRecord):
     def get_delete_url(self):
         return reverse('assessment.assess:delete', args=(self.pk, ))
 
+    def get_docs_url(self):
+        return reverse('assessment.assess:docs', args=(self.pk, ))
+
     def get_subject(self):
         """ Return the subject for this assessment record """
         subject_field = appConfig.get_assessment_subject_related_name()
@@ -278,21 +470,45 @@ class AssessmentRecord(AbstractAssessmentRecord):
             return False
 
     def _create_score_set(self):
-        """ Creates a complete set of related metric scores for this EMPTY assessment """
-        assert self.score_set.count() == 0  # ONLY allowed on new records with no assessments
-        scores = [
-            MetricScore(assessment=self, metric=metric) for question in self.category.question_set.all()
-            for metric in question.metric_set.all()
-        ]
-        MetricScore.objects.bulk_create(scores)
+        """ Creates a complete set of related metric scores for this EMPTY assessment - ONLY for new records """
+        blueprint = blueprints.get_blueprint(self.category_id)
+        scores = [MetricScore(assessment=self, metric_id=metric_id) for metric_id in blueprint.metric_ids]
+        MetricScore.objects.bulk_create(scores)  # Note: also updates stored score summary in DB
+        applicable = [score.score for score in scores if score.applicable]
+        self.score_sum, self.score_count = sum(applicable), len(applicable)
+        self.avg_score = self.score_sum / self.score_count if self.score_count else None
 
     def save(self, *args, **kwargs):
         """ On create, configure a set of 'empty' MetricScores for this Assessment """
         adding = not self.pk
+        if adding:  # e.g., a copied record starts with no scores, see AssessmentGroup.create_assessment_set_from_template
+            self.score_sum, self.score_count, self.avg_score = 0, 0, None
+        elif not self._state.adding and kwargs.get('update_fields') is None:
+            # score summary is maintained by MetricScore - don't clobber it with potentially stale in-memory values
+            # Note: deferred fields are left out too, as Django would, so saving them doesn't load them first
+            deferred = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.SCORE_SUMMARY_FIELDS
+                   and field.attname not in deferred
+            ]
         super().save(*args, **kwargs)
         if adding:
             self._create_score_set()
 
+    def adjust_score_summary(self, score_delta, count_delta):
+        """ Apply an incremental change to the stored score summary, in the DB and on this instance """
+        AssessmentRecord.objects.filter(pk=self.pk).adjust_score_summary(score_delta, count_delta)
+        self.score_sum += score_delta
+        self.score_count += count_delta
+        self.avg_score = self.score_sum / self.score_count if self.score_count else None
+
+    def refresh_score_summary(self):
+        """ Recalculate the stored score summary from scratch, and reload it onto this instance """
+        records = AssessmentRecord.objects.filter(pk=self.pk)
+        records.update_score_summaries()
+        self.score_sum, self.score_count, self.avg_score = records.values_list(*self.SCORE_SUMMARY_FIELDS).get()
+
     @property
     def metric_set(self):
         """ Return queryset for complete set of metrics for this Assessment"""
@@ -304,8 +520,15 @@ class AssessmentRecord(AbstractAssessmentRecord):
         return MetricScore.applies.filter(assessment=self)
 
     def scores_by_question(self):
+        if 'score_set' in getattr(self, '_prefetched_objects_cache', {}):
+            return self.score_set.all()  # already in question order, see AssessmentRecordQueryset.with_score_set()
         return self.score_set.all().order_by('metric__question')
 
+    @property
+    def is_scored(self):
+        """ Return True iff this record has any applicable metric scores - a record scored all N/A is not scored """
+        return self.score_count > 0
+
     def is_in_assessment_group(self):
         """ Return True iff this assessment is part of a larger group """
         return self.group is not None
@@ -329,6 +552,10 @@ class AbstractAssessmentSubject(models.Model):
     record = models.OneToOneField(AssessmentRecord, blank=True, on_delete=models.CASCADE,
                                   related_name='%(app_label)s_%(class)s')
 
+    # Fields loaded when subjects are listed in tables - None loads every concrete field.
+    # Concrete implementations may narrow this, but must include 'record' and any fields used by __str__
+    summary_fields = None
+
     class Meta:
         abstract = True
         verbose_name = 'Assessment Subject'
@@ -375,6 +602,8 @@ class AssessmentSubject(AbstractAssessmentSubject):
     description = models.TextField(blank=True,
                                    help_text='Optional longer description of the assessment subject.')
 
+    summary_fields = ('record', 'label', )
+
     def __str__(self):
         return self.label
 
@@ -392,9 +621,39 @@ class AssessmentSubject(AbstractAssessmentSubject):
         return forms.modelform_factory(cls, **kwargs)
 
 
+class ScoreQueryset(models.QuerySet):
+    """ Bulk operations that bypass MetricScore.save() must also keep the AssessmentRecord score summaries in sync """
+    SUMMARY_FIELDS = {'assessment', 'assessment_id', 'applicable', 'score'}
+
+    def _assessment_ids(self):
+        return set(self.order_by().values_list('assessment_id', flat=True).distinct())
+
+    @staticmethod
+    def _update_score_summaries(assessment_ids):
+        if assessment_ids:
+            AssessmentRecord.objects.filter(pk__in=assessment_ids).update_score_summaries()
+
+    def update(self, **kwargs):
+        """ Also covers bulk_update(), which django runs as one update() per batch """
+        if not self.SUMMARY_FIELDS.intersection(kwargs):
+            return super().update(**kwargs)
+        assessment_ids = self._assessment_ids()
+        rows = super().update(**kwargs)
+        if {'assessment', 'assessment_id'}.intersection(kwargs):  # scores moved to other records
+            assessment_ids |= self._assessment_ids()
+        self._update_score_summaries(assessment_ids)
+        return rows
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = super().bulk_create(objs, *args, **kwargs)
+        self._update_score_summaries({obj.assessment_id for obj in objs})
+        return objs
+
+
 class ScoreManager(models.Manager):
     def get_queryset(self):
-        related = ('metric', 'metric__question', 'assessment', 'assessment__category', )
+        # Note: assessment is not selected so scores from record.score_set share the record instance
+        related = ('metric', 'metric__question', )
         return super().get_queryset().select_related(*related)
 
 
@@ -413,15 +672,56 @@ class MetricScore(models.Model):
     score = models.PositiveSmallIntegerField(choices=choices.SCORE_CHOICES, default=choices.SCORE_CHOICES[0][0])
     comments = models.TextField(blank=True)
 
-    objects = ScoreManager()
-    applies = ApplicableScoreManager()
+    objects = ScoreManager.from_queryset(ScoreQueryset)()
+    applies = ApplicableScoreManager.from_queryset(ScoreQueryset)()
 
     class Meta:
         ordering = ('assessment', 'metric__question', )
+        indexes = [  # score summaries aggregate the applicable scores for each assessment
+            models.Index(fields=['assessment', 'score'], condition=models.Q(applicable=True),
+                         name='assess_score_applicable_idx'),
+        ]
 
     def __str__(self):
         return '{metric}: {score}'.format(metric=self.metric, score=self.get_score())
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """ Remember the loaded state so save() can apply an incremental change to the assessment's score summary """
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_summary = instance.summary_state
+        return instance
+
+    @property
+    def summary_state(self):
+        """ (assessment_id, score, count) this score contributes to its AssessmentRecord's score summary """
+        if 'applicable' in self.get_deferred_fields() or 'score' in self.get_deferred_fields():
+            return None
+        return (self.assessment_id, self.score, 1) if self.applicable else (self.assessment_id, 0, 0)
+
+    def _adjust_assessment_summary(self, assessment_id, score_delta, count_delta):
+        if not (score_delta or count_delta) or assessment_id is None:
+            return
+        if self.assessment_id == assessment_id and MetricScore.assessment.is_cached(self):
+            self.assessment.adjust_score_summary(score_delta, count_delta)  # keep in-memory record in sync
+        else:
+            AssessmentRecord.objects.filter(pk=assessment_id).adjust_score_summary(score_delta, count_delta)
+
+    def save(self, *args, **kwargs):
+        """ Save score and incrementally update its assessment's stored score summary """
+        loaded = (None, 0, 0) if self._state.adding else getattr(self, '_loaded_summary', None)
+        super().save(*args, **kwargs)
+        current = self.summary_state
+        if loaded is None or current is None:
+            if self.assessment_id:
+                self.assessment.refresh_score_summary()
+        elif loaded[0] != current[0]:
+            self._adjust_assessment_summary(loaded[0], -loaded[1], -loaded[2])
+            self._adjust_assessment_summary(*current)
+        else:
+            self._adjust_assessment_summary(current[0], current[1] - loaded[1], current[2] - loaded[2])
+        self._loaded_summary = self.summary_state
+
     def get_score(self):
         return self.score if self.applicable else "N/A"
 
@@ -447,10 +747,29 @@ class MetricScore(models.Model):
             )
 
 
+def get_upload_metrics(metric_ids):
+    """
+        Return {pk: metric} for the given metric ids, each with its question and category, for upload paths.
+        Active metrics come from the taxonomy snapshot;  retired metrics are loaded in a single query.
+    """
+    snapshot = taxonomy.get_snapshot()
+    metrics = {pk: snapshot.get_metric(pk) for pk in set(metric_ids)}
+    missing = [pk for pk, metric in metrics.items() if metric is None]
+    if missing:
+        metrics.update(
+            (metric.pk, metric) for metric in
+            AssessmentMetric._base_manager.select_related('question__category').filter(pk__in=missing)
+        )
+    return metrics
+
+
 def supporting_doc_directory_path(instance, filename):
     """ Return directory path under MEDIA_ROOT (or PRIVATE_STORAGE_ROOT) where SupportingDoc file attachments live """
     # .../support_docs/<assessment slug>/<metric slug>/year/<filename>
-    metric = instance.score.metric
+    metric = getattr(instance, '_upload_metric', None)  # preloaded by SupportingDocQueryset.bulk_create
+    if metric is None:
+        metric_id = instance.score.metric_id
+        metric = get_upload_metrics((metric_id, ))[metric_id]
     path = {
         'assessment': metric.question.category.slug,
         'metric':     metric.slug,
@@ -460,6 +779,161 @@ def supporting_doc_directory_path(instance, filename):
     return 'support_docs/{assessment}/{metric}/{year}/{filename}'.format(**path)
 
 
+def get_content_digest(content):
+    """ Return the SHA-256 hex digest of a File's content, hashed one chunk at a time """
+    digest = hashlib.sha256()
+    for chunk in content.chunks():
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+class DocumentBlobQueryset(models.QuerySet):
+    """ Content-addressed storage for SupportingDoc attachments, with reference counts (DEDUPLICATE_FILES setting) """
+    @staticmethod
+    def _file_field():
+        return SupportingDoc._meta.get_field('file')
+
+    BLOB_DIRECTORY = 'support_docs'
+    DIGEST_RE = re.compile(r'^[0-9a-f]{64}$')
+
+    @contextlib.contextmanager
+    def delete_on_error(self):
+        """
+            Yield a list for store() to record the files it writes - the files are deleted if the block raises.
+            Files from a block that succeeds, in a transaction that later rolls back, are left for sweep_orphans().
+        """
+        stored = []
+        try:
+            yield stored
+        except BaseException:
+            storage = self._file_field().storage
+            for name in stored:
+                storage.delete(name)
+            raise
+
+    def sweep_orphans(self, before):
+        """ Delete blob files modified before the given (aware) datetime that no blob refers to.  Return their names. """
+        storage = self._file_field().storage
+        if not storage.exists(self.BLOB_DIRECTORY):
+            return []
+        names = []
+        for digest in storage.listdir(self.BLOB_DIRECTORY)[0]:
+            if self.DIGEST_RE.match(digest):
+                directory = '{base}/{digest}'.format(base=self.BLOB_DIRECTORY, digest=digest)
+                names.extend('{dir}/{file}'.format(dir=directory, file=file) for file in storage.listdir(directory)[1])
+        referenced = set(self.filter(name__in=names).values_list('name', flat=True))
+        orphans = [name for name in names if name not in referenced and storage.get_modified_time(name) < before]
+        for name in orphans:
+            storage.delete(name)
+        return orphans
+
+    def store(self, content, stored=None):
+        """
+            Return the storage name for content - stored only if no blob with the same content exists already.
+            The name of a newly stored file is appended to the stored list, if given (see delete_on_error).
+        """
+        digest = get_content_digest(content)
+        blob = self.select_for_update().filter(digest=digest).first()
+        if blob is not None:
+            return blob.name
+        field = self._file_field()
+        path = field.storage.generate_filename(
+            '{base}/{digest}/{filename}'.format(base=self.BLOB_DIRECTORY, digest=digest,
+                                                filename=os.path.basename(content.name))
+        )
+        name = field.storage.save(path, content, max_length=field.max_length)
+        try:
+            with transaction.atomic(using=self.db):
+                blob = self.create(digest=digest, name=name, size=content.size)
+        except IntegrityError:  # same content stored concurrently - share that blob
+            field.storage.delete(name)
+            blob = self.select_for_update().get(digest=digest)
+        else:
+            if stored is not None:
+                stored.append(name)
+        return blob.name
+
+    def _adjust_ref_counts(self, names, sign):
+        for name, count in Counter(name for name in names if name).items():
+            self.filter(name=name).update(ref_count=models.F('ref_count') + sign * count)
+
+    def acquire(self, *names):
+        """ Count a new reference to each named blob (names of files not stored as blobs are ignored) """
+        self._adjust_ref_counts(names, 1)
+
+    def release(self, *names):
+        """ Remove a reference to each named blob, deleting blobs (and their files, once committed) with no references """
+        self._adjust_ref_counts(names, -1)
+        unreferenced = list(self.filter(name__in=set(names), ref_count__lte=0).values_list('pk', 'name'))
+        if unreferenced:
+            self.filter(pk__in=[pk for pk, name in unreferenced]).delete()
+            storage = self._file_field().storage
+            for pk, name in unreferenced:
+                transaction.on_commit(functools.partial(storage.delete, name), using=self.db)
+
+
+class DocumentBlob(models.Model):
+    """
+        A SupportingDoc attachment stored once, under its content digest, and shared by every doc with the same content
+    """
+    digest = models.CharField(max_length=64, unique=True, help_text='SHA-256 digest of the file content')
+    name = models.CharField(max_length=255, unique=True, help_text='Storage name of the file')
+    size = models.BigIntegerField()
+    ref_count = models.PositiveIntegerField(default=0, help_text='Number of SupportingDocs with this file')
+
+    objects = DocumentBlobQueryset.as_manager()
+
+    def __str__(self):
+        return self.name
+
+
+class SupportingDocQueryset(models.QuerySet):
+    def bulk_create(self, objs, *args, **kwargs):
+        """
+            Resolve upload paths for all new attachments from preloaded metrics.
+            With DEDUPLICATE_FILES, store new attachments as content-addressed blobs - deletes are handled by signal.
+        """
+        objs = list(objs)
+        uploads = [obj for obj in objs if obj.file and not obj.file._committed]
+        metrics = get_upload_metrics(obj.score.metric_id for obj in uploads) if uploads else {}
+        for obj in uploads:
+            obj._upload_metric = metrics[obj.score.metric_id]
+        if not appConfig.settings.DEDUPLICATE_FILES:
+            return super().bulk_create(objs, *args, **kwargs)
+        blobs = DocumentBlob.objects.using(self.db)
+        with blobs.delete_on_error() as stored, transaction.atomic(using=self.db, savepoint=False):
+            for obj in objs:
+                obj.store_file(stored)
+            objs = super().bulk_create(objs, *args, **kwargs)
+            blobs.acquire(*(obj.file.name for obj in objs))
+        for obj in objs:
+            obj._loaded_file_name = obj.file.name
+        return objs
+
+    def bulk_attach(self, file, scores, **fields):
+        """
+            Attach one uploaded file to each of the given MetricScores in a single operation:  the file is stored once,
+                and all the new SupportingDocs, created with the given field values, share it.  Return the new docs.
+            Without DEDUPLICATE_FILES, the file is stored in the upload directory of the first score.
+        """
+        fields.setdefault('document_location', choices.DOCUMENT_LOCATION_ATTACHED)
+        docs = [SupportingDoc(score=score, **fields) for score in scores]
+        if not docs:
+            return docs
+        first = docs[0]
+        first.file = file
+        with DocumentBlob.objects.using(self.db).delete_on_error() as stored, \
+                transaction.atomic(using=self.db, savepoint=False):
+            if appConfig.settings.DEDUPLICATE_FILES:
+                first.store_file(stored)
+            else:
+                first.file.save(os.path.basename(file.name), file, save=False)
+                stored.append(first.file.name)
+            for doc in docs:
+                doc.file = first.file.name
+            return self.bulk_create(docs)
+
+
 class SupportingDoc(models.Model):
     """
         Documentation attached to a particular metric score - paper trail for how the score was derived
@@ -473,14 +947,54 @@ class SupportingDoc(models.Model):
     url = models.URLField(blank=True)
     if appConfig.settings.USE_PRIVATE_FILES:
         from private_storage.fields import PrivateFileField
-        file = PrivateFileField(null=True, blank=True, upload_to=supporting_doc_directory_path)
+        file = PrivateFileField(null=True, blank=True, max_length=255, upload_to=supporting_doc_directory_path)
     else:
-        file = models.FileField(null=True, blank=True, upload_to=supporting_doc_directory_path)
+        file = models.FileField(null=True, blank=True, max_length=255, upload_to=supporting_doc_directory_path)
+
+    objects = SupportingDocQueryset.as_manager()
 
     def __str__(self):
         doc = self.url if self.url else os.path.basename(self.file.path) if self.file else self.description
         return '{doc}'.format(doc=doc)
 
+    def get_file_url(self):
+        """ Private files are downloaded through the file view, which checks permissions - public files from MEDIA_URL """
+        if appConfig.settings.USE_PRIVATE_FILES:
+            return reverse('assessment.assess:doc-file', args=(self.pk, ))
+        return self.file.url
+
     @property
     def href(self):
-        return self.file.url if self.file else self.url if self.url else None
+        return self.get_file_url() if self.file else self.url if self.url else None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """ Remember the loaded file name so save() can maintain the DocumentBlob reference counts """
+        instance = super().from_db(db, field_names, values)
+        if 'file' in instance.__dict__:
+            instance._loaded_file_name = str(instance.__dict__['file'] or '')
+        return instance
+
+    def _get_loaded_file_name(self):
+        if hasattr(self, '_loaded_file_name'):
+            return self._loaded_file_name
+        return SupportingDoc.objects.filter(pk=self.pk).values_list('file', flat=True).first()
+
+    def store_file(self, stored=None):
+        """ Replace a new, uncommitted attachment with its content-addressed DocumentBlob file """
+        if self.file and not self.file._committed:
+            self.file = DocumentBlob.objects.using(self._state.db).store(self.file.file, stored)
+
+    def save(self, *args, **kwargs):
+        """ With DEDUPLICATE_FILES, store a new attachment as a content-addressed blob and keep its reference count """
+        if not appConfig.settings.DEDUPLICATE_FILES:
+            return super().save(*args, **kwargs)
+        blobs = DocumentBlob.objects.using(kwargs.get('using'))
+        with blobs.delete_on_error() as stored, transaction.atomic(using=kwargs.get('using')):
+            loaded = None if self._state.adding else self._get_loaded_file_name()
+            self.store_file(stored)
+            super().save(*args, **kwargs)
+            if (self.file.name or '') != (loaded or ''):
+                DocumentBlob.objects.using(self._state.db).acquire(self.file.name)
+                DocumentBlob.objects.using(self._state.db).release(loaded)
+        self._loaded_file_name = self.file.name
@@ -27,20 +27,58 @@ def permission_required(permission_fn):
     return decorator
 
 
-def get_permissions_context_from_request(request, **kwargs):
+class MemoizedPermission:
     """
-        Return a dictionary of permissions functions (partials that can be called with no arguments)
-        request.user and kwargs are bound to each function in the context.
+        A permissions function bound to a user and kwargs, callable with no arguments (e.g., from a template).
+        The function is evaluated at most once - see get_permissions_context_from_request
     """
+    def __init__(self, permission_fn, user, **kwargs):
+        self.permission = partial(permission_fn, user, **kwargs)
+
+    def __call__(self):
+        try:
+            return self.result
+        except AttributeError:
+            self.result = self.permission()
+            return self.result
+
+
+def is_permission(name):
+    """ Return True iff name is a permissions function in the plugin permissions module """
+    return callable(getattr(permissions, name, None))
+
+
+def _get_permissions_context(user, **kwargs):
     context = {}
     for name in dir(permissions):
         fn = getattr(permissions, name)
-        if callable(fn):
-            context[name] = partial(fn, request.user, **kwargs)
+        if is_permission(name):
+            bind = MemoizedPermission if getattr(fn, 'memoize', True) else partial
+            context[name] = bind(fn, user, **kwargs)
     return context
 
 
+def get_permissions_context_from_request(request, **kwargs):
+    """
+        Return a dictionary of permissions functions (callables that can be called with no arguments)
+        request.user and kwargs are bound to each function in the context.
+        The context is built once per request for each (user, kwargs), and each permission is evaluated at most once,
+            unless the permissions function opts out with a memoize = False attribute.
+    """
+    try:
+        key = (request.user, tuple(sorted(kwargs.items())))
+        hash(key)
+    except TypeError:  # unhashable kwargs - can't memoize
+        return _get_permissions_context(request.user, **kwargs)
+    contexts = getattr(request, '_assessment_permissions_contexts', None)
+    if contexts is None:
+        contexts = {}
+        setattr(request, '_assessment_permissions_contexts', contexts)
+    if key not in contexts:
+        contexts[key] = _get_permissions_context(request.user, **kwargs)
+    return contexts[key]
+
+
 def get_permissions_context(view):
     """ Shortcut to return permissions context for a view using view.kwargs """
     return get_permissions_context_from_request(view.request, **view.kwargs)
-
@@ -0,0 +1,157 @@
+"""
+    Pluggable serving backends for SupportingDoc file downloads - see the ASSESSMENT_FILE_SERVER setting.
+    The download view checks the user's permissions, then hands the file to the configured server:
+        django - stream the file from the Django worker, with support for single range requests (default, e.g. tests)
+        apache - X-Sendfile header:  Apache (mod_xsendfile) sends the file from its storage path
+        nginx  - X-Accel-Redirect header:  nginx sends the file from an internal location aliased to the storage root
+    or a dotted path to a class with a serve(request, file) method.
+    Front-end servers handle range and conditional requests for offloaded files themselves.
+"""
+import mimetypes, os, re
+from functools import lru_cache
+from urllib.parse import quote
+from django import http
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.http import http_date
+from django.utils.module_loading import import_string
+from assessment.assess import models
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+QUOTABLE_RE = re.compile(r'^[\t \x21-\x7e]*$')
+
+
+def content_disposition(filename):
+    """ Return an inline Content-Disposition header value for filename, RFC 6266 encoded if it is not plain ASCII """
+    if QUOTABLE_RE.match(filename):
+        return 'inline; filename="{filename}"'.format(filename=filename.replace('\\', '\\\\').replace('"', '\\"'))
+    return "inline; filename*=utf-8''{filename}".format(filename=quote(filename))
+
+
+def can_access(request, doc):
+    """ Return True iff the request may download doc's file - private files apply PRIVATE_STORAGE_AUTH_FUNCTION """
+    if not models.appConfig.settings.USE_PRIVATE_FILES:
+        return True
+    from private_storage import appconfig
+    from private_storage.models import PrivateFile
+    can_access_file = import_string(appconfig.PRIVATE_STORAGE_AUTH_FUNCTION)
+    return can_access_file(PrivateFile(request, doc.file.storage, doc.file.name, parent_object=doc))
+
+
+def parse_range(header, size):
+    """
+        Return the (start, end) inclusive byte range requested by a single-range Range header, or None to send the
+            whole file (no header, an invalid range, e.g., bytes=5-2, or a form not supported here, e.g., multiple ranges).
+        Raise ValueError if the range can't be satisfied for a file of the given size.
+    """
+    match = RANGE_RE.match(header.strip()) if header else None
+    if match is None or match.groups() == ('', ''):
+        return None
+    start, end = match.groups()
+    if start and end and int(end) < int(start):  # invalid - ignore the header (RFC 9110, 14.1.1)
+        return None
+    if not start:  # suffix range: the last end bytes
+        start, end = max(0, size - int(end)), size - 1
+    else:
+        start, end = int(start), min(int(end), size - 1) if end else size - 1
+    if start > end or start >= size:
+        raise ValueError('Range not satisfiable')
+    return start, end
+
+
+class BaseFileServer:
+    """ Common headers for serving a FieldFile """
+    def get_content_type(self, file):
+        content_type, encoding = mimetypes.guess_type(file.name)
+        return content_type or 'application/octet-stream'
+
+    def init_response(self, response, file):
+        response['Content-Type'] = self.get_content_type(file)
+        response['Content-Disposition'] = content_disposition(os.path.basename(file.name))
+        return response
+
+    def serve(self, request, file):
+        raise NotImplementedError
+
+
+class DjangoServer(BaseFileServer):
+    """ Stream the file through Django, from any storage, with support for single range requests """
+    chunk_size = 64 * 1024
+
+    def iter_range(self, file, start, length):
+        with file.storage.open(file.name, 'rb') as f:
+            f.seek(start)
+            while length > 0:
+                chunk = f.read(min(self.chunk_size, length))
+                if not chunk:
+                    break
+                length -= len(chunk)
+                yield chunk
+
+    def serve(self, request, file):
+        size = file.storage.size(file.name)
+        try:
+            byte_range = parse_range(request.META.get('HTTP_RANGE'), size)
+        except ValueError:
+            response = http.HttpResponse(status=416)
+            response['Content-Range'] = 'bytes */{size}'.format(size=size)
+            return response
+        if byte_range is None:
+            response = http.FileResponse(file.storage.open(file.name, 'rb'))
+            response['Content-Length'] = size
+        else:
+            start, end = byte_range
+            response = http.StreamingHttpResponse(self.iter_range(file, start, end - start + 1), status=206)
+            response['Content-Range'] = 'bytes {start}-{end}/{size}'.format(start=start, end=end, size=size)
+            response['Content-Length'] = end - start + 1
+        response['Accept-Ranges'] = 'bytes'
+        try:
+            response['Last-Modified'] = http_date(file.storage.get_modified_time(file.name).timestamp())
+        except NotImplementedError:
+            pass
+        return self.init_response(response, file)
+
+
+class XSendfileServer(BaseFileServer):
+    """ Hand the transfer off to Apache (mod_xsendfile) with an X-Sendfile header - requires a local file path """
+    def serve(self, request, file):
+        response = http.HttpResponse()
+        response['X-Sendfile'] = file.path
+        return self.init_response(response, file)
+
+
+class XAccelRedirectServer(BaseFileServer):
+    """
+        Hand the transfer off to nginx with an X-Accel-Redirect header, e.g., for a private storage root:
+            location /private-x-accel-redirect/ {
+                internal;
+                alias /path/to/private-media/;
+            }
+    """
+    def serve(self, request, file):
+        response = http.HttpResponse()
+        internal_url = models.appConfig.settings.X_ACCEL_REDIRECT_URL
+        response['X-Accel-Redirect'] = quote(internal_url.rstrip('/') + '/' + file.name)
+        return self.init_response(response, file)
+
+
+SERVERS = {
+    'django': DjangoServer,
+    'apache': XSendfileServer,
+    'nginx': XAccelRedirectServer,
+}
+
+
+@lru_cache(maxsize=None)
+def get_server_class(name):
+    if name in SERVERS:
+        return SERVERS[name]
+    if '.' in name:
+        return import_string(name)
+    raise ImproperlyConfigured('ASSESSMENT_FILE_SERVER must be one of {servers}, or a dotted path to a class'.format(
+        servers=', '.join(SERVERS)
+    ))
+
+
+def get_file_server():
+    """ Return an instance of the configured file server """
+    return get_server_class(models.appConfig.settings.FILE_SERVER)()
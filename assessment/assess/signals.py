@@ -0,0 +1,38 @@
+""" Signal receivers that keep denormalized assessment data in sync with the records it summarizes """
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+from assessment.assess import models
+
+
+def _deleted_with_assessment(origin):
+    """ Return True iff the delete originated from AssessmentRecord(s) or AssessmentGroup(s) - no summary to update """
+    origin_model = getattr(origin, 'model', type(origin))
+    return origin_model in (models.AssessmentRecord, models.AssessmentGroup)
+
+
+@receiver(post_delete, sender=models.MetricScore)
+def remove_score_from_summary(sender, instance, origin=None, **kwargs):
+    """ A deleted MetricScore no longer contributes to its assessment's score summary """
+    if _deleted_with_assessment(origin):
+        return
+    state = instance.summary_state
+    if state is None:  # deferred score fields - recalculate from scratch
+        models.AssessmentRecord.objects.filter(pk=instance.assessment_id).update_score_summaries()
+    else:
+        assessment_id, score, count = state
+        instance._adjust_assessment_summary(assessment_id, -score, -count)
+
+
+@receiver(post_delete, sender=models.AssessmentRecord)
+def replace_group_subject_record(sender, instance, using, origin=None, **kwargs):
+    """ A group whose subject record was deleted (and set null) refers to another of its records for its subject """
+    if instance.group_id is None or getattr(origin, 'model', type(origin)) is models.AssessmentGroup:
+        return
+    models.AssessmentGroup.objects.using(using).filter(pk=instance.group_id).update_subject_records()
+
+
+@receiver(post_delete, sender=models.SupportingDoc)
+def release_document_blob(sender, instance, using, **kwargs):
+    """ A deleted SupportingDoc no longer references its content-addressed file """
+    if models.appConfig.settings.DEDUPLICATE_FILES and instance.file:
+        models.DocumentBlob.objects.using(using).release(instance.file.name)
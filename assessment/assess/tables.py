@@ -1,43 +1,114 @@
+import csv, os
+from collections import namedtuple
+from collections.abc import Sequence
+from django import http
 from django.apps import apps
+from django.core import signing
+from django.core.exceptions import FieldError, ValidationError
+from django.db.models import F, Q, Value, CharField
+from django.db.models.functions import Concat
 from django.template.loader import get_template
+from django.template.defaultfilters import floatformat
+from django.utils.safestring import mark_safe
 import django_tables2 as tables
+from django_tables2.export import TableExport
 from django_tables2.export.views import ExportMixin
+from django_tables2.paginators import LazyPaginator
+from django_tables2.rows import BoundRows
 from django_filters.views import FilterView
 from assessment.assess import models
-from .permissions import get_permissions_context_from_request
+from .permissions import get_permissions_context_from_request, is_permission
 
 appConfig = apps.get_app_config('assess')
 
 
 class TemplateRenderedColumn(tables.Column):
+    """
+        Column with cells rendered from a template fragment.
+        Sub-classes may define get_fragment_key():  cells with equal keys share a single template render.
+    """
     TEMPLATE = None
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fragments = {}  # {fragment key: rendered fragment}
+
     def get_template(self):
         return self.TEMPLATE
 
-    def render(self, record, **kwargs):
+    def get_fragment_key(self, record, **kwargs):
+        """ Return a hashable key that fully determines the rendered cell, or None to always render the template """
+        return None
+
+    def render_template(self, record, **kwargs):
         kwargs['record'] = record
         return self.get_template().render(context=kwargs)
 
+    def render(self, record, **kwargs):
+        key = self.get_fragment_key(record, **kwargs)
+        if key is None:
+            return self.render_template(record, **kwargs)
+        if key not in self.fragments:
+            self.fragments[key] = self.render_template(record, **kwargs)
+        return self.fragments[key]
+
 
 class RecordStatusColumn(TemplateRenderedColumn):
     TEMPLATE = get_template('assessment/include/assessment_record_status_label.html')
 
+    def get_fragment_key(self, record, **kwargs):
+        return record.status
+
 
 class RecordScoreColumn(TemplateRenderedColumn):
     TEMPLATE = get_template('assessment/include/assessment_record_score_badge.html')
 
     def __init__(self, *args, **kwargs):
-        kwargs.setdefault('order_by', 'avg_score')  # annotation added by objects model manager
+        kwargs.setdefault('order_by', 'avg_score')  # stored on AssessmentRecord, annotated on AssessmentGroup
         super().__init__(*args, **kwargs)
 
+    def get_fragment_key(self, record, **kwargs):
+        if not record.is_scored:
+            return None,
+        return record.score_class, floatformat(record.assessment_score(), -2)
+
 
 class RecordActionsColumn(TemplateRenderedColumn):
+    """
+        With share_fragments, the fragment is rendered once for each type of record and set of permissions, using a
+            stand-in record with a placeholder pk;  each cell then substitutes its record's pk (e.g., into its URLs).
+        Fragments are shared by default only if the template is the app's own, which depends on just type and pk -
+            a project template overriding it is rendered for each record, unless it opts in with share_fragments=True.
+    """
     TEMPLATE = get_template('assessment/include/assessment_record_tools.html')
+    PLACEHOLDER_PK = 2147483629  # not a pk likely to exist, or to appear anywhere else in the fragment
 
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, share_fragments=None, **kwargs):
         kwargs['orderable'] = False
         super().__init__(*args, **kwargs)
+        self.share_fragments = self.is_app_template() if share_fragments is None else share_fragments
+
+    def is_app_template(self):
+        """ Return True iff the fragment template is loaded from this app's templates, not overridden by a project """
+        template_dir = os.path.join(appConfig.path, 'templates', '')
+        return os.path.abspath(self.get_template().origin.name).startswith(template_dir)
+
+    def get_fragment_key(self, record, **kwargs):
+        if not self.share_fragments:
+            return None
+        permissions = tuple((name, bool(kwargs[name]())) for name in sorted(kwargs) if is_permission(name))
+        return type(record), permissions
+
+    def render_template(self, record, **kwargs):
+        if not self.share_fragments:
+            return super().render_template(record, **kwargs)
+        return super().render_template(type(record)(pk=self.PLACEHOLDER_PK), **kwargs)
+
+    def render(self, record, **kwargs):
+        fragment = super().render(record, **kwargs)
+        if not self.share_fragments:
+            return fragment
+        return mark_safe(fragment.replace(str(self.PLACEHOLDER_PK), str(record.pk)))
 
 
 class SubjectColumn(tables.Column):
@@ -53,6 +124,9 @@ class SubjectColumn(tables.Column):
         super().__init__(*args, **kwargs)
 
 
+ExportColumn = namedtuple('ExportColumn', ('header', 'value', 'format'))
+
+
 class BaseAssessmentTable(tables.Table):
     status = RecordStatusColumn(accessor='status')
     subject = SubjectColumn(accessor='subject', linkify=True)
@@ -70,7 +144,7 @@ class BaseAssessmentTable(tables.Table):
             'assessor',
             'actions',
         ]
-        template_name = 'django_tables2/bootstrap.html'
+        template_name = 'assessment/include/assessment_table.html'
 
     def render_created(self, value):
         return '{:%d-%m-%Y}'.format(value)
@@ -84,8 +158,39 @@ class BaseAssessmentTable(tables.Table):
         except AttributeError:
             return value
 
+    @staticmethod
+    def display_format(model, field_name):
+        """ Return a format function that displays the choice label for a value of the given choices field """
+        labels = {value: str(label) for value, label in model._meta.get_field(field_name).flatchoices}
+        return lambda value: labels.get(value, value)
+
+    def get_export_values(self):
+        """ Return dict of {column name: (queryset value, format)}:  value is a field name or expression for values() """
+        model = self._meta.model
+        subject_fields = [order_by.bare for order_by in self.columns['subject'].column.order_by]
+        subject = subject_fields[0] if len(subject_fields) == 1 else \
+            Concat(*[part for field in subject_fields for part in (Value(' '), field)][1:], output_field=CharField())
+        assessor = Concat('assessor__first_name', Value(' '), 'assessor__last_name', output_field=CharField())
+        return {
+            'status': ('status', self.display_format(model, 'status')),
+            'assessment_type': ('assessment_type', self.display_format(model, 'assessment_type')),
+            'subject': (subject, str),
+            'score': ('avg_score', lambda score: round(score, 2)),
+            'created': ('created', self.render_created),
+            'assessor': (assessor, str.strip),
+        }
+
+    def get_export_columns(self, exclude_columns=()):
+        """ Return list of ExportColumn, in table order, for columns that can be exported straight from the data """
+        values = self.get_export_values()
+        return [
+            ExportColumn(str(column.header), *values[column.name]) for column in self.columns
+            if column.name in values and column.name not in exclude_columns
+        ]
+
     def render_actions(self, record, column):
         # Bit of hackery going on here to pass permissions context to Actions column render function.
+        # Context is built once and memoized on the request, so this is cheap for every row after the first.
         return column.render(record, **get_permissions_context_from_request(self.request))
 
 
@@ -96,13 +201,158 @@ class CategoryAssessmentsTable(BaseAssessmentTable):
 
 
 class AssessmentSetTable(BaseAssessmentTable):
-    subject_field = 'assessment_set__first__{subject}'.format(subject=appConfig.get_assessment_subject_related_name())
+    subject_field = 'subject_record__{subject}'.format(subject=appConfig.get_assessment_subject_related_name())
     subject = SubjectColumn(accessor='subject', linkify=True, subject_field=subject_field)
 
     class Meta(BaseAssessmentTable.Meta):
         model = models.AssessmentGroup
 
 
+# -----------  Pagination -------------- #
+
+
+class KeysetPage(Sequence):
+    """ A page of rows from a KeysetPaginator, with cursors for the pages either side of it (None for no page) """
+    def __init__(self, object_list, paginator, previous_cursor=None, next_cursor=None):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.previous_cursor = previous_cursor
+        self.next_cursor = next_cursor
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return list(self.object_list)[index]
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_previous() or self.has_next()
+
+
+class KeysetPaginator:
+    """
+        Keyset (seek) pagination for a table of model records:  instead of an OFFSET, each page is selected by
+            filtering for rows beyond the sort key of the last row on the previous page, so every page costs the same.
+        Rows are keyed on the table's active ordering plus pk (nulls sort last);  there is no page count or total.
+        Pages are identified by a signed cursor in the cursor_field query parameter, not by page number.
+        Drop-in paginator_class for Table.paginate():  the page number it is passed is ignored.
+    """
+    is_keyset = True
+    cursor_salt = 'assessment.assess.tables.KeysetPaginator'
+
+    def __init__(self, rows, per_page, cursor=None, cursor_field='cursor', **kwargs):
+        self.rows = rows
+        self.per_page = int(per_page)
+        self.cursor = cursor
+        self.cursor_field = cursor_field
+
+    @staticmethod
+    def get_ordering(queryset):
+        """ Return list of (field, descending) the queryset is ordered by, up to and including the pk """
+        ordering = []
+        for field in queryset.query.order_by or queryset.query.get_meta().ordering:
+            if not isinstance(field, str) or field == '?':
+                continue  # expressions and random ordering can't be used as a key
+            descending, field = field.startswith('-'), field.lstrip('-')
+            ordering.append((field, descending))
+            if field in ('pk', queryset.model._meta.pk.name):
+                return ordering
+        return ordering + [('pk', False)]
+
+    @staticmethod
+    def seek(keys, values, forward):
+        """ Return Q selecting rows beyond (forward) or before the row with the given key values, nulls last """
+        beyond, equal = Q(pk__in=[]), Q()
+        for (key, descending), value in zip(keys, values):
+            later = '{key}__{op}'.format(key=key, op='lt' if descending else 'gt')
+            earlier = '{key}__{op}'.format(key=key, op='gt' if descending else 'lt')
+            isnull = '{key}__isnull'.format(key=key)
+            if value is None:  # nothing sorts after a null, every other value sorts before it
+                if not forward:
+                    beyond |= equal & Q(**{isnull: False})
+                equal &= Q(**{isnull: True})
+            else:
+                step = Q(**{later: value}) | Q(**{isnull: True}) if forward else Q(**{earlier: value})
+                beyond |= equal & step
+                equal &= Q(**{key: value})
+        return beyond
+
+    def get_cursor(self, keys, row, forward):
+        values = [getattr(row, key) for key, _ in keys]
+        values = [value if value is None or isinstance(value, (bool, int, float, str)) else str(value)
+                  for value in values]
+        return signing.dumps((self.fields, forward, values), salt=self.cursor_salt, compress=True)
+
+    def read_cursor(self, queryset, keys):
+        """ Return (forward, key values) from this paginator's cursor, or (True, None) for the first page """
+        try:
+            fields, forward, values = signing.loads(self.cursor, salt=self.cursor_salt)
+        except (signing.BadSignature, TypeError, ValueError):
+            return True, None
+        if fields != self.fields or len(values) != len(keys):  # e.g., table sort order has changed
+            return True, None
+        try:
+            values = [value if value is None else queryset.query.annotations[key].output_field.to_python(value)
+                      for (key, _), value in zip(keys, values)]
+        except (FieldError, ValidationError):
+            return True, None
+        return forward, values
+
+    def page(self, number=None):
+        queryset = self.rows.data.data
+        ordering = self.get_ordering(queryset)
+        self.fields = [('-' if descending else '') + field for field, descending in ordering]
+        keys = [('keyset_{i}'.format(i=i), descending) for i, (field, descending) in enumerate(ordering)]
+        queryset = queryset.annotate(**{key: F(field) for (key, _), (field, _) in zip(keys, ordering)})
+        forward, values = self.read_cursor(queryset, keys) if self.cursor else (True, None)
+
+        if forward:
+            order_by = [F(key).desc(nulls_last=True) if descending else F(key).asc(nulls_last=True)
+                        for key, descending in keys]
+        else:
+            order_by = [F(key).asc(nulls_first=True) if descending else F(key).desc(nulls_first=True)
+                        for key, descending in keys]
+        if values is not None:
+            queryset = queryset.filter(self.seek(keys, values, forward))
+        records = list(queryset.order_by(*order_by)[:self.per_page + 1])
+        more, records = len(records) > self.per_page, records[:self.per_page]
+        if not forward:
+            records.reverse()
+        if not records and values is not None:  # e.g., rows on the cursor's page were deleted: start again
+            self.cursor = None
+            return self.page()
+
+        has_previous, has_next = (values is not None, more) if forward else (more, True)
+        return KeysetPage(
+            BoundRows(records, self.rows.table), self,
+            previous_cursor=self.get_cursor(keys, records[0], forward=False) if has_previous else None,
+            next_cursor=self.get_cursor(keys, records[-1], forward=True) if has_next else None,
+        )
+
+
+# -----------  Streaming export -------------- #
+
+
+class Echo:
+    """ File-like object for csv.writer that returns each written row, rather than buffering it """
+    def write(self, value):
+        return value
+
+
+def stream_csv(header, rows):
+    """ Generate CSV lines for the header and each row, one at a time """
+    writer = csv.writer(Echo())
+    yield writer.writerow(header)
+    for row in rows:
+        yield writer.writerow(row)
+
+
 # -----------  Base Table Views and Mixins -------------- #
 
 
@@ -112,6 +362,23 @@ class BaseFilteredTableView(tables.SingleTableMixin, ExportMixin, FilterView):
     export_table_class = None
     filterset_class = None
     export_filterset_class = None
+    keyset_pagination = False  # True to page through the table by sort key, rather than by OFFSET
+    exact_count = True         # False to skip counting all rows for OFFSET pagination (no page count is shown)
+    stream_export = False      # True to stream CSV exports straight from the queryset, without rendering the table
+    export_chunk_size = 2000
+
+    def get_table_pagination(self, table):
+        paginate = super().get_table_pagination(table)
+        if paginate is False or self.is_export:  # exports include every row
+            return False
+        paginate = {} if paginate is True else dict(paginate)
+        if self.keyset_pagination:
+            cursor_field = '{prefix}cursor'.format(prefix=table.prefix)
+            paginate.update(paginator_class=KeysetPaginator,
+                            cursor_field=cursor_field, cursor=self.request.GET.get(cursor_field))
+        elif not self.exact_count:
+            paginate.update(paginator_class=LazyPaginator)
+        return paginate or True
 
     def get_table_class(self):
         if self.is_export and self.export_table_class:
@@ -127,6 +394,28 @@ class BaseFilteredTableView(tables.SingleTableMixin, ExportMixin, FilterView):
     def is_export(self):
         return self.request.GET.get(self.export_trigger_param, False)
 
+    def create_export(self, export_format):
+        if self.stream_export and export_format == TableExport.CSV:
+            return self.create_streaming_export()
+        return super().create_export(export_format)
+
+    def create_streaming_export(self):
+        """
+            Stream the filtered, sorted table as CSV, fetching values() tuples in chunks:  memory use is constant,
+                however many rows are exported.  Cells are not rendered - the table defines the exported values.
+        """
+        table = self.get_table(**self.get_table_kwargs())
+        columns = table.get_export_columns(exclude_columns=self.exclude_columns)
+        values = table.data.data.prefetch_related(None).values_list(*(column.value for column in columns))
+        rows = (
+            [column.format(value) if value is not None else '' for column, value in zip(columns, row)]
+            for row in values.iterator(chunk_size=self.export_chunk_size)
+        )
+        response = http.StreamingHttpResponse(stream_csv([column.header for column in columns], rows),
+                                              content_type='text/csv; charset=utf-8')
+        response['Content-Disposition'] = 'attachment; filename="{}"'.format(self.get_export_filename(TableExport.CSV))
+        return response
+
     def get_filterset_kwargs(self, filterset_class):
         kwargs = super().get_filterset_kwargs(filterset_class)
         kwargs.update({
@@ -2,7 +2,14 @@ from django import template
 register = template.Library()
 
 from django.template.loader import get_template
+from assessment.builder import taxonomy
 
 @register.filter
 def linkify(object):
     return get_template('helpers/linkify.html').render({'object': object})
+
+
+@register.simple_tag
+def assessment_taxonomy():
+    """ Return the current snapshot of the active taxonomy.  Usage: {% assessment_taxonomy as taxonomy %} """
+    return taxonomy.get_snapshot()
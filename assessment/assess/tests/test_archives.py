@@ -0,0 +1,74 @@
+import csv, io, zipfile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase
+from django.urls import reverse
+from assessment.assess import models, archives
+from assessment.tests import base
+
+
+class SupportingDocArchiveTests(TestCase):
+    """
+        The supporting documents for a record or group stream as a ZIP archive of attached files, with a manifest
+    """
+    def setUp(self):
+        super().setUp()
+        self.categories = base.create_assessment_categories()
+        self.category = self.categories[0]
+        base.create_question_metric_set(self.category, 'Question 1', 2)
+        self.user = base.create_user('Assessor')
+        self.record = base.create_assessment(self.user, self.category, 'Subject')
+        first, second = self.record.score_set.order_by('metric__order')
+        self.docs = [
+            models.SupportingDoc.objects.create(score=first, file=SimpleUploadedFile('sop.txt', b'First SOP')),
+            models.SupportingDoc.objects.create(score=first, file=SimpleUploadedFile('sop.txt', b'Second SOP')),
+            base.create_support_document_link(url='https://example.com/evidence.pdf', score=second),
+        ]
+
+    def read_archive(self, content):
+        archive = zipfile.ZipFile(io.BytesIO(b''.join(content)))
+        self.assertIsNone(archive.testzip())
+        manifest = list(csv.DictReader(io.StringIO(archive.read(archives.MANIFEST_NAME).decode())))
+        return archive, manifest
+
+    def test_archive(self):
+        chunks = list(archives.iter_zip(archives.get_supporting_docs(score__assessment=self.record)))
+        self.assertGreater(len(chunks), 1)
+        archive, manifest = self.read_archive(chunks)
+        paths = [row['file'] for row in manifest]
+        folder = '{}/{}/'.format(self.category.slug, self.docs[0].score.metric.slug)
+        self.assertTrue(all(path.startswith(folder) for path in paths[:2]), paths)
+        self.assertEqual(paths[2], '')
+        self.assertEqual([archive.read(path) for path in paths[:2]], [b'First SOP', b'Second SOP'])
+        self.assertEqual(manifest[2]['url'], 'https://example.com/evidence.pdf')
+        self.assertEqual({row['record'] for row in manifest}, {str(self.record.pk)})
+
+    def test_unique_path(self):
+        paths = {archives.MANIFEST_NAME}
+        self.assertEqual([archives.unique_path(path, paths) for path in ('a/b.txt', 'a/b.txt', 'a/b.txt', 'b.txt')],
+                         ['a/b.txt', 'a/b (2).txt', 'a/b (3).txt', 'b.txt'])
+
+    def test_access_and_missing_files(self):
+        self.docs[1].file.storage.delete(self.docs[1].file.name)
+        docs = archives.get_supporting_docs(score__assessment=self.record)
+        archive, manifest = self.read_archive(archives.iter_zip(docs, can_access=lambda doc: doc != self.docs[0]))
+        self.assertEqual([row['note'] for row in manifest], ['access denied', 'file not found', ''])
+        self.assertEqual(archive.namelist(), [archives.MANIFEST_NAME])
+
+    def test_views(self):
+        url = self.record.get_docs_url()
+        self.assertEqual(self.client.get(url).status_code, 403)  # login required for private assessments
+        self.client.login(username=self.user.username, password='password')
+        response = self.client.get(url)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/zip')
+        archive, manifest = self.read_archive(response.streaming_content)
+        self.assertEqual(len(manifest), 3)
+        self.assertContains(self.client.get(self.record.get_absolute_url()), url)
+
+        group = base.create_assessment_group(self.user, activity=self.category.activity)
+        other = base.create_assessment(self.user, self.categories[1], 'Subject')
+        models.AssessmentRecord.objects.filter(pk__in=[self.record.pk, other.pk]).update(group=group)
+        response = self.client.get(reverse('assessment.assess:group-docs', args=(group.pk, )))
+        archive, manifest = self.read_archive(response.streaming_content)
+        self.assertEqual(len(manifest), 3)
+        self.assertEqual(self.client.get(reverse('assessment.assess:group-docs', args=(0, ))).status_code, 404)
@@ -0,0 +1,74 @@
+import json, os, tempfile
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+from assessment.assess import models, choices, datasets
+from assessment.tests import base
+
+
+class AssessmentDatasetTests(TestCase):
+    """
+        Denormalized datasets contain every score of the selected records, loaded in a fixed number of queries per chunk
+    """
+    def setUp(self):
+        super().setUp()
+        self.categories = base.create_assessment_categories()
+        self.category = self.categories[0]
+        base.create_question_metric_set(self.category, 'Question 1', 2)
+        base.create_question_metric_set(self.category, 'Question 2', 1)
+        self.user = base.create_user('Assessor')
+        self.records = [base.create_assessment(self.user, self.category, 'Subject {}'.format(i)) for i in range(3)]
+        self.draft = base.create_assessment(self.user, self.category, 'Draft', as_draft=True)
+        score = self.records[0].score_set.first()
+        score.applicable, score.comments = False, 'Not relevant'
+        score.save()
+        models.MetricScore.objects.filter(assessment=self.records[1]).update(score=2)
+
+    def test_long(self):
+        with self.assertNumQueries(2 + 2 * 2 + 1):  # taxonomy labels, 2 chunks of records + scores, empty chunk
+            dataset = datasets.AssessmentDataset(layout=datasets.LONG, chunk_size=2)
+            rows = [dict(zip(dataset.columns, row)) for row in dataset]
+        self.assertEqual(len(rows), models.MetricScore.objects.count())
+        not_applicable, = [row for row in rows if not row['applicable']]
+        self.assertEqual((not_applicable['record'], not_applicable['comments']), (self.records[0].pk, 'Not relevant'))
+        self.assertEqual({row['subject'] for row in rows if row['record'] == self.records[1].pk}, {'Subject 1'})
+        self.assertEqual({row['score'] for row in rows if row['record'] == self.records[1].pk}, {2})
+        self.assertEqual({row['category'] for row in rows}, {self.category.label})
+
+    def test_wide(self):
+        records = models.AssessmentRecord.summaries.complete()
+        dataset = datasets.AssessmentDataset(records, layout=datasets.WIDE)
+        rows = [dict(zip(dataset.columns, row)) for row in dataset]
+        self.assertEqual([row['record'] for row in rows], [record.pk for record in self.records])
+        metric_columns = dataset.columns[len(datasets.RECORD_COLUMNS):]
+        self.assertEqual(len(metric_columns), models.AssessmentMetric.objects.filter(question__category=self.category).count())
+        self.assertEqual([rows[1][column] for column in metric_columns], [2] * len(metric_columns))
+        self.assertEqual(sum(rows[0][column] is None for column in metric_columns), 1)
+
+    def test_jsonl(self):
+        dataset = datasets.AssessmentDataset(layout=datasets.WIDE)
+        lines = b''.join(datasets.iter_jsonl(dataset)).decode().splitlines()
+        self.assertEqual(len(lines), len(self.records) + 1)
+        row = json.loads(lines[0])
+        self.assertEqual(row['created'], self.records[0].created.isoformat())
+
+    def test_view(self):
+        url = reverse('assessment.assess:export')
+        self.assertEqual(self.client.get(url).status_code, 403)  # login required
+        self.client.login(username=self.user.username, password='password')
+        response = self.client.get(url, {'layout': 'wide', 'status': choices.COMPLETE_STATUS,
+                                         'category': self.category.slug})
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([row['record'] for row in rows], [record.pk for record in self.records])
+        self.assertEqual(self.client.get(url, {'layout': 'sideways'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'format': 'xls'}).status_code, 400)
+
+    def test_command(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'export.jsonl')
+            call_command('export_assessments', output=path, status=choices.DRAFT_STATUS, chunk_size=1)
+            with open(path) as f:
+                rows = [json.loads(line) for line in f]
+        self.assertEqual({row['record'] for row in rows}, {self.draft.pk})
+        self.assertEqual(len(rows), self.draft.score_set.count())
@@ -0,0 +1,186 @@
+import csv, datetime, io, json, os, tempfile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from assessment.assess import models, choices, datasets, importers
+from assessment.tests import base
+
+
+class AssessmentImporterTests(TestCase):
+    """
+        Bulk imports validate rows in memory and create records, subjects, scores and docs in a fixed number of queries
+    """
+    def setUp(self):
+        super().setUp()
+        self.categories = base.create_assessment_categories()
+        self.category = self.categories[0]
+        base.create_question_metric_set(self.category, 'Question 1', 2)
+        base.create_question_metric_set(self.category, 'Question 2', 1)
+        self.metrics = list(models.AssessmentMetric.objects.for_category(self.category.pk)
+                                                           .order_by('question__order', 'order'))
+        self.user = base.create_user('assessor')
+
+    def get_rows(self, key, subject='Imported subject', **kwargs):
+        """ Return rows for a record with a score for the first two metrics - kwargs update every row """
+        record = dict(record=key, category=self.category.slug, assessment_type=choices.QA_ASSESSMENT_TYPE,
+                      status=choices.COMPLETE_STATUS, assessor=self.user.username, subject=subject)
+        rows = [
+            dict(record, metric_id=self.metrics[0].pk, score='2', comments='Good'),
+            dict(record, question='Question 1', metric=self.metrics[1].label, score='needs work', applicable='yes',
+                 doc_url='https://example.com/evidence.pdf', doc_type='notes', doc_description='Evidence'),
+        ]
+        for row in rows:
+            row.update(kwargs)
+        return rows
+
+    def test_import(self):
+        rows = self.get_rows('a', created='2019-05-01') + self.get_rows('b', subject='Second subject')
+        rows[-1].update(applicable='N/A', score='')
+        report = importers.import_rows(rows)
+        self.assertEqual(report.errors, [])
+        self.assertEqual((report.rows, report.records, report.scores, report.docs), (4, 2, 6, 2))
+
+        first, second = models.AssessmentRecord.objects.order_by('pk')
+        self.assertEqual((first.subject.label, second.subject.label), ('Imported subject', 'Second subject'))
+        self.assertEqual((first.status, first.assessor, first.last_edited_by), ('complete', self.user, self.user))
+        self.assertEqual(first.created, datetime.date(2019, 5, 1))
+        self.assertEqual(second.created, datetime.date.today())
+        scores = {score.metric_id: score for score in first.score_set.all()}
+        self.assertEqual(set(scores), {metric.pk for metric in self.metrics})  # complete score set
+        self.assertEqual((scores[self.metrics[0].pk].score, scores[self.metrics[0].pk].comments), (2, 'Good'))
+        self.assertEqual(scores[self.metrics[1].pk].score, 1)
+        self.assertEqual((first.score_sum, first.score_count), (3, 3))  # last metric has 'empty' score of 0
+        self.assertEqual((second.score_sum, second.score_count), (2, 2))
+        doc = models.SupportingDoc.objects.get(score=scores[self.metrics[1].pk])
+        self.assertEqual((doc.url, doc.document_type, doc.document_location),
+                         ('https://example.com/evidence.pdf', 'notes', choices.DOCUMENT_LOCATION_LINK))
+
+    def test_errors(self):
+        bad = self.get_rows('bad', status='finished')
+        bad[0].update(metric_id=0)
+        bad[1].update(score='excellent', doc_url='not a url')
+        rows = self.get_rows('a') + bad + [dict(record='', category=self.category.slug)] + self.get_rows('b') + \
+               self.get_rows('a', assessor='nobody')
+        report = importers.import_rows(rows, batch_size=2)
+        self.assertEqual(report.records, 2)
+        self.assertEqual(models.AssessmentRecord.objects.count(), 2)
+        errors = {}
+        for error in report.errors:
+            errors.setdefault(error.row, []).append(error.message.split(':')[0])
+        self.assertEqual(errors, {3: ['status', 'metric'], 4: ['score'], 5: ['record'],
+                                  8: ['record'], 9: ['record']})
+
+    def test_validation(self):
+        cases = (
+            (dict(category='no-such-category'), 'category'),
+            (dict(assessor='nobody'), 'assessor'),
+            (dict(assessment_type=''), 'assessment_type'),
+            (dict(created='May 2019'), 'created'),
+            (dict(subject=''), 'subject label'),
+            (dict(applicable='maybe'), 'applicable'),
+            (dict(score=''), 'score'),
+            (dict(score='7'), 'score'),
+            (dict(doc_type='video'), 'doc_type'),
+        )
+        for values, column in cases:
+            with self.subTest(column=column):
+                report = importers.import_rows(self.get_rows('a', **values), dry_run=True)
+                self.assertEqual(report.records, 0)
+                self.assertTrue(report.errors[0].message.startswith(column), report.errors)
+
+    def test_dry_run(self):
+        report = importers.import_rows(self.get_rows('a') + self.get_rows('b'), dry_run=True)
+        self.assertEqual((report.ok, report.records, report.scores), (True, 2, 6))
+        self.assertFalse(models.AssessmentRecord.objects.exists())
+
+    def test_default_assessor(self):
+        rows = self.get_rows('a', assessor='')
+        self.assertEqual(importers.import_rows(rows).records, 0)
+        other = base.create_user('other')
+        self.assertEqual(importers.import_rows(rows, assessor=other).records, 1)
+        self.assertEqual(models.AssessmentRecord.objects.get().assessor, other)
+
+    def test_query_count(self):
+        """ The number of queries depends on the number of batches, not the number of records or scores """
+        def count_queries(records, batch_size):
+            rows = [row for i in range(records) for row in self.get_rows(i)]
+            with CaptureQueriesContext(connection) as queries:
+                report = importers.import_rows(rows, batch_size=batch_size)
+            self.assertEqual(report.records, records)
+            return len(queries)
+        importers.AssessmentImporter()  # cache the category blueprints
+        self.assertEqual(count_queries(1, 10), count_queries(10, 10))
+        self.assertEqual(count_queries(10, 5), count_queries(2, 1))
+
+    def test_export_round_trip(self):
+        models.AssessmentCategory.objects.filter(pk=self.category.pk).update(label='Exported category')
+        record = base.create_assessment(self.user, self.category, 'Exported')
+        models.MetricScore.objects.filter(assessment=record, metric=self.metrics[0]).update(score=2, comments='Yes')
+        models.MetricScore.objects.filter(assessment=record, metric=self.metrics[1]).update(applicable=False)
+        export = b''.join(datasets.iter_jsonl(datasets.AssessmentDataset()))
+        report = importers.import_file(io.BytesIO(export), 'jsonl')
+        self.assertTrue(report.ok, report.errors)
+        record.refresh_from_db()
+        imported = models.AssessmentRecord.objects.exclude(pk=record.pk).get()
+        values = lambda r: list(r.score_set.order_by('metric').values_list('metric', 'applicable', 'score', 'comments'))
+        self.assertEqual(values(imported), values(record))
+        self.assertEqual((imported.subject.label, imported.created, imported.avg_score),
+                         ('Exported', record.created, record.avg_score))
+
+    def test_formats(self):
+        rows = self.get_rows('a') + self.get_rows('b')
+        text = io.StringIO()
+        writer = csv.DictWriter(text, fieldnames=list({name: None for row in rows for name in row}))
+        writer.writeheader()
+        writer.writerows(rows)
+        files = {
+            'csv': text.getvalue().encode(),
+            'json': json.dumps(rows).encode(),
+            'jsonl': ''.join(json.dumps(row) + '\n' for row in rows).encode() + b'{not json\n',
+        }
+        for import_format, content in files.items():
+            with self.subTest(format=import_format):
+                report = importers.import_file(io.BytesIO(content), import_format, dry_run=True)
+                self.assertEqual(report.records, 2)
+        self.assertEqual(report.errors[0].row, 5)  # invalid JSON line
+        self.assertEqual([importers.get_format(name) for name in ('a.CSV', 'a.json', 'a.ndjson', 'a.txt', '-')],
+                         ['csv', 'json', 'jsonl', 'csv', 'csv'])
+
+    def test_view(self):
+        url = reverse('assessment.assess:import')
+        upload = lambda: SimpleUploadedFile('records.jsonl', ''.join(json.dumps(row) + '\n'
+                                                                     for row in self.get_rows('a')).encode())
+        self.client.login(username=self.user.username, password='password')
+        self.assertEqual(self.client.post(url, {'file': upload()}).status_code, 403)
+        self.user.is_staff = True
+        self.user.save()
+        response = self.client.post(url, {'file': upload(), 'dry_run': 'true'})
+        self.assertEqual(response.json()['records'], 1)
+        self.assertFalse(models.AssessmentRecord.objects.exists())
+        response = self.client.post(url, {'file': upload(), 'batch_size': 'all'})
+        self.assertEqual((response.json()['records'], response.json()['errors']), (1, []))
+        self.assertEqual(models.AssessmentRecord.objects.get().subject.label, 'Imported subject')
+        self.assertEqual(self.client.post(url, {'file': upload(), 'format': 'xls'}).status_code, 400)
+        self.assertEqual(self.client.post(url).status_code, 400)
+
+    def test_command(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'records.json')
+            with open(path, 'w') as f:
+                json.dump(self.get_rows('a', assessor='') + self.get_rows('b', score='7'), f)
+            errors_path = os.path.join(directory, 'errors.csv')
+            stdout = io.StringIO()
+            with self.assertRaises(CommandError):
+                call_command('import_assessments', path, assessor=self.user.username, errors=errors_path,
+                             stdout=stdout)
+            self.assertIn('Imported 1 records', stdout.getvalue())
+            with open(errors_path) as f:
+                errors = list(csv.DictReader(f))
+            self.assertEqual([(error['row'], error['record']) for error in errors], [('3', 'b'), ('4', 'b')])
+            with self.assertRaises(CommandError):
+                call_command('import_assessments', path, assessor='nobody')
+        self.assertEqual(models.AssessmentRecord.objects.get().assessor, self.user)
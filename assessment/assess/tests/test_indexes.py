@@ -0,0 +1,82 @@
+from unittest import skipUnless
+from django.contrib import admin
+from django.db import connection
+from django.test import TestCase, RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from assessment.builder import taxonomy
+from assessment.assess import models, choices
+from assessment.tests import base
+
+
+@skipUnless(connection.vendor == 'sqlite', 'Query plans are checked against the SQLite query planner')
+class QueryPlanTests(TestCase):
+    """
+        Hot list queries should be served by the composite and partial indexes defined on the models
+    """
+    def setUp(self):
+        super().setUp()
+        self.categories = base.create_assessment_categories()
+        self.category = self.categories[0]
+        base.create_question_metric_set(self.category, 'Question 1', 1)
+        self.user = base.create_user(username='assessor')
+        self.assessment = base.create_assessment(self.user, self.category, 'Test Assessment')
+        self.group = base.create_assessment_group(self.user, topic=self.category.topic)
+        self.group.create_assessment_set_from_template(self.assessment)
+        taxonomy.get_snapshot()
+
+    def query_plan(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+            return ' '.join(row[-1] for row in cursor.fetchall())
+
+    def get_view_plans(self, url, table, **params):
+        """ Return query plans for the queries on table made by the view at url """
+        self.client.login(username=self.user.username, password='password')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return [self.query_plan(query['sql']) for query in queries
+                if query['sql'].startswith('SELECT') and '"{}"'.format(table) in query['sql']]
+
+    def assertUsesIndex(self, plans, *index_names):
+        self.assertTrue(any(name in plan for plan in plans for name in index_names),
+                        'None of {names} used in query plans: {plans}'.format(names=index_names, plans=plans))
+
+    def test_category_list(self):
+        url = reverse('assessment.assess:category', args=(self.category.slug,))
+        plans = self.get_view_plans(url, 'assess_assessmentrecord',
+                                    status=choices.DRAFT_STATUS, assessment_type=choices.QA_ASSESSMENT_TYPE)
+        self.assertUsesIndex(plans, 'assess_record_category_idx')
+        plans = self.get_view_plans(url, 'assess_assessmentrecord', status=choices.COMPLETE_STATUS)
+        self.assertUsesIndex(plans, 'assess_record_complete_idx', 'assess_record_category_idx')
+
+    def test_group_list(self):
+        url = reverse('assessment.assess:topic', args=(self.category.topic.slug,))
+        plans = self.get_view_plans(url, 'assess_assessmentgroup', status=self.group.status)
+        self.assertUsesIndex(plans, 'assess_group_topic_idx')
+        self.assertUsesIndex(plans, 'assess_record_edited_idx')  # group's last edit
+        url = reverse('assessment.assess:activity', args=(self.category.activity.slug,))
+        plans = self.get_view_plans(url, 'assess_assessmentgroup', status=choices.COMPLETE_STATUS)
+        self.assertUsesIndex(plans, 'assess_group_activity_idx')
+
+    def test_admin_list(self):
+        request = RequestFactory().get('/', {'status__exact': choices.COMPLETE_STATUS})
+        request.user = self.user
+        request.user.is_superuser = request.user.is_staff = True
+        for model, index_name in ((models.AssessmentRecord, 'assess_record_status_idx'),
+                                  (models.AssessmentGroup, 'assess_group_status_idx')):
+            changelist = admin.site._registry[model].get_changelist_instance(request)
+            self.assertUsesIndex([changelist.queryset.explain()], index_name)
+
+    def test_score_summary(self):
+        records = models.AssessmentRecord.objects.filter(pk=self.assessment.pk)
+        with CaptureQueriesContext(connection) as queries:
+            records.update_score_summaries()
+        self.assertUsesIndex([self.query_plan(query['sql']) for query in queries], 'assess_score_applicable_idx')
+
+    def test_builder_order(self):
+        questions = models.AssessmentQuestion.objects.filter(category=self.category).order_by('order')
+        self.assertUsesIndex([questions.explain()], 'builder_question_order_idx')
+        metrics = models.AssessmentMetric.objects.filter(question=questions[0]).order_by('order')
+        self.assertUsesIndex([metrics.explain()], 'builder_metric_order_idx')
@@ -1,8 +1,15 @@
+import io, os
 from itertools import groupby
+from unittest import mock
 from django.conf import settings as django_settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
 from django.core.exceptions import ValidationError
+from django.db import transaction
 from django.test import TestCase
+from django.urls import reverse
 from assessment import settings
+from assessment.builder import taxonomy
 from assessment.assess import models, choices
 from assessment.tests import base
 
@@ -72,6 +79,12 @@ class AssessmentRecordTests(BaseAssessmentTests):
         self.assertEqual(len(metrics), len(metric_scores))
         self.assertEqual(set(metrics), set(score.metric for score in metric_scores))
 
+    def test_create_metric_score_set_queries(self):
+        """ With a cached category blueprint, metric scores are created without reading the builder models """
+        base.create_assessment(self.user, self.category, 'Warm blueprint cache')
+        with self.assertNumQueries(4):  # insert record, bulk insert scores, update score summary, insert subject
+            base.create_assessment(self.user, self.category, 'Another Assessment')
+
     def test_assessment_score(self):
         # Scores only exist after the Assessments for the group are created
         scores = self.assessment.score_set.all()
@@ -112,6 +125,159 @@ class AssessmentRecordTests(BaseAssessmentTests):
         self.assertEqual(self.assessment.score_class, settings.ASSESSMENT_SCORE_CLASSES[-1][1])
 
 
+class ScoreSummaryTests(BaseAssessmentTests):
+    """
+        Test the stored score summary on AssessmentRecord is kept in sync with its MetricScores
+    """
+    def assertSummaryInSync(self, assessment):
+        stored = models.AssessmentRecord.objects.filter(pk=assessment.pk)\
+                                                .values_list(*models.AssessmentRecord.SCORE_SUMMARY_FIELDS).get()
+        models.AssessmentRecord.objects.filter(pk=assessment.pk).update_score_summaries()
+        expected = models.AssessmentRecord.objects.filter(pk=assessment.pk)\
+                                                  .values_list(*models.AssessmentRecord.SCORE_SUMMARY_FIELDS).get()
+        self.assertEqual(stored, expected)
+
+    def test_new_record(self):
+        num_scores = self.assessment.score_set.count()
+        record = models.AssessmentRecord.objects.get(pk=self.assessment.pk)
+        self.assertEqual(record.score_count, num_scores)
+        self.assertEqual(record.score_sum, 0)
+        self.assertEqual(record.avg_score, 0)
+
+    def test_save(self):
+        scores = list(self.assessment.score_set.all())
+        scores[0].score = 2
+        scores[0].save()
+        scores[1].applicable = False
+        scores[1].save()
+        self.assertEqual(self.assessment.score_sum, 2)
+        self.assertEqual(self.assessment.score_count, len(scores) - 1)
+        self.assertSummaryInSync(self.assessment)
+        record = models.AssessmentRecord.objects.get(pk=self.assessment.pk)
+        self.assertEqual(record.avg_score, 2 / (len(scores) - 1))
+        self.assertEqual(record.assessment_score(), self.assessment.assessment_score())
+
+    def test_not_applicable(self):
+        for score in self.assessment.score_set.all():
+            score.applicable = False
+            score.save()
+        record = models.AssessmentRecord.objects.get(pk=self.assessment.pk)
+        self.assertEqual(record.score_count, 0)
+        self.assertIsNone(record.avg_score)
+        self.assertEqual(record.score_class, settings.ASSESSMENT_SCORE_CLASSES[0][1])
+
+    def test_bulk_operations(self):
+        models.MetricScore.objects.filter(assessment=self.assessment).update(score=2)
+        self.assertEqual(models.AssessmentRecord.objects.get(pk=self.assessment.pk).avg_score, 2)
+        self.assertSummaryInSync(self.assessment)
+        scores = list(models.MetricScore.objects.filter(assessment=self.assessment))
+        for score in scores:
+            score.score = 1
+        with self.assertNumQueries(3):  # record ids, update scores, update score summaries - once
+            models.MetricScore.objects.bulk_update(scores, ['score'])
+        self.assertEqual(models.AssessmentRecord.objects.get(pk=self.assessment.pk).avg_score, 1)
+        self.assertSummaryInSync(self.assessment)
+
+    def test_delete(self):
+        models.MetricScore.objects.filter(assessment=self.assessment).update(score=2)
+        score = models.MetricScore.objects.filter(assessment=self.assessment).first()
+        score.score = 0
+        score.save()
+        score.delete()
+        self.assertEqual(models.AssessmentRecord.objects.get(pk=self.assessment.pk).avg_score, 2)
+        self.assertSummaryInSync(self.assessment)
+        models.MetricScore.objects.filter(assessment=self.assessment).delete()
+        self.assertIsNone(models.AssessmentRecord.objects.get(pk=self.assessment.pk).avg_score)
+        self.assertSummaryInSync(self.assessment)
+
+    def test_decrement_to_zero(self):
+        scores = list(self.assessment.score_set.all())
+        for score in scores:
+            score.score = 2
+            score.save()
+        self.assertEqual(self.assessment.score_sum, 2 * len(scores))
+        scores[0].applicable = False
+        scores[0].save()
+        for score in scores[1:]:
+            score.delete()
+        record = models.AssessmentRecord.objects.get(pk=self.assessment.pk)
+        self.assertEqual((record.score_sum, record.score_count, record.avg_score), (0, 0, None))
+        self.assertSummaryInSync(self.assessment)
+
+    def test_record_save_preserves_summary(self):
+        stale = models.AssessmentRecord.objects.get(pk=self.assessment.pk)
+        models.MetricScore.objects.filter(assessment=self.assessment).update(score=2)
+        stale.status = choices.DRAFT_STATUS
+        stale.save()
+        self.assertEqual(models.AssessmentRecord.objects.get(pk=self.assessment.pk).avg_score, 2)
+
+    def test_deferred_record_save(self):
+        record = models.AssessmentRecord.summaries.get(pk=self.assessment.pk)
+        models.MetricScore.objects.filter(assessment=self.assessment).update(score=2)
+        record.status = choices.DRAFT_STATUS
+        with self.assertNumQueries(1):  # update the loaded fields only - no refresh of deferred fields
+            record.save()
+        record = models.AssessmentRecord.objects.get(pk=self.assessment.pk)
+        self.assertEqual((record.status, record.avg_score), (choices.DRAFT_STATUS, 2))
+
+    def test_order_by_score(self):
+        models.MetricScore.objects.filter(assessment=self.assessment).update(score=2)
+        ordered = models.AssessmentRecord.objects.order_by('avg_score')
+        self.assertEqual(list(ordered), [self.draft_assessment, self.assessment])
+
+
+class AssessmentSummaryTests(BaseAssessmentTests):
+    """
+        Test lightweight summary queryset used for table listings
+    """
+    def test_summaries(self):
+        summaries = models.AssessmentRecord.summaries.all()
+        self.assertEqual(set(summaries), set(models.AssessmentRecord.objects.all()))
+        with self.assertNumQueries(1):
+            for record in models.AssessmentRecord.summaries.all():
+                str(record.subject), record.assessor.get_full_name(), record.status, record.score_class
+                self.assertFalse(hasattr(record, '_prefetched_objects_cache'))
+
+    def test_summaries_default_subject_fields(self):
+        # a subject that doesn't narrow summary_fields loads all its fields, whatever its __str__ uses
+        with mock.patch.object(models.AssessmentSubject, 'summary_fields', None), \
+                mock.patch.object(models.AssessmentSubject, '__str__', lambda subject: subject.description):
+            with self.assertNumQueries(1):
+                for record in models.AssessmentRecord.summaries.all():
+                    str(record.subject)
+
+    def test_with_score_set(self):
+        record = models.AssessmentRecord.objects.with_score_set().get(pk=self.assessment.pk)
+        with self.assertNumQueries(0):
+            scores = list(record.scores_by_question())
+            questions = [score.metric.question for score in scores]
+            [list(score.doc_set.all()) for score in scores]
+        self.assertEqual(questions, sorted(questions, key=lambda q: q.order))
+        self.assertEqual(len(scores), self.assessment.score_set.count())
+
+    def test_is_scored(self):
+        self.assertTrue(self.assessment.is_scored)
+        models.MetricScore.objects.filter(assessment=self.assessment).update(applicable=False)
+        self.assertFalse(models.AssessmentRecord.summaries.get(pk=self.assessment.pk).is_scored)
+
+    def test_summarize(self):
+        models.MetricScore.objects.filter(assessment=self.assessment).update(score=2)
+        unscored = base.create_assessment(self.user, self.category, 'Unscored Assessment')
+        models.MetricScore.objects.filter(assessment=unscored).update(applicable=False)
+        records = models.AssessmentRecord.objects.all()
+        with self.assertNumQueries(1):
+            summary, = records.summarize('category')
+        self.assertEqual(summary['category'], self.category.pk)
+        self.assertEqual(summary['records'], 3)
+        self.assertEqual(summary['score_sum'], sum(r.score_sum for r in records))
+        self.assertEqual(summary['score_count'], sum(r.score_count for r in records))
+        score_classes = [name for _, name in settings.ASSESSMENT_SCORE_CLASSES]
+        expected = [0] * len(score_classes)
+        for record in records:
+            expected[score_classes.index(record.score_class)] += 1
+        self.assertEqual([summary['score_classes_{}'.format(i)] for i in range(len(score_classes))], expected)
+
+
 class AssessmentGroupTests(BaseAssessmentTests):
     """
         Test basic behaviours for AssessmentGroup model
@@ -201,6 +367,21 @@ class AssessmentGroupTests(BaseAssessmentTests):
         assessment_categories = (a.category for a in self.activity_group.assessment_set.all())
         self.assertEqual(set(self.activity_group.category_set), set(assessment_categories))
         self.assertTrue(all(a.status == self.activity_group.status for a in self.activity_group.assessment_set.all()))
+        for record in self.activity_group.assessment_set.all():
+            self.assertEqual(str(record.subject), self.TEST_ASSESSMENT_LABEL)
+            self.assertEqual(set(s.metric for s in record.score_set.all()), set(record.metric_set))
+            self.assertEqual(record.score_count, record.metric_set.count())
+        self.assertEqual(self.activity_group.subject_record.group, self.activity_group)
+
+    def test_create_assessment_set_queries(self):
+        # Whole set is created with a fixed number of bulk queries, regardless of the number of categories or metrics
+        for category in self.activity_group.category_set:
+            base.create_question_metric_set(category, 'Another Question', 3)
+        with self.assertNumQueries(9):
+            self.activity_group.create_assessment_set_from_template(self.assessment)
+        self.assertEqual(self.activity_group.score_set.count(), self.activity_group.metric_set.count())
+        with self.assertNumQueries(3):  # nothing left to create
+            self.activity_group.create_assessment_set_from_template(self.assessment)
 
     def test_save(self):
         # Saving a group updates all its assessment's status
@@ -230,6 +411,66 @@ class AssessmentGroupTests(BaseAssessmentTests):
         self.assertEqual(self.activity_group.score_class, settings.ASSESSMENT_SCORE_CLASSES[-1][1])
 
 
+class AssessmentGroupSummaryTests(BaseAssessmentTests):
+    """
+        Test group summary annotations match the group's records
+    """
+    def setUp(self):
+        super().setUp()
+        self.group = base.create_assessment_group(self.user, activity=self.category.activity)
+        self.group.create_assessment_set_from_template(self.assessment)
+        self.empty_group = base.create_assessment_group(self.user, topic=self.category.topic)
+
+    def test_annotate_summary(self):
+        scores = list(self.group.score_set.all())
+        for i, score in enumerate(scores):
+            score.score = i % 3
+            score.save()
+        group = models.AssessmentGroup.summaries.get(pk=self.group.pk)
+        self.assertEqual(group.record_count, self.group.assessment_set.count())
+        self.assertEqual(group.score_count, len(scores))
+        self.assertAlmostEqual(group.assessment_score(), sum(score.score for score in scores) / len(scores))
+        self.assertEqual(group.last_edited, self.group.last_edited_assessment.last_edited)
+        self.assertTrue(group.is_scored)
+
+    def test_empty_group(self):
+        group = models.AssessmentGroup.summaries.get(pk=self.empty_group.pk)
+        self.assertEqual(group.record_count, 0)
+        self.assertIsNone(group.avg_score)
+        self.assertFalse(group.is_scored)
+
+    def test_subject_record(self):
+        group = models.AssessmentGroup.summaries.get(pk=self.group.pk)
+        self.assertEqual(group.subject_record.group, self.group)
+        with self.assertNumQueries(0):
+            self.assertEqual(str(group.subject), self.TEST_ASSESSMENT_LABEL)
+        self.assertEqual(models.AssessmentGroup.summaries.get(pk=self.empty_group.pk).subject, None)
+
+    def test_delete_subject_record(self):
+        records = list(self.group.assessment_set.order_by('pk'))
+        self.assertEqual(self.group.subject_record, records[0])
+        records[0].delete()
+        group = models.AssessmentGroup.summaries.get(pk=self.group.pk)
+        self.assertEqual(group.subject_record, records[1])
+        subject = 'subject_record__{}__label'.format(models.get_assessment_subject_related_name())
+        self.assertIn(group, models.AssessmentGroup.objects.filter(**{subject: self.TEST_ASSESSMENT_LABEL}))
+        for record in records[1:]:
+            record.delete()
+        self.assertIsNone(models.AssessmentGroup.summaries.get(pk=self.group.pk).subject_record)
+
+    def test_no_joins(self):
+        sql = str(models.AssessmentGroup.summaries.all().query)
+        self.assertNotIn('GROUP BY "assess_assessmentgroup"', sql)
+        self.assertNotIn('assess_metricscore', sql)
+
+    def test_with_score_set(self):
+        group = models.AssessmentGroup.objects.with_score_set().get(pk=self.group.pk)
+        with self.assertNumQueries(0):
+            for record in group.assessment_set.all():
+                str(record.subject)
+                list(record.scores_by_question())
+
+
 class MetricScoreTestsBase(BaseAssessmentTests):
     def setUp(self):
         super().setUp()
@@ -272,6 +513,35 @@ class SupportingDocTests(MetricScoreTestsBase):
         self.assertIn(self.metric.slug, path)
         self.assertIn(self.FILENAME, path)
 
+    def test_upload_path_queries(self):
+        """ Upload paths are resolved from preloaded metrics - the docs are created in a single query """
+        scores = list(self.assessment.score_set.all())
+        taxonomy.get_snapshot()
+        docs = [models.SupportingDoc(score=score, file=base.generate_simple_uploaded_file(self.FILENAME))
+                for score in scores]
+        with self.assertNumQueries(1):
+            models.SupportingDoc.objects.bulk_create(docs)
+        for doc, score in zip(docs, scores):
+            self.assertEqual(doc.file.name.split('/')[1:3], [score.metric.question.category.slug, score.metric.slug])
+        # retired metrics are not in the taxonomy snapshot
+        models.AssessmentMetric.objects.filter(pk=self.metric.pk).update(status='retired')
+        taxonomy.invalidate()
+        instance = lambda: None  # a mutable null object
+        instance.score = self.score
+        self.assertIn(self.metric.slug, models.supporting_doc_directory_path(instance, self.FILENAME))
+
+    def test_bulk_attach(self):
+        scores = list(self.assessment.score_set.all())
+        docs = models.SupportingDoc.objects.bulk_attach(base.generate_simple_uploaded_file(self.FILENAME), scores,
+                                                        description='Shared SOP')
+        self.assertEqual(len(docs), len(scores))
+        self.assertEqual(len({doc.file.name for doc in docs}), 1)
+        stored = models.SupportingDoc.objects.filter(score__in=scores)
+        self.assertEqual(set(stored.values_list('description', 'document_location')),
+                         {('Shared SOP', choices.DOCUMENT_LOCATION_ATTACHED)})
+        self.assertEqual(stored.get(score=scores[-1]).file.read(), b'Hello World')
+        self.assertEqual(models.SupportingDoc.objects.bulk_attach(base.generate_simple_uploaded_file('x.txt'), []), [])
+
     def test_create_attach(self):
         url = 'https://example.com/abc/123'
         link = base.create_support_document_link(url=url)
@@ -285,8 +555,115 @@ class SupportingDocTests(MetricScoreTestsBase):
         doc = models.SupportingDoc.objects.get(pk=file.pk)
         self.assertIn(filename, doc.file.name)
         self.assertIn(filename, doc.file.url)
-        self.assertEqual(doc.href, doc.file.url)
+        self.assertEqual(doc.href, reverse('assessment.assess:doc-file', args=(doc.pk, )))  # private files
 
     def test_private_storage(self):
         doc = base.create_support_document_attach()
         self.assertIn(django_settings.PRIVATE_STORAGE_ROOT, doc.file.path)
+
+
+class DeduplicatedSupportingDocTests(MetricScoreTestsBase):
+    """
+        With DEDUPLICATE_FILES, each distinct attachment is stored once and deleted with its last SupportingDoc
+    """
+    def setUp(self):
+        super().setUp()
+        deduplicate = models.appConfig.settings._replace(DEDUPLICATE_FILES=True)
+        patcher = mock.patch.object(models.appConfig, 'settings', deduplicate)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def create_doc(self, filename='sop.txt', content=b'Standard Operating Procedure'):
+        return models.SupportingDoc.objects.create(score=self.score, file=SimpleUploadedFile(filename, content))
+
+    def delete(self, doc):
+        with self.captureOnCommitCallbacks(execute=True):
+            doc.delete()
+
+    def test_deduplicate(self):
+        first, second = self.create_doc(), self.create_doc('copy of sop.txt')
+        other = self.create_doc(content=b'Something else')
+        self.assertEqual(first.file.name, second.file.name)
+        self.assertNotEqual(first.file.name, other.file.name)
+        self.assertIn(models.get_content_digest(first.file), first.file.name)
+        self.assertIn(django_settings.PRIVATE_STORAGE_ROOT, first.file.path)
+        blob = models.DocumentBlob.objects.get(name=first.file.name)
+        self.assertEqual((blob.ref_count, blob.size), (2, len(b'Standard Operating Procedure')))
+        self.assertEqual(models.SupportingDoc.objects.get(pk=second.pk).file.read(), b'Standard Operating Procedure')
+
+    def test_delete(self):
+        first, second = self.create_doc(), self.create_doc()
+        storage = first.file.storage
+        self.delete(first)
+        self.assertEqual(models.DocumentBlob.objects.get(name=second.file.name).ref_count, 1)
+        self.assertTrue(storage.exists(second.file.name))
+        self.delete(models.SupportingDoc.objects.get(pk=second.pk))
+        self.assertFalse(models.DocumentBlob.objects.exists())
+        self.assertFalse(storage.exists(second.file.name))
+
+    def test_long_filename(self):
+        filename = 'standard-operating-procedure-for-quality-control-assessments-revised.txt'
+        doc = self.create_doc(filename)
+        self.assertEqual(os.path.basename(doc.file.name), filename)
+
+    def test_rollback(self):
+        doc = models.SupportingDoc(score=self.score, file=SimpleUploadedFile('sop.txt', b'Rolled back'))
+        storage = doc.file.storage
+        with mock.patch.object(models.DocumentBlobQueryset, 'acquire', side_effect=ValueError('roll back the doc')):
+            with self.assertRaises(ValueError):
+                doc.save()
+        self.assertFalse(models.DocumentBlob.objects.exists())
+        self.assertFalse(storage.exists(doc.file.name))
+        committed = self.create_doc()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create_doc('copy of sop.txt')
+        self.assertTrue(storage.exists(committed.file.name))
+
+    def test_sweep_orphans(self):
+        doc = models.SupportingDoc(score=self.score, file=SimpleUploadedFile('sop.txt', b'Rolled back'))
+        storage = doc.file.storage
+        with self.assertRaises(ValueError):
+            with transaction.atomic():
+                doc.save()
+                raise ValueError('roll back the new attachment')
+        committed = self.create_doc('kept.txt')
+        self.assertTrue(storage.exists(doc.file.name))
+        call_command('sweep_document_blobs', stdout=io.StringIO())  # within the grace period
+        self.assertTrue(storage.exists(doc.file.name))
+        stdout = io.StringIO()
+        call_command('sweep_document_blobs', grace=-1, stdout=stdout)
+        self.assertFalse(storage.exists(doc.file.name))
+        self.assertTrue(storage.exists(committed.file.name))
+        self.assertIn(doc.file.name, stdout.getvalue())
+
+    def test_replace_file(self):
+        first, second = self.create_doc(), self.create_doc()
+        doc = models.SupportingDoc.objects.get(pk=first.pk)
+        doc.file = SimpleUploadedFile('new.txt', b'New content')
+        doc.save()
+        self.assertEqual(models.DocumentBlob.objects.get(name=second.file.name).ref_count, 1)
+        self.assertEqual(models.DocumentBlob.objects.get(name=doc.file.name).ref_count, 1)
+        doc.description = 'No change to the file'
+        doc.save()
+        self.assertEqual(models.DocumentBlob.objects.get(name=doc.file.name).ref_count, 1)
+
+    def test_bulk_create(self):
+        self.create_doc()
+        docs = models.SupportingDoc.objects.bulk_create([
+            models.SupportingDoc(score=self.score, file=SimpleUploadedFile('sop.txt', b'Standard Operating Procedure'))
+            for i in range(3)
+        ])
+        self.assertEqual(len({doc.file.name for doc in docs}), 1)
+        self.assertEqual(models.DocumentBlob.objects.get().ref_count, 4)
+        with self.captureOnCommitCallbacks(execute=True):
+            models.SupportingDoc.objects.filter(pk__in=[doc.pk for doc in docs]).delete()
+        self.assertEqual(models.DocumentBlob.objects.get().ref_count, 1)
+
+    def test_bulk_attach(self):
+        scores = list(self.assessment.score_set.all())
+        docs = models.SupportingDoc.objects.bulk_attach(SimpleUploadedFile('sop.txt', b'Standard Operating Procedure'),
+                                                        scores)
+        blob = models.DocumentBlob.objects.get()
+        self.assertEqual({doc.file.name for doc in docs}, {blob.name})
+        self.assertEqual(blob.ref_count, len(scores))
+
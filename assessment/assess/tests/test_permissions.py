@@ -1,6 +1,8 @@
 from django.test import TestCase
 from django.core.exceptions import PermissionDenied
-from assessment.assess.permissions import permissions, get_permissions_context_from_request, permission_required
+from assessment.assess.permissions import (
+    permissions, get_permissions_context_from_request, permission_required, MemoizedPermission
+)
 from assessment.tests import base
 
 
@@ -82,4 +84,25 @@ class PermissionsContextProvidersTests(BaseTestWithUsers):
 
         context = get_permissions_context_from_request(request)
         self.assertIn('user_can_edit_assessment', context)
-        self.assertFalse(context['user_can_edit_assessment']())
\ No newline at end of file
+        self.assertFalse(context['user_can_edit_assessment']())
+
+    def test_context_memoized_per_request(self):
+        request = lambda: None
+        request.user = self.privilegedUser
+
+        context = get_permissions_context_from_request(request)
+        self.assertIs(get_permissions_context_from_request(request), context)
+        self.assertIsNot(get_permissions_context_from_request(request, pk=1), context)
+        other_request = lambda: None
+        other_request.user = self.privilegedUser
+        self.assertIsNot(get_permissions_context_from_request(other_request), context)
+
+    def test_permission_memoized(self):
+        calls = []
+        def user_can_count(user, **kwargs):
+            calls.append(kwargs)
+            return True
+        permission = MemoizedPermission(user_can_count, self.restrictedUser, pk=1)
+        self.assertTrue(permission())
+        self.assertTrue(permission())
+        self.assertEqual(calls, [{'pk': 1}])
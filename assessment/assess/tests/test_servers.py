@@ -0,0 +1,91 @@
+from unittest import mock
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase
+from assessment.assess import models, servers
+from assessment.tests import base
+
+
+class FileServerTests(TestCase):
+    """
+        SupportingDoc files download through the configured file server, once permissions are checked
+    """
+    CONTENT = b'0123456789' * 10
+
+    def setUp(self):
+        super().setUp()
+        category = base.create_assessment_categories()[0]
+        base.create_question_metric_set(category, 'Question 1', 1)
+        self.user = base.create_user('Assessor')
+        record = base.create_assessment(self.user, category, 'Subject')
+        self.doc = models.SupportingDoc.objects.create(score=record.score_set.get(),
+                                                       file=SimpleUploadedFile('data.csv', self.CONTENT))
+        self.url = self.doc.href
+
+    def use_server(self, name):
+        patcher = mock.patch.object(models.appConfig, 'settings', models.appConfig.settings._replace(FILE_SERVER=name))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def get(self, **headers):
+        self.client.login(username=self.user.username, password='password')
+        return self.client.get(self.url, **headers)
+
+    def test_django(self):
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+        response = self.get()
+        self.assertEqual(b''.join(response.streaming_content), self.CONTENT)
+        self.assertEqual((response['Content-Type'], response['Content-Length']), ('text/csv', '100'))
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertIn('no-cache', response['Cache-Control'])
+        self.assertIn('data', response['Content-Disposition'])
+
+    def test_range(self):
+        for header, status, content_range, content in (
+            ('bytes=10-19', 206, 'bytes 10-19/100', self.CONTENT[10:20]),
+            ('bytes=90-', 206, 'bytes 90-99/100', self.CONTENT[90:]),
+            ('bytes=-5', 206, 'bytes 95-99/100', self.CONTENT[95:]),
+            ('bytes=95-200', 206, 'bytes 95-99/100', self.CONTENT[95:]),
+            ('bytes=100-', 416, 'bytes */100', b''),
+        ):
+            with self.subTest(header=header):
+                response = self.get(HTTP_RANGE=header)
+                self.assertEqual((response.status_code, response['Content-Range']), (status, content_range))
+                body = b''.join(response.streaming_content) if response.streaming else response.content
+                self.assertEqual(body, content)
+        response = self.get(HTTP_RANGE='bytes=0-1,5-6')  # multiple ranges are not supported - whole file
+        self.assertEqual((response.status_code, response['Content-Length']), (200, '100'))
+        response = self.get(HTTP_RANGE='bytes=5-2')  # invalid range is ignored - whole file
+        self.assertEqual((response.status_code, response['Content-Length']), (200, '100'))
+        self.assertEqual(b''.join(response.streaming_content), self.CONTENT)
+
+    def test_content_disposition(self):
+        for filename, expected in (
+            ('data.csv', 'inline; filename="data.csv"'),
+            ('say "hi".txt', 'inline; filename="say \\"hi\\".txt"'),
+            ('résumé.pdf', "inline; filename*=utf-8''r%C3%A9sum%C3%A9.pdf"),
+        ):
+            with self.subTest(filename=filename):
+                self.assertEqual(servers.content_disposition(filename), expected)
+
+    def test_offload(self):
+        self.use_server('apache')
+        response = self.get()
+        self.assertEqual((response['X-Sendfile'], response.content), (self.doc.file.path, b''))
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.use_server('nginx')
+        response = self.get()
+        self.assertEqual(response['X-Accel-Redirect'], '/private-x-accel-redirect/' + self.doc.file.name)
+        self.assertEqual(response.content, b'')
+
+    def test_not_found(self):
+        self.client.login(username=self.user.username, password='password')
+        link = base.create_support_document_link(score=self.doc.score)
+        self.assertEqual(self.client.get(link.get_file_url()).status_code, 404)
+        self.doc.file.storage.delete(self.doc.file.name)
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+    def test_get_server_class(self):
+        self.assertIs(servers.get_server_class('assessment.assess.servers.XSendfileServer'), servers.XSendfileServer)
+        with self.assertRaises(ImproperlyConfigured):
+            servers.get_server_class('lighttpd')
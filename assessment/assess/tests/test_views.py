@@ -1,5 +1,16 @@
-from django.test import TestCase
+import csv, io, uuid
+from unittest import mock
+from django import http
+from django.core.cache import cache
+from django.db import connection
+from django.template import engines
+from django.test import TestCase, RequestFactory
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django_tables2 import RequestConfig
+from assessment.builder import taxonomy
+from assessment.assess import models, choices, tables, views
+from assessment.assess.permissions import get_permissions_context_from_request
 from assessment.tests import base
 
 
@@ -64,6 +75,95 @@ class SuccessAssessmentCategoryViewTests(BaseTestWithUsers):
 
 
 
+class AssessmentCategoryViewQueryTests(BaseTestWithUsers):
+    """
+        Table views should load a fixed number of queries, regardless of the number of rows displayed
+    """
+    def setUp(self):
+        super().setUp()
+        taxonomy.get_snapshot()  # builder taxonomy is loaded once per process, not per request
+
+    def get_category_view(self):
+        url = reverse('assessment.assess:category', args=(self.category.slug,))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, "Category view returned non-success status code.")
+        return len(queries)
+
+    def get_topic_view(self):
+        url = reverse('assessment.assess:topic', args=(self.category.topic.slug,))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, "Topic view returned non-success status code.")
+        return len(queries)
+
+    def test_topic_view_queries(self):
+        self.login(self.restrictedUser)
+        group = base.create_assessment_group(self.privilegedUser, topic=self.category.topic)
+        group.create_assessment_set_from_template(self.assessment)
+        num_queries = self.get_topic_view()
+        for i in range(5):
+            group = base.create_assessment_group(self.privilegedUser, topic=self.category.topic)
+            group.create_assessment_set_from_template(base.create_assessment(self.privilegedUser, self.category, str(i)))
+        self.assertEqual(self.get_topic_view(), num_queries)
+
+    def test_topic_view_subject_filter_and_sort(self):
+        self.login(self.restrictedUser)
+        for label in ('Zaphod', 'Arthur'):
+            group = base.create_assessment_group(self.privilegedUser, topic=self.category.topic)
+            group.create_assessment_set_from_template(base.create_assessment(self.privilegedUser, self.category, label))
+        url = reverse('assessment.assess:topic', args=(self.category.topic.slug,))
+        response = self.client.get(url, {'sort': 'subject'})
+        self.assertEqual(response.status_code, 200, "Topic view returned non-success status code.")
+        content = response.content.decode()
+        self.assertLess(content.index('Arthur'), content.index('Zaphod'))
+        response = self.client.get(url, {'subject': 'zap'})
+        self.assertContains(response, 'Zaphod', count=1)
+        self.assertNotContains(response, 'Arthur')
+
+    def test_matrix_view_queries(self):
+        url = reverse('assessment.assess:matrix')
+        self.client.get(url)
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertContains(response, self.category.label)
+        self.category.label = 'Relabelled Category'
+        self.category.save()
+        self.assertContains(self.client.get(url), 'Relabelled Category')
+
+    def test_matrix_invalidated_from_other_process(self):
+        url = reverse('assessment.assess:matrix')
+        self.client.get(url)
+        models.AssessmentCategory.objects.filter(pk=self.category.pk).update(label='Relabelled Category')
+        cache.set(taxonomy.VERSION_KEY, uuid.uuid4().hex, timeout=taxonomy.VERSION_TIMEOUT)  # in another process
+        self.assertContains(self.client.get(url), 'Relabelled Category')
+
+    def test_matrix_heatmap(self):
+        url = reverse('assessment.assess:matrix')
+        models.MetricScore.objects.filter(assessment=self.assessment).update(score=2)
+        base.create_assessment(self.privilegedUser, self.category, 'QC', assessment_type=choices.QC_ASSESSMENT_TYPE)
+        self.client.get(url)
+        with self.assertNumQueries(1):  # one aggregate query for the whole heatmap
+            response = self.client.get(url, {'heatmap': 1})
+        self.assertContains(response, 'heatmap-cell', count=1)
+        self.assertContains(response, '({})'.format(models.AssessmentRecord.objects.complete().count()))
+
+        def heatmap_cells(**params):
+            view = self.client.get(url, dict(heatmap=1, **params)).context['view']
+            return [cell for row in view.get_heatmap() for cell in row if cell]
+
+        cell, = heatmap_cells(assessment_type=choices.QC_ASSESSMENT_TYPE)
+        self.assertEqual((cell.records, cell.mean), (1, 0))
+        self.assertEqual(heatmap_cells(created_after='2000-01-01', created_before='2000-12-31'), [])
+
+    def test_category_view_queries(self):
+        self.login(self.restrictedUser)
+        num_queries = self.get_category_view()
+        for i in range(5):
+            base.create_assessment(self.privilegedUser, self.category, "Assessment {}".format(i))
+        self.assertEqual(self.get_category_view(), num_queries)
+
+
 class DeniedAssessmentCategoryViewTests(BaseTestWithUsers) :
     """
         DENIED -- test under-privileged user or otherwise makes unreasonable requests
@@ -97,7 +197,16 @@ class SuccessAssessmentRecordViewTests(BaseTestWithUsers):
         self.assertEqual(response.status_code, 200, "Create view returned non-success status code.")
         self.assertContains(response, 'form', msg_prefix="Detail view doesn't show a form.")
 
-    def test_record_detail_view(self):
+    def test_record_create_view_new_category(self):
+        version = taxonomy.get_snapshot().version
+        category = base.create_assessment_categories(activity_names=('New Activity', ), topic_names=('New Topic', ))[0]
+        cache.set(taxonomy.VERSION_KEY, version, timeout=taxonomy.VERSION_TIMEOUT)  # not yet seen by this process
+        self.assertIsNone(taxonomy.get_snapshot().get_category(category.slug))
+        self.login(self.privilegedUser)
+        url = reverse('assessment.assess:create', args=(category.slug, ))
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, "Create view returned non-success status code.")
+
         # Any authenticated user can view records
         self.login(self.restrictedUser)
         url = self.assessment.get_absolute_url()
@@ -230,3 +339,265 @@ class DeniedAssessmentGroupViewTests(BaseTestWithUsers):
         url = self.activity_group.get_delete_url()
         response = self.client.get(url)
         self.assertEqual(response.status_code, 403, "View returned non-denied status code for anonymous user.")
+
+
+class AssessmentUpdateViewSaveTests(BaseTestWithUsers):
+    """
+        Update views save only the metric scores and supporting docs that changed, in bulk
+    """
+    def setUp(self):
+        super().setUp()
+        self.activity_group = base.create_assessment_group(self.privilegedUser, activity=self.category.activity)
+        self.activity_group.create_assessment_set_from_template(self.assessment)
+        self.login(self.privilegedUser)
+
+    def post_data(self, status, scores, changes=None, new_doc=None):
+        """ Return POST data for the update form, with changes: {score.pk: {field: value}} for metric forms """
+        data = {'status': status}
+        for score in scores:
+            prefix = 'score-{pk}'.format(pk=score.pk)
+            values = dict(applicable='on' if score.applicable else '', score=score.score, comments=score.comments,
+                          metric=score.metric_id, assessment=score.assessment_id)
+            values.update((changes or {}).get(score.pk, {}))
+            data.update({'{prefix}-{field}'.format(prefix=prefix, field=field): value
+                         for field, value in values.items() if value != ''})
+            data.update({
+                '{prefix}-docs-TOTAL_FORMS'.format(prefix=prefix): 1,
+                '{prefix}-docs-INITIAL_FORMS'.format(prefix=prefix): 0,
+                '{prefix}-docs-0-document_type'.format(prefix=prefix): choices.DOCUMENT_TYPE_NONE,
+                '{prefix}-docs-0-document_location'.format(prefix=prefix): choices.DOCUMENT_LOCATION_ATTACHED,
+            })
+            if new_doc and score.pk == new_doc:
+                data['{prefix}-docs-0-description'.format(prefix=prefix)] = 'New supporting doc'
+                data['{prefix}-docs-0-url'.format(prefix=prefix)] = 'https://example.com/doc.txt'
+        return data
+
+    def test_record_update_post(self):
+        scores = list(self.assessment.score_set.all())
+        data = self.post_data(choices.COMPLETE_STATUS, scores, changes={scores[0].pk: {'score': 2}}, new_doc=scores[1].pk)
+        response = self.client.post(self.assessment.get_update_url(), data)
+        self.assertEqual(response.status_code, 302, "Update view did not redirect after a successful save.")
+        record = models.AssessmentRecord.objects.get(pk=self.assessment.pk)
+        self.assertEqual(record.status, choices.COMPLETE_STATUS)
+        self.assertEqual(record.score_sum, 2)
+        self.assertEqual(models.MetricScore.objects.get(pk=scores[0].pk).score, 2)
+        self.assertEqual([str(doc) for doc in models.SupportingDoc.objects.filter(score=scores[1])],
+                         ['https://example.com/doc.txt'])
+
+    def test_save_metric_forms_returns_all_scores(self):
+        scores = list(self.assessment.score_set.all())
+        data = self.post_data(choices.COMPLETE_STATUS, scores, changes={scores[0].pk: {'score': 2}})
+        save_metric_forms = views.AssessmentRecordUpdateView.save_metric_forms
+        saved = []
+        def capture(view, metric_forms):
+            saved.extend(save_metric_forms(view, metric_forms))
+        with mock.patch.object(views.AssessmentRecordUpdateView, 'save_metric_forms', capture):
+            self.client.post(self.assessment.get_update_url(), data)
+        self.assertEqual([score.pk for score in saved], [score.pk for score in scores])
+        self.assertEqual(saved[0].score, 2)
+
+    def test_group_update_post_queries(self):
+        # Saving a group issues a fixed number of queries, regardless of the number of metric scores that change
+        scores = list(self.activity_group.score_set.all())
+        def post(changes):
+            data = self.post_data(choices.COMPLETE_STATUS, scores, changes=changes)
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.post(self.activity_group.get_update_url(), data)
+            self.assertEqual(response.status_code, 302, "Update view did not redirect after a successful save.")
+            return len(queries)
+        num_queries = post({scores[0].pk: {'score': 1}})
+        self.assertEqual(post({score.pk: {'score': 2, 'comments': 'Changed'} for score in scores}), num_queries)
+        self.assertTrue(all(score.score == 2 for score in self.activity_group.score_set.all()))
+        group = models.AssessmentGroup.objects.get(pk=self.activity_group.pk)
+        self.assertEqual(group.status, choices.COMPLETE_STATUS)
+        self.assertEqual(group.avg_score, 2)
+
+
+class ScoreBadgeTests(BaseTestWithUsers):
+    """
+        Score badge is shown only for records with applicable scores
+    """
+    def render_badge(self, record):
+        return tables.RecordScoreColumn.TEMPLATE.render(context=dict(record=record)).strip()
+
+    def test_scored(self):
+        record = models.AssessmentRecord.summaries.get(pk=self.assessment.pk)
+        self.assertIn('badge', self.render_badge(record))
+
+    def test_not_applicable(self):
+        models.MetricScore.objects.filter(assessment=self.assessment).update(applicable=False)
+        record = models.AssessmentRecord.summaries.get(pk=self.assessment.pk)
+        self.assertTrue(record.score_set.exists())
+        self.assertEqual(self.render_badge(record), '', 'Record scored all N/A should have no badge')
+
+
+class TemplateRenderedColumnTests(BaseTestWithUsers):
+    """
+        Table cells rendered from shared fragments are identical to cells rendered from the column templates
+    """
+    def setUp(self):
+        super().setUp()
+        self.activity_group = base.create_assessment_group(self.privilegedUser, activity=self.category.activity)
+        self.activity_group.create_assessment_set_from_template(self.assessment)
+        for i, score in enumerate(models.MetricScore.objects.all()):
+            score.score = i % 3
+            score.save()
+
+    def assertCellsMatchTemplates(self, table_class, records, user):
+        request = RequestFactory().get('/')
+        request.user = user
+        table = table_class(records, request=request)
+        permissions = get_permissions_context_from_request(request)
+        for row in table.rows:
+            for name in ('status', 'score', 'actions'):
+                column = table.columns[name].column
+                if column.accessor.resolve(row.record) is None:  # table renders its default for empty values
+                    continue
+                kwargs = dict(permissions) if name == 'actions' else {}
+                expected = column.get_template().render(context=dict(kwargs, record=row.record))
+                self.assertEqual(row.get_cell(name), expected)
+
+    def test_record_cells(self):
+        records = models.AssessmentRecord.summaries.all()
+        self.assertCellsMatchTemplates(tables.CategoryAssessmentsTable, records, self.privilegedUser)
+        self.assertCellsMatchTemplates(tables.CategoryAssessmentsTable, records, self.restrictedUser)
+
+    def test_group_cells(self):
+        groups = models.AssessmentGroup.summaries.all()
+        self.assertCellsMatchTemplates(tables.AssessmentSetTable, groups, self.privilegedUser)
+
+    def test_overridden_actions_template(self):
+        self.assertTrue(tables.RecordActionsColumn().share_fragments)
+        class ProjectActionsColumn(tables.RecordActionsColumn):
+            TEMPLATE = engines['django'].from_string('{{ record.status }}:{{ record.pk }}')
+        column = ProjectActionsColumn()
+        self.assertFalse(column.share_fragments)
+        records = [self.assessment, self.draft_assessment]
+        self.assertEqual([column.render(record) for record in records],
+                         ['{r.status}:{r.pk}'.format(r=record) for record in records])
+        self.assertTrue(ProjectActionsColumn(share_fragments=True).share_fragments)
+
+
+class KeysetPaginationTests(BaseTestWithUsers):
+    """
+        Keyset pagination visits every row once, in table order, at the same cost for every page
+    """
+    PER_PAGE = 3
+
+    def setUp(self):
+        super().setUp()
+        for i in range(8):
+            record = base.create_assessment(self.privilegedUser, self.category, 'Assessment {}'.format(i))
+            models.MetricScore.objects.filter(assessment=record).update(score=i % 3, applicable=i % 4 != 0)
+        self.records = models.AssessmentRecord.summaries.filter(category=self.category)
+
+    def get_table(self, cursor=None, order_by=None):
+        request = RequestFactory().get('/', {'sort': order_by} if order_by else {})
+        request.user = self.privilegedUser
+        table = tables.CategoryAssessmentsTable(self.records)
+        paginate = dict(paginator_class=tables.KeysetPaginator, per_page=self.PER_PAGE, cursor=cursor)
+        return RequestConfig(request, paginate=paginate).configure(table)
+
+    def walk(self, order_by, cursor=None, forward=True):
+        """ Return list of (cursor, page pks) for each page visited following cursors from the given page """
+        pages = []
+        while True:
+            page = self.get_table(cursor, order_by).page
+            pages.append((cursor, [row.record.pk for row in page.object_list]))
+            cursor = page.next_cursor if forward else page.previous_cursor
+            if cursor is None:
+                return pages
+
+    def test_pages(self):
+        for order_by in ('score', '-score', 'created', '-subject', None):
+            pages = self.walk(order_by)
+            pks = [pk for _, page in pages for pk in page]
+            self.assertEqual(sorted(pks), sorted(r.pk for r in self.records), order_by)
+            self.assertTrue(all(len(page) == self.PER_PAGE for _, page in pages[:-1]))
+            backwards = self.walk(order_by, cursor=pages[-1][0], forward=False)
+            self.assertEqual([page for _, page in backwards][::-1], [page for _, page in pages])
+        # nulls sort last, ties are broken by pk
+        expected = sorted(self.records, key=lambda r: (r.avg_score is None, r.avg_score or 0, r.pk))
+        self.assertEqual([pk for _, page in self.walk('score') for pk in page], [r.pk for r in expected])
+
+    def test_page_queries(self):
+        first = self.get_table()
+        with self.assertNumQueries(1):
+            first = self.get_table()
+            list(first.paginated_rows)
+        with self.assertNumQueries(1):
+            page = self.get_table(first.page.next_cursor).page
+            list(page.object_list)
+
+    def test_invalid_cursor(self):
+        first = self.get_table().page
+        self.assertFalse(first.has_previous())
+        records = [row.record for row in first]
+        for cursor in ('garbage', first.next_cursor + 'x'):
+            self.assertEqual([row.record for row in self.get_table(cursor).page], records)
+        # a cursor for a different sort order starts again from the first page
+        self.assertFalse(self.get_table(first.next_cursor, order_by='-created').page.has_previous())
+
+    def test_view(self):
+        view = views.AssessmentCategoryView.as_view(keyset_pagination=True, table_pagination={'per_page': self.PER_PAGE})
+        request = RequestFactory().get('/')
+        request.user = self.privilegedUser
+        response = view(request, slug=self.category.slug)
+        response.render()
+        self.assertContains(response, '?cursor=')
+        self.assertNotContains(response, '?page=')
+
+    def test_view_without_count(self):
+        view = views.AssessmentCategoryView.as_view(exact_count=False, table_pagination={'per_page': self.PER_PAGE})
+        request = RequestFactory().get('/', {'page': 2})
+        request.user = self.privilegedUser
+        with CaptureQueriesContext(connection) as queries:
+            response = view(request, slug=self.category.slug)
+            response.render()
+        self.assertContains(response, '?page=3')
+        self.assertFalse([query for query in queries if 'COUNT(' in query['sql']])
+
+
+class StreamingExportTests(BaseTestWithUsers):
+    """
+        Streaming CSV export yields a row for every filtered record, in a fixed number of queries
+    """
+    def setUp(self):
+        super().setUp()
+        taxonomy.get_snapshot()
+
+    def export(self, view_class, **params):
+        view = view_class.as_view(stream_export=True)
+        request = RequestFactory().get('/', dict(_export='csv', **params))
+        request.user = self.privilegedUser
+        with CaptureQueriesContext(connection) as queries:
+            response = view(request, slug=self.category.slug)
+            content = b''.join(response.streaming_content).decode()
+        return response, list(csv.reader(io.StringIO(content))), len(queries)
+
+    def test_category_export(self):
+        response, rows, num_queries = self.export(views.AssessmentCategoryView)
+        self.assertIsInstance(response, http.StreamingHttpResponse)
+        self.assertIn('attachment', response['Content-Disposition'])
+        self.assertEqual(rows[0], ['Status', 'Type', 'Subject', 'Score', 'Created', 'Assessed by'])
+        self.assertEqual(len(rows) - 1, models.AssessmentRecord.objects.filter(category=self.category).count())
+        self.assertIn(str(self.assessment.subject), [row[2] for row in rows])
+        for i in range(5):
+            base.create_assessment(self.privilegedUser, self.category, 'Assessment {}'.format(i))
+        _, rows, more_queries = self.export(views.AssessmentCategoryView, status=choices.COMPLETE_STATUS)
+        self.assertEqual(num_queries, 1)
+        self.assertEqual(more_queries, num_queries)
+        self.assertEqual(len(rows) - 1, models.AssessmentRecord.objects.filter(category=self.category).complete().count())
+        self.assertEqual({row[0] for row in rows[1:]}, {self.assessment.get_status_display()})
+
+    def test_group_export(self):
+        group = base.create_assessment_group(self.privilegedUser, topic=self.category.topic)
+        group.create_assessment_set_from_template(self.assessment)
+        view = views.TopicView.as_view(stream_export=True)
+        request = RequestFactory().get('/', {'_export': 'csv', 'sort': '-score'})
+        request.user = self.privilegedUser
+        response = view(request, slug=self.category.topic.slug)
+        rows = list(csv.reader(io.StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[1][2], str(self.assessment.subject))
+        self.assertEqual(rows[1][5], self.privilegedUser.get_full_name())
@@ -23,6 +23,10 @@ urlpatterns = [
 
     path('delete/<int:pk>/', views.AssessmentRecordDeleteView.as_view(), name='delete'),
 
+    path('docs/<int:pk>/', views.AssessmentRecordDocsView.as_view(), name='docs'),
+
+    path('docs/file/<int:pk>/', views.SupportingDocFileView.as_view(), name='doc-file'),
+
     # CRUD views for Assessment groups
     path('create/group/<slug:slug>/', views.AssessmentGroupCreateView.as_view(), name='group-create'),
 
@@ -32,4 +36,11 @@ urlpatterns = [
 
     path('delete/group/<int:pk>/', views.AssessmentGroupDeleteView.as_view(), name='group-delete'),
 
+    path('docs/group/<int:pk>/', views.AssessmentGroupDocsView.as_view(), name='group-docs'),
+
+    # Bulk export / import of assessment data
+    path('export/', views.AssessmentDataExportView.as_view(), name='export'),
+
+    path('import/', views.AssessmentDataImportView.as_view(), name='import'),
+
 ]
@@ -1,46 +1,97 @@
+import bisect, itertools, csv
+from collections import namedtuple
 from itertools import groupby
+from django.apps import apps
+from django.core.exceptions import ImproperlyConfigured, PermissionDenied
+from django.utils.cache import add_never_cache_headers
 from django.utils.functional import cached_property
 from django.shortcuts import get_object_or_404
 from django.urls import reverse
 from django.http import Http404
 from django.views import generic
+from django.db import transaction
 from django import http, urls
 import django.forms
 from assessment.helpers.algorithms import sparse_to_full_matrix, index_vector
-from assessment.assess import models, tables, filters
+from assessment.builder import taxonomy
+from assessment.assess import models, tables, filters, datasets, importers, archives, servers
 from .permissions import permissions, permission_required, get_permissions_context
 
+appConfig = apps.get_app_config('assess')
+
 
 # --------------------------------------------
 #  Category / Navigation views
 # --------------------------------------------
+HeatmapCell = namedtuple('HeatmapCell', ('mean', 'records', 'score_class', 'score_classes'))
+
+
 # No permission to view top-level matrix categories
 class AssessmentMatrixView(generic.ListView):
+    """ Matrix of active categories:  topics x activities, optionally with a heatmap of complete assessment scores """
     model = models.AssessmentCategory
-    queryset = models.AssessmentCategory.active.select_related('topic', 'activity')\
-                                               .order_by('topic__order', 'activity__order')
     context_object_name = 'categories'
     template_name = 'assessment/matrix.html'
+    heatmap_param = 'heatmap'
+    heatmap_filterset_class = filters.HeatmapFilter
+    matrix_cache_timeout = 60 * 60  # rendered matrix is cached per taxonomy version - expire it as a backstop
+
+    def get_queryset(self):
+        return self.taxonomy.categories  # ordered by topic, activity
+
+    @cached_property
+    def taxonomy(self):
+        return taxonomy.get_snapshot()
+
+    @property
+    def show_heatmap(self):
+        return self.heatmap_param in self.request.GET
+
+    @cached_property
+    def heatmap_filter(self):
+        records = models.AssessmentRecord.objects.complete().filter(category__in=self.taxonomy.categories)
+        return self.heatmap_filterset_class(self.request.GET, queryset=records)
+
+    def get_heatmap(self):
+        """ Return matrix of HeatmapCell (None where no complete records) laid out like the taxonomy matrix """
+        score_classes = appConfig.settings.SCORE_CLASSES
+        summary = self.heatmap_filter.qs.summarize('category__topic', 'category__activity')
+
+        def cell(values):
+            mean = values['score_sum'] / values['score_count'] if values['score_count'] else None
+            distribution = tuple((name, values['score_classes_{i}'.format(i=i)])
+                                 for i, (_, name) in enumerate(score_classes))
+            score_class = score_classes[bisect.bisect(score_classes, (mean or 0, ))][1]
+            return values['category__topic'], values['category__activity'], HeatmapCell(
+                mean, values['records'], score_class, distribution
+            )
+
+        topic_index = index_vector([topic.pk for topic in self.taxonomy.topics])
+        cells = sorted((cell(values) for values in summary), key=lambda c: topic_index[c[0]])
+        matrix = sparse_to_full_matrix(cells,
+                                       topic_index, lambda c: c[0],
+                                       index_vector([activity.pk for activity in self.taxonomy.activities]),
+                                       lambda c: c[1])
+        return [[c[2] if c else None for c in row] for row in matrix]
 
     def get_context_data(self, *args, **kwargs):
         context = super().get_context_data(*args, **kwargs)
-        categories = context[self.context_object_name]
-        activities = models.Activity.active.all()
-        topics = models.Topic.active.all()
-
-        context['activities'] = activities
-        context['topics'] = topics
-        matrix = sparse_to_full_matrix(categories,
-                                       index_vector(topics), lambda cat: cat.topic,
-                                       index_vector(activities), lambda cat: cat.activity,
-                                       empty_value=''
-                                       )
-        context['matrix'] = zip(topics, matrix)  # because its a pain otherwise in template logic.
+        context['activities'] = self.taxonomy.activities
+        context['topics'] = self.taxonomy.topics
+        cells = self.get_heatmap() if self.show_heatmap else itertools.repeat(itertools.repeat(None))
+        context['matrix'] = (  # rows of (category, heatmap cell) - lazy, so a cached rendered matrix costs nothing
+            (topic, zip(row, cell_row)) for (topic, row), cell_row in zip(self.taxonomy.matrix, cells)
+        )
+        if self.show_heatmap:
+            context['heatmap_filter'] = self.heatmap_filter
+        context['taxonomy_version'] = self.taxonomy.version  # key for rendered matrix in template fragment cache
+        context['matrix_cache_timeout'] = self.matrix_cache_timeout
         return context
 
 
 @permission_required(permissions.user_can_view_assessments)
 class AbstractGroupView(tables.BaseFilteredTableView):
+    queryset = models.AssessmentGroup.summaries.all()
     group_model = None  # Sub-classes MUST define the concrete group-type model
     slug_filter = ''    # Sub-classes MUST define a queryset filter key suitable for filtering Groups by slug
     table_class = tables.AssessmentSetTable
@@ -49,7 +100,9 @@ class AbstractGroupView(tables.BaseFilteredTableView):
 
     @cached_property
     def group(self):
-        return get_object_or_404(self.group_model.objects, slug=self.kwargs['slug'])
+        slug = self.kwargs['slug']
+        return taxonomy.get_snapshot().get_classification(self.group_model, slug) or \
+            get_object_or_404(self.group_model.objects, slug=slug)
 
     def get_context_data(self, **kwargs):
         kwargs['group'] = self.group
@@ -76,6 +129,7 @@ class TopicView(AbstractGroupView):
 
 @permission_required(permissions.user_can_view_assessments)
 class AssessmentCategoryView(tables.BaseFilteredTableView):
+    queryset = models.AssessmentRecord.summaries.all()
     table_class = tables.CategoryAssessmentsTable
     filterset_class = filters.CategoryAssessmentsFilter
 
@@ -83,7 +137,9 @@ class AssessmentCategoryView(tables.BaseFilteredTableView):
 
     @cached_property
     def category(self):
-        return get_object_or_404(models.AssessmentCategory.objects, slug=self.kwargs['slug'])
+        slug = self.kwargs['slug']
+        return taxonomy.get_snapshot().get_category(slug) or \
+            get_object_or_404(models.AssessmentCategory.objects, slug=slug)
 
     def get_context_data(self, **kwargs):
         kwargs['category'] = self.category
@@ -96,6 +152,7 @@ class AssessmentCategoryView(tables.BaseFilteredTableView):
 @permission_required(permissions.user_can_view_assessments)
 class AssessmentRecordDetailView(generic.DetailView):
     model = models.AssessmentRecord
+    queryset = model.objects.with_score_set()
     context_object_name = 'assessment_record'
     template_name = 'assessment/record/detail.html'
 
@@ -121,7 +178,9 @@ class AssessmentRecordCreateView(generic.CreateView):
 
     @cached_property
     def category(self):
-        return get_object_or_404(models.AssessmentCategory.active, slug=self.kwargs['slug'])
+        slug = self.kwargs['slug']
+        return taxonomy.get_snapshot().get_category(slug) or \
+            get_object_or_404(models.AssessmentCategory.active, slug=slug)
 
     def get_success_url(self):
         """ On success, we move directly to the update view so user can edit the MetricScores for this assessment """
@@ -188,7 +247,7 @@ class AssessmentRecordUpdateView(generic.UpdateView):
     """ Update the AssessmentRecord's status and metric_set """
     model = models.AssessmentRecord
     context_object_name = 'record'
-    queryset = model.objects.all()  # Prefetch related is on objects manager
+    queryset = model.objects.with_score_set()
     form_class = django.forms.modelform_factory(model, fields=('status', ))
     docs_formset_class = django.forms.inlineformset_factory(
         models.MetricScore,
@@ -249,16 +308,38 @@ class AssessmentRecordUpdateView(generic.UpdateView):
         return self.docs_formset_class(**kwargs)
 
     def save_metric_forms(self, metric_forms):
-        scores = []
-        for form in metric_forms:
-            scores.append(form.save())
-            form.docs_formset.save()
-        return scores
+        """
+            Save changed metric scores with one bulk update, and changes to their supporting docs in batches.
+            Returns the list of metric scores for all the forms, changed or not.
+        """
+        changed_forms = [form for form in metric_forms if form.has_changed()]
+        changed_scores = [form.save(commit=False) for form in changed_forms]
+        fields = sorted({field for form in changed_forms for field in form.changed_data if field in form.Meta.fields})
+        if fields:
+            models.MetricScore.objects.bulk_update(changed_scores, fields)  # Note: also updates stored score summaries
+        self.save_docs_formsets([form.docs_formset for form in metric_forms if form.docs_formset.has_changed()])
+        return [form.instance for form in metric_forms]
+
+    @staticmethod
+    def save_docs_formsets(docs_formsets):
+        """ Save all new, changed, and deleted supporting docs from the given formsets """
+        new_docs, deleted_docs = [], []
+        for formset in docs_formsets:
+            formset.save(commit=False)
+            new_docs.extend(formset.new_objects)
+            deleted_docs.extend(formset.deleted_objects)
+            for doc, changed_fields in formset.changed_objects:
+                doc.save()  # rare - and a replaced file must be committed to storage
+        if new_docs:
+            models.SupportingDoc.objects.bulk_create(new_docs)
+        if deleted_docs:
+            models.SupportingDoc.objects.filter(pk__in=[doc.pk for doc in deleted_docs]).delete()
 
     def forms_valid(self, form, metric_forms):
         """ If the forms are valid, save the associated models. """
-        self.object = form.save()
-        self.save_metric_forms(metric_forms)
+        with transaction.atomic():
+            self.object = form.save()
+            self.save_metric_forms(metric_forms)
         return http.HttpResponseRedirect(self.get_success_url())
 
     def forms_invalid(self, form, metric_forms):
@@ -299,12 +380,50 @@ class AssessmentRecordDeleteView(generic.edit.DeleteView):
         return reverse('assessment.assess:category', args=(self.assessment.category.slug,))
 
 
+@permission_required(permissions.user_can_view_assessments)
+class SupportingDocFileView(generic.detail.SingleObjectMixin, generic.View):
+    """ Download a SupportingDoc's file, served by the configured file server once permissions are checked """
+    model = models.SupportingDoc
+
+    def get(self, request, *args, **kwargs):
+        doc = self.get_object()
+        if not doc.file:
+            raise Http404('Supporting document has no file')
+        if not servers.can_access(request, doc):
+            raise PermissionDenied('Supporting document access denied')
+        if not doc.file.storage.exists(doc.file.name):
+            raise Http404('File not found')
+        response = servers.get_file_server().serve(request, doc.file)
+        if appConfig.settings.USE_PRIVATE_FILES:
+            add_never_cache_headers(response)  # no copies in shared caches that bypass the permission check
+        return response
+
+
+@permission_required(permissions.user_can_view_assessments)
+class AssessmentRecordDocsView(generic.detail.SingleObjectMixin, generic.View):
+    """ Stream a ZIP archive of all the supporting documents for an AssessmentRecord, with a manifest of links """
+    model = models.AssessmentRecord
+    docs_filter = 'score__assessment'
+
+    def get_filename(self):
+        return '{model}-{pk}-supporting-docs.zip'.format(model=self.model._meta.model_name, pk=self.object.pk)
+
+    def get(self, request, *args, **kwargs):
+        self.object = self.get_object()
+        docs = archives.get_supporting_docs(**{self.docs_filter: self.object})
+        content = archives.iter_zip(docs.iterator(), archives.get_file_access_check(request))
+        response = http.StreamingHttpResponse(content, content_type='application/zip')
+        response['Content-Disposition'] = 'attachment; filename="{filename}"'.format(filename=self.get_filename())
+        return response
+
+
 # --------------------------------------------
 #  Assessment Group CRUD views
 # --------------------------------------------
 @permission_required(permissions.user_can_view_assessments)
 class AssessmentGroupDetailView(generic.DetailView):
     model = models.AssessmentGroup
+    queryset = model.objects.with_score_set()
     context_object_name = 'assessment_group'
     template_name = 'assessment/group/detail.html'
 
@@ -319,10 +438,14 @@ class AssessmentGroupCreateView(AssessmentRecordCreateView):
 
     def get_activity_and_topic(self):
         """ Returns (Activity, None) or (None, Topic) depending on the view's slug """
+        snapshot, slug = taxonomy.get_snapshot(), self.kwargs['slug']
+        activity, topic = snapshot.get_activity(slug), snapshot.get_topic(slug)
+        if activity or topic:
+            return (activity, None) if activity else (None, topic)
         try:
-            return models.Activity.objects.get(slug=self.kwargs['slug']), None
+            return models.Activity.objects.get(slug=slug), None
         except models.Activity.DoesNotExist:
-            return None, models.Topic.objects.get(slug=self.kwargs['slug'])
+            return None, models.Topic.objects.get(slug=slug)
 
     @cached_property
     def assessment_group(self):
@@ -363,7 +486,7 @@ class AssessmentGroupUpdateView(AssessmentRecordUpdateView):
     """ Same as updating AssessmentRecord except status and metric_set are housed on Group. """
     model = models.AssessmentGroup
     context_object_name = 'assessment_group'
-    queryset = model.objects.all()  # Prefetch related is on objects manager
+    queryset = model.objects.all()  # metric scores are loaded in one query by AssessmentGroup.score_set
     form_class = django.forms.modelform_factory(model, fields=('status', ))
     docs_formset_class = django.forms.inlineformset_factory(
         models.MetricScore,
@@ -400,3 +523,85 @@ class AssessmentGroupDeleteView(generic.edit.DeleteView):
         group_type = 'topic' if grp.is_topic_group else 'activity'
         slug = grp.topic.slug if grp.is_topic_group else grp.activity.slug
         return reverse('assessment.assess:{group_type}'.format(group_type=group_type), args=(slug,))
+
+
+@permission_required(permissions.user_can_view_assessments)
+class AssessmentGroupDocsView(AssessmentRecordDocsView):
+    """ Stream a ZIP archive of all the supporting documents for every AssessmentRecord in an AssessmentGroup """
+    model = models.AssessmentGroup
+    docs_filter = 'score__assessment__group'
+
+
+# --------------------------------------------
+#  Bulk data export / import
+# --------------------------------------------
+@permission_required(permissions.user_can_view_assessments)
+class AssessmentDataExportView(generic.View):
+    """
+        Stream a denormalized dataset of the filtered assessment records and their scores.
+        Query parameters:  layout (long | wide), format (jsonl | arrow), chunk_size, plus any DatasetFilter field.
+    """
+    filterset_class = filters.DatasetFilter
+    default_layout = datasets.LONG
+    default_format = 'jsonl'
+    chunk_size = 1000
+    max_chunk_size = 10000
+
+    def get_chunk_size(self):
+        try:
+            return max(1, min(int(self.request.GET.get('chunk_size', self.chunk_size)), self.max_chunk_size))
+        except ValueError:
+            return self.chunk_size
+
+    def get(self, request, *args, **kwargs):
+        filterset = self.filterset_class(request.GET, queryset=models.AssessmentRecord.summaries.all())
+        layout = request.GET.get('layout', self.default_layout)
+        export_format = request.GET.get('format', self.default_format)
+        if not filterset.is_valid() or layout not in datasets.LAYOUTS or export_format not in datasets.STREAM_FORMATS:
+            return http.HttpResponseBadRequest('Invalid export: layout must be one of {layouts}, format one of '
+                                               '{formats}. {errors}'.format(layouts=datasets.LAYOUTS,
+                                                                            formats=tuple(datasets.STREAM_FORMATS),
+                                                                            errors=filterset.errors.as_text()))
+        generate, content_type, extension = datasets.STREAM_FORMATS[export_format]
+        dataset = datasets.AssessmentDataset(filterset.qs, layout=layout, chunk_size=self.get_chunk_size())
+        try:
+            content = generate(dataset)
+        except ImproperlyConfigured as e:  # e.g., optional dependency for format is not installed
+            return http.HttpResponseBadRequest(str(e))
+        response = http.StreamingHttpResponse(content, content_type=content_type)
+        response['Content-Disposition'] = 'attachment; filename="assessments-{layout}.{extension}"'.format(
+            layout=layout, extension=extension
+        )
+        return response
+
+
+@permission_required(permissions.user_can_create_assessment)
+class AssessmentDataImportView(generic.View):
+    """
+        Import assessment records from an uploaded CSV, JSON or JSON Lines file - see assess.importers for its columns.
+        POST parameters:  file, format (default: from the file name), batch_size, dry_run.
+        Responds with the import report as JSON:  counts of rows and created objects, and the errors for rejected rows.
+    """
+    batch_size = 500
+    max_batch_size = 5000
+
+    def get_batch_size(self):
+        try:
+            return max(1, min(int(self.request.POST.get('batch_size', self.batch_size)), self.max_batch_size))
+        except ValueError:
+            return self.batch_size
+
+    def post(self, request, *args, **kwargs):
+        upload = request.FILES.get('file')
+        import_format = request.POST.get('format') or (importers.get_format(upload.name) if upload else None)
+        if upload is None or import_format not in importers.READERS:
+            return http.HttpResponseBadRequest('Invalid import: upload a file, format must be one of {formats}'.format(
+                formats=tuple(importers.READERS)
+            ))
+        dry_run = request.POST.get('dry_run', '').lower() in importers.TRUE_VALUES + ('on', )
+        try:
+            report = importers.import_file(upload, import_format, batch_size=self.get_batch_size(),
+                                           assessor=request.user, dry_run=dry_run)
+        except (ValueError, csv.Error) as e:
+            return http.HttpResponseBadRequest('Unable to read import file: {e}'.format(e=e))
+        return http.JsonResponse(report.as_dict())
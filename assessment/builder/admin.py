@@ -1,10 +1,16 @@
+from functools import update_wrapper
 from django.contrib import admin
+from django.core.exceptions import PermissionDenied, ValidationError
+from django.http import JsonResponse
+from django.urls import path, reverse
+from django.utils.html import format_html
 from django.utils.text import slugify
+from django.views.decorators.http import require_POST
 from django.db.models import TextField
 from django import forms
 
 from ordered_model.admin import OrderedModelAdmin, OrderedTabularInline, OrderedInlineModelAdminMixin
-from . import models
+from . import models, ordering
 
 
 class TextFieldMixin:
@@ -18,21 +24,78 @@ class InlineTextFieldMixin:
     }
 
 
+def reorder_handle(admin_site, obj, parent_id=''):
+    """ Drag handle for a row of ordered objects - reorder.js posts the complete order of the rows to the reorder url """
+    opts = obj._meta
+    url = reverse('{site}:{app}_{model}_reorder'.format(site=admin_site.name, app=opts.app_label, model=opts.model_name))
+    return format_html('<span class="reorder-handle" title="Drag to reorder" style="cursor:move" '
+                       'data-reorder-url="{}" data-pk="{}" data-parent="{}">&#9776;</span> ', url, obj.pk, parent_id)
+
+
+class BulkReorderAdminMixin:
+    """
+        OrderedModelAdmin with a reorder view that applies a complete ordering in one bulk update.
+        The change list rows are drag-and-drop ordered, for models not ordered with respect to a parent.
+    """
+    class Media:
+        js = ('builder/admin/reorder.js',)
+
+    def get_urls(self):
+        def wrap(view):
+            def wrapper(*args, **kwargs):
+                return self.admin_site.admin_view(view)(*args, **kwargs)
+            wrapper.model_admin = self
+            return update_wrapper(wrapper, view)
+
+        name = '{app}_{model}_reorder'.format(app=self.model._meta.app_label, model=self.model._meta.model_name)
+        return [path('reorder/', wrap(require_POST(self.reorder_view)), name=name)] + super().get_urls()
+
+    def reorder_view(self, request):
+        """ POST the complete order (list of pks) for the objects of one parent (pk), if ordered with respect to one """
+        if not self.has_change_permission(request):
+            raise PermissionDenied
+        try:
+            updated = ordering.reorder(self.model, request.POST.getlist('order'), request.POST.get('parent') or None)
+        except (ValidationError, ValueError) as e:
+            messages = e.messages if isinstance(e, ValidationError) else [str(e)]
+            return JsonResponse({'errors': messages}, status=400)
+        return JsonResponse({'updated': updated})
+
+    def move_up_down_links(self, obj):
+        links = super().move_up_down_links(obj)
+        if self.model.get_order_with_respect_to():
+            return links  # change list may include objects from any number of parents
+        return reorder_handle(self.admin_site, obj) + links
+
+
+class BulkReorderInlineMixin:
+    """ OrderedInline with drag-and-drop rows, reordered with the reorder view of the inline model's admin """
+    class Media:
+        js = ('builder/admin/reorder.js',)
+
+    def move_up_down_links(self, obj):
+        links = super().move_up_down_links(obj)
+        if not links:
+            return links
+        parent_field, = self.model.get_order_with_respect_to()
+        return reorder_handle(self.admin_site, obj, getattr(obj, parent_field + '_id')) + links
+
+
 @admin.register(models.Activity)
-class ActivityAdmin(TextFieldMixin, OrderedModelAdmin):
+class ActivityAdmin(TextFieldMixin, BulkReorderAdminMixin, OrderedModelAdmin):
     list_display = ('label', 'slug', 'status', 'move_up_down_links')
     list_editable = ('status',)
     prepopulated_fields = {"slug" : ("label",)}
 
 
 @admin.register(models.Topic)
-class TopicAdmin(TextFieldMixin, OrderedModelAdmin):
+class TopicAdmin(TextFieldMixin, BulkReorderAdminMixin, OrderedModelAdmin):
     list_display = ('label', 'slug', 'status', 'move_up_down_links')
     list_editable = ('status',)
     prepopulated_fields = {"slug" : ("label",)}
 
 
-class ReferenceDocumentTabularInline(InlineTextFieldMixin, OrderedTabularInline):
+class ReferenceDocumentTabularInline(InlineTextFieldMixin, BulkReorderInlineMixin, OrderedTabularInline):
     model = models.ReferenceDocument
     fields = ('label', 'description', 'url', 'order', 'move_up_down_links',)
     readonly_fields = ('order', 'move_up_down_links',)
@@ -40,7 +103,7 @@ class ReferenceDocumentTabularInline(InlineTextFieldMixin, OrderedTabularInline)
     extra = 1
 
 
-class AssessmentQuestionTabularInline(InlineTextFieldMixin, OrderedTabularInline):
+class AssessmentQuestionTabularInline(InlineTextFieldMixin, BulkReorderInlineMixin, OrderedTabularInline):
     model = models.AssessmentQuestion
     verbose_name_plural = "Qeustions"
     fields = ('label', 'description', 'status', 'order', 'move_up_down_links',)
@@ -72,7 +135,7 @@ class AssessmentCategoryAdmin(TextFieldMixin, OrderedInlineModelAdminMixin, admi
         super().save_model(request, obj, form, change)
 
 
-class AssessmentMetricTabularInline(InlineTextFieldMixin, OrderedTabularInline):
+class AssessmentMetricTabularInline(InlineTextFieldMixin, BulkReorderInlineMixin, OrderedTabularInline):
     model = models.AssessmentMetric
     verbose_name_plural = 'Metrics'
     fields = ('label', 'description', 'choices', 'status', 'order', 'move_up_down_links',)
@@ -82,13 +145,13 @@ class AssessmentMetricTabularInline(InlineTextFieldMixin, OrderedTabularInline):
 
 
 @admin.register(models.ReferenceDocument)
-class ReferenceDocumentAdmin(TextFieldMixin, OrderedInlineModelAdminMixin, OrderedModelAdmin):
+class ReferenceDocumentAdmin(TextFieldMixin, OrderedInlineModelAdminMixin, BulkReorderAdminMixin, OrderedModelAdmin):
     list_display = ('label', 'category', 'url', 'move_up_down_links')
     list_filter = ('category__activity', 'category__topic', )
 
 
 @admin.register(models.AssessmentQuestion)
-class AssessmentQuestionAdmin(TextFieldMixin, OrderedInlineModelAdminMixin, OrderedModelAdmin):
+class AssessmentQuestionAdmin(TextFieldMixin, OrderedInlineModelAdminMixin, BulkReorderAdminMixin, OrderedModelAdmin):
     list_display = ('label', 'category', 'num_metrics', 'status', 'move_up_down_links')
     list_editable = ('status',)
     list_filter = ('status', 'category__activity', 'category__topic', )
@@ -103,7 +166,7 @@ class AssessmentQuestionAdmin(TextFieldMixin, OrderedInlineModelAdminMixin, Orde
 
 
 @admin.register(models.AssessmentMetric)
-class AssessmentMetricAdmin(TextFieldMixin, OrderedModelAdmin):
+class AssessmentMetricAdmin(TextFieldMixin, BulkReorderAdminMixin, OrderedModelAdmin):
     list_display = ('label', 'question', 'choices', 'status', 'move_up_down_links')
     list_editable = ('status',)
     list_filter = ('status', 'question__category__activity', 'question__category__topic', )
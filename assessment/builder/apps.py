@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class BuilderConfig(AppConfig):
     name = 'assessment.builder'
     verbose_name = 'Assessment Builder'
+
+    def ready(self):
+        from assessment.builder import checks, signals  # noqa: register system checks, connect signal receivers
@@ -0,0 +1,60 @@
+"""
+    Cached category "blueprints": the ordered question and metric ids that make up each AssessmentCategory.
+    Creating an AssessmentRecord needs only its category's blueprint to create the complete set of MetricScores.
+    Blueprints are cached with the django cache framework under the taxonomy version;  any change to the builder
+        taxonomy starts a new version, which invalidates all cached blueprints (see builder.taxonomy).
+    A stale blueprint would create scores for deleted or retired metrics, so blueprints are only as fresh as the version:
+        the default cache must be shared by all processes (see builder.checks).  Blueprints also expire after
+        BLUEPRINT_TIMEOUT seconds, as a backstop.
+"""
+from collections import namedtuple
+from django.core.cache import cache
+from assessment.builder.taxonomy import get_version
+
+
+BLUEPRINT_KEY = 'assessment.builder.blueprints.{version}.{category_id}'
+BLUEPRINT_TIMEOUT = 60 * 60
+
+CategoryBlueprint = namedtuple('CategoryBlueprint', ('question_ids', 'metric_ids'))
+
+
+def build_blueprints(category_ids):
+    """ Return dict of CategoryBlueprint, in question / metric order, for given category ids, built in one query """
+    from assessment.builder.models import AssessmentQuestion
+    questions = AssessmentQuestion._base_manager.filter(category_id__in=category_ids)\
+                                                .order_by('order', 'pk', 'metric_set__order')\
+                                                .values_list('category_id', 'pk', 'metric_set__pk')
+    blueprints = {category_id: ([], []) for category_id in category_ids}
+    for category_id, question_id, metric_id in questions:
+        question_ids, metric_ids = blueprints[category_id]
+        if not question_ids or question_ids[-1] != question_id:
+            question_ids.append(question_id)
+        if metric_id is not None:
+            metric_ids.append(metric_id)
+    return {
+        category_id: CategoryBlueprint(tuple(question_ids), tuple(metric_ids))
+        for category_id, (question_ids, metric_ids) in blueprints.items()
+    }
+
+
+def get_blueprints(category_ids):
+    """ Return dict of CategoryBlueprint for given category ids, building and caching any that are not cached """
+    category_ids = set(category_ids)
+    if not category_ids:
+        return {}
+    version = get_version()
+    keys = {BLUEPRINT_KEY.format(version=version, category_id=category_id): category_id for category_id in category_ids}
+    cached = cache.get_many(keys.keys())
+    blueprints = {keys[key]: CategoryBlueprint(*blueprint) for key, blueprint in cached.items()}
+    missing = category_ids.difference(blueprints)
+    if missing:
+        built = build_blueprints(missing)
+        cache.set_many({BLUEPRINT_KEY.format(version=version, category_id=category_id): tuple(blueprint)
+                        for category_id, blueprint in built.items()}, timeout=BLUEPRINT_TIMEOUT)
+        blueprints.update(built)
+    return blueprints
+
+
+def get_blueprint(category_id):
+    """ Return the CategoryBlueprint for a single category id """
+    return get_blueprints((category_id, ))[category_id]
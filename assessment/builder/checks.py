@@ -0,0 +1,26 @@
+""" System checks for the builder app """
+from django.conf import settings
+from django.core import checks
+from django.core.cache import DEFAULT_CACHE_ALIAS
+from django.core.cache.backends.locmem import LocMemCache
+from django.utils.module_loading import import_string
+from assessment.builder.taxonomy import VERSION_TIMEOUT
+
+
+@checks.register(checks.Tags.caches)
+def check_taxonomy_cache(app_configs, **kwargs):
+    """ The taxonomy version (see builder.taxonomy) must be kept in a cache shared by every process """
+    try:
+        backend = import_string(settings.CACHES[DEFAULT_CACHE_ALIAS]['BACKEND'])
+    except (KeyError, ImportError):
+        return []  # reported by django's own cache checks
+    if not issubclass(backend, LocMemCache):
+        return []
+    return [checks.Warning(
+        'The default cache is local to each process:  a change to the assessment builder taxonomy is only seen by '
+        'the process that makes it, other processes keep using their stale taxonomy, blueprints and matrix until '
+        'the taxonomy version expires (every {} minutes).'.format(VERSION_TIMEOUT // 60),
+        hint='Configure a default cache shared by all processes (e.g., memcached, redis or database cache), '
+             'or silence this check for a single-process deployment.',
+        id='builder.W001',
+    )]
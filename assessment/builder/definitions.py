@@ -0,0 +1,343 @@
+"""
+    Export and import the complete builder taxonomy - the definition of an assessment program - as one document:
+        metric choices types, activities, topics, and categories, each with its reference documents and questions,
+        and each question with its metrics.
+    Objects are identified by natural keys, not pks, so a definition can be moved between databases:
+        activities, topics and categories by slug;  questions by label within their category, metrics by label within
+        their question, reference documents by label within their category;  choices types by label and choice map.
+    Order is given by position in the document.  Import diffs the document against the existing taxonomy, then applies
+        creates and updates with bulk queries and explicit order values, bypassing OrderedModel's reordering on save.
+        Existing objects that are not in the document are left as they are, except their order:  they are placed
+        after the imported objects with the same parent, in their existing order, so order values stay unique.
+    Documents are JSON, or YAML if PyYAML is installed.
+"""
+import json
+from django.core.exceptions import ValidationError, ImproperlyConfigured
+from django.db import transaction, connections, router, IntegrityError
+from django.db.models import Model
+from django.utils.text import slugify
+from assessment.builder import models, choices, taxonomy
+
+FORMAT_VERSION = 1
+
+FORMATS = ('json', 'yaml')
+
+
+def _fields(obj, *names):
+    return {name: getattr(obj, name) for name in names}
+
+
+def _choice_items(choice_map):
+    """ Return a choice map JSON string as a tuple of (label, value) items, or None if it is not valid """
+    try:
+        return tuple(json.loads(choice_map).items())
+    except (ValueError, AttributeError):
+        return None
+
+
+# -----------  Export -------------- #
+
+
+def export_definitions():
+    """ Return the complete taxonomy as a definitions document (a dict), built in one query per model """
+    choices_keys, definitions = {}, {}
+    for choices_type in models.MetricChoicesType.objects.order_by('pk'):
+        definition = (choices_type.label, _choice_items(choices_type.choice_map))
+        if definition not in definitions:  # identical choices types are exported once, with a unique key
+            key = base = slugify(choices_type.label) or 'choices'
+            n = 1
+            while key in definitions.values():
+                n += 1
+                key = '{base}-{n}'.format(base=base, n=n)
+            definitions[definition] = key
+        choices_keys[choices_type.pk] = definitions[definition]
+
+    metrics, questions, reference_docs = {}, {}, {}
+    for metric in models.AssessmentMetric._base_manager.order_by('order', 'pk'):
+        metrics.setdefault(metric.question_id, []).append(
+            dict(_fields(metric, 'label', 'description', 'status'), choices=choices_keys[metric.choices_id])
+        )
+    for question in models.AssessmentQuestion._base_manager.order_by('order', 'pk'):
+        questions.setdefault(question.category_id, []).append(
+            dict(_fields(question, 'label', 'description', 'status'), metrics=metrics.get(question.pk, []))
+        )
+    for doc in models.ReferenceDocument._base_manager.order_by('order', 'pk'):
+        reference_docs.setdefault(doc.category_id, []).append(_fields(doc, 'label', 'description', 'url'))
+
+    classification_fields = ('slug', 'label', 'description', 'status')
+    categories = models.AssessmentCategory._base_manager.select_related('activity', 'topic')\
+                                                        .order_by('topic__order', 'activity__order', 'pk')
+    return dict(
+        version=FORMAT_VERSION,
+        choices=[dict(key=key, label=label, choice_map=dict(items or ())) for (label, items), key in definitions.items()],
+        activities=[_fields(activity, *classification_fields)
+                    for activity in models.Activity._base_manager.order_by('order', 'pk')],
+        topics=[_fields(topic, *classification_fields) for topic in models.Topic._base_manager.order_by('order', 'pk')],
+        categories=[
+            dict(_fields(category, *classification_fields), activity=category.activity.slug, topic=category.topic.slug,
+                 reference_docs=reference_docs.get(category.pk, []), questions=questions.get(category.pk, []))
+            for category in categories
+        ],
+    )
+
+
+# -----------  Formats -------------- #
+
+
+def get_yaml():
+    try:
+        import yaml
+    except ImportError:
+        raise ImproperlyConfigured('YAML definitions require PyYAML:  pip install pyyaml')
+    return yaml
+
+
+def get_format(filename, default='json'):
+    """ Return the definitions format for a file name, from its extension """
+    return 'yaml' if filename.lower().endswith(('.yaml', '.yml')) else default
+
+
+def dumps(document, definitions_format='json'):
+    """ Return the definitions document serialized as a JSON or YAML string """
+    if definitions_format == 'yaml':
+        return get_yaml().safe_dump(document, sort_keys=False, allow_unicode=True)
+    return json.dumps(document, indent=2, ensure_ascii=False) + '\n'
+
+
+def loads(content, definitions_format='json'):
+    """ Return the definitions document parsed from a JSON or YAML string """
+    if definitions_format == 'yaml':
+        return get_yaml().safe_load(content)
+    return json.loads(content)
+
+
+# -----------  Import -------------- #
+
+
+class DefinitionImporter:
+    """
+        Create and update the taxonomy from a definitions document.
+        The whole document is validated before anything is saved, then applied in one transaction, unless dry_run.
+    """
+    # fields set from the document for each model, in the order models must be saved
+    FIELDS = {
+        models.MetricChoicesType: ('label', 'choice_map'),
+        models.Activity: ('slug', 'label', 'description', 'status', 'order'),
+        models.Topic: ('slug', 'label', 'description', 'status', 'order'),
+        models.AssessmentCategory: ('slug', 'label', 'description', 'status', 'activity', 'topic'),
+        models.ReferenceDocument: ('label', 'description', 'url', 'category', 'order'),
+        models.AssessmentQuestion: ('label', 'description', 'status', 'category', 'order'),
+        models.AssessmentMetric: ('label', 'description', 'status', 'question', 'choices', 'order'),
+    }
+
+    def __init__(self, using=None, dry_run=False):
+        self.using = using or router.db_for_write(models.AssessmentCategory)
+        self.dry_run = dry_run
+        self.errors = []
+        self.created = {model: [] for model in self.FIELDS}
+        self.updated = {model: [] for model in self.FIELDS}
+
+    def run(self, document):
+        """ Import the definitions document, returning a dict of {model label: (created, updated)} counts """
+        self.load(document)
+        if self.errors:
+            raise ValidationError(self.errors)
+        if not self.dry_run:
+            self.save_all()
+        return {model._meta.label: (len(self.created[model]), len(self.updated[model])) for model in self.FIELDS}
+
+    def save_all(self):
+        try:
+            with transaction.atomic(using=self.using):
+                for model in self.FIELDS:
+                    self.save(model)
+                transaction.on_commit(taxonomy.invalidate, using=self.using)
+        except IntegrityError as e:  # e.g., a label must be unique among active activities or topics
+            raise ValidationError(str(e))
+        taxonomy.invalidate()  # bulk queries don't send the signals that invalidate the taxonomy (see builder.signals)
+
+    # -----------  Diff -------------- #
+
+    def error(self, path, message):
+        self.errors.append('{path}: {message}'.format(path=path, message=message))
+
+    def apply(self, model, obj, path, values):
+        """ Set values on obj (a new instance if None), validate them, and record whether it is created or updated """
+        obj = model() if obj is None else obj
+        attnames = [obj._meta.get_field(name).attname for name in self.FIELDS[model]]
+        before = [getattr(obj, name) for name in attnames]
+        for name, value in values.items():
+            setattr(obj, name, value)
+        try:
+            obj.clean_fields(exclude=[field.name for field in obj._meta.concrete_fields if field.is_relation])
+        except ValidationError as e:
+            for field, messages in e.message_dict.items():
+                self.errors.extend('{path}: {field}: {message}'.format(path=path, field=field, message=message)
+                                   for message in messages)
+        if obj.pk is None:
+            self.created[model].append(obj)
+        elif before != [getattr(obj, name) for name in attnames]:
+            self.updated[model].append(obj)
+        return obj
+
+    @staticmethod
+    def values(definition, *names):
+        """ Return dict of the named values from the definition, with a default for any that are missing """
+        defaults = dict(status=choices.ACTIVE_STATUS)
+        values = {name: definition.get(name) for name in names}
+        return {name: defaults.get(name, '') if value is None else value for name, value in values.items()}
+
+    @staticmethod
+    def match(existing, label):
+        """ Remove and return the next existing object with the label from a dict of lists of objects by label """
+        matches = existing.get(label)
+        return matches.pop(0) if matches else None
+
+    def reorder_remaining(self, model, remaining, start):
+        """ Order the existing objects missing from the document after the start imported objects with their parent """
+        for order, obj in enumerate(sorted(remaining, key=lambda obj: (obj.order, obj.pk)), start):
+            if obj.order != order:
+                obj.order = order
+                self.updated[model].append(obj)
+
+    @staticmethod
+    def remaining(existing):
+        """ Return list of the objects left in a dict of lists of objects by label, after matching """
+        return [obj for objects in existing.values() for obj in objects]
+
+    @staticmethod
+    def group_by(objects, parent, key='label'):
+        """ Return dict of {parent id: {key: [objects]}} for objects in order """
+        groups = {}
+        for obj in objects:
+            groups.setdefault(getattr(obj, parent), {}).setdefault(getattr(obj, key), []).append(obj)
+        return groups
+
+    def load(self, document):
+        """ Diff the document against the existing taxonomy, building the objects to create and update in memory """
+        if not isinstance(document, dict) or document.get('version') != FORMAT_VERSION:
+            self.errors.append('Not an assessment definitions document, version {version}'.format(version=FORMAT_VERSION))
+            return
+        self.load_choices(document.get('choices') or [])
+        classifications = {
+            model: self.load_classifications(model, name, document.get(name) or [])
+            for model, name in ((models.Activity, 'activities'), (models.Topic, 'topics'))
+        }
+        self.load_categories(document.get('categories') or [], classifications)
+
+    def load_choices(self, definitions):
+        choices_types = {}
+        for choices_type in models.MetricChoicesType.objects.using(self.using).order_by('pk'):
+            choices_types.setdefault((choices_type.label, _choice_items(choices_type.choice_map)), choices_type)
+        self.choices = {}
+        for i, definition in enumerate(definitions):
+            choice_map = definition.get('choice_map')
+            choice_map = choice_map if isinstance(choice_map, str) else json.dumps(choice_map, ensure_ascii=False)
+            values = dict(self.values(definition, 'label'), choice_map=choice_map)
+            key = (values['label'], _choice_items(choice_map))
+            if key not in choices_types:
+                choices_types[key] = self.apply(models.MetricChoicesType, None, 'choices[{i}]'.format(i=i), values)
+            self.choices[definition.get('key', values['label'])] = choices_types[key]
+
+    def load_classifications(self, model, name, definitions):
+        """ Return dict of the activities or topics, by slug, after applying their definitions """
+        existing = {obj.slug: obj for obj in model._base_manager.using(self.using)}
+        seen = set()
+        for order, definition in enumerate(definitions):
+            path = '{name}[{order}]'.format(name=name, order=order)
+            values = self.values(definition, 'slug', 'label', 'description', 'status')
+            if values['slug'] in seen:
+                self.error(path, 'duplicate slug {slug!r}'.format(slug=values['slug']))
+                continue
+            seen.add(values['slug'])
+            existing[values['slug']] = self.apply(model, existing.get(values['slug']), path, dict(values, order=order))
+        self.reorder_remaining(model, [obj for slug, obj in existing.items() if slug not in seen], len(definitions))
+        return existing
+
+    def load_categories(self, definitions, classifications):
+        categories = {obj.slug: obj for obj in models.AssessmentCategory._base_manager.using(self.using)}
+        pairs = {(category.activity_id, category.topic_id): category for category in categories.values()}
+        questions = self.group_by(
+            models.AssessmentQuestion._base_manager.using(self.using).order_by('order', 'pk'), 'category_id'
+        )
+        docs = self.group_by(
+            models.ReferenceDocument._base_manager.using(self.using).order_by('order', 'pk'), 'category_id'
+        )
+        metrics = self.group_by(
+            models.AssessmentMetric._base_manager.using(self.using).order_by('order', 'pk'), 'question_id'
+        )
+        seen = set()
+        for i, definition in enumerate(definitions):
+            path = 'categories[{i}]'.format(i=i)
+            values = self.values(definition, 'slug', 'label', 'description', 'status', 'activity', 'topic')
+            activity = classifications[models.Activity].get(values['activity'])
+            topic = classifications[models.Topic].get(values['topic'])
+            if activity is None or topic is None:
+                missing = 'activity' if activity is None else 'topic'
+                self.error(path, 'no {missing} {slug!r}'.format(missing=missing, slug=values[missing]))
+                continue
+            values.update(activity=activity, topic=topic)
+            values['slug'] = values['slug'] or slugify(values['label'] or
+                                                       models.AssessmentCategory.get_default_label(activity, topic))
+            category = categories.get(values['slug'])
+            other = pairs.get((activity.pk, topic.pk)) if activity.pk and topic.pk else None
+            if values['slug'] in seen or (other is not None and other is not category):
+                self.error(path, 'duplicate category {slug!r} for {activity} / {topic}'.format(
+                    slug=values['slug'], activity=activity.slug, topic=topic.slug
+                ))
+                continue
+            seen.add(values['slug'])
+            category = self.apply(models.AssessmentCategory, category, path, values)
+
+            doc_definitions = definition.get('reference_docs') or []
+            category_docs = docs.get(category.pk, {})
+            for order, doc in enumerate(doc_definitions):
+                values = dict(self.values(doc, 'label', 'description', 'url'), category=category, order=order)
+                self.apply(models.ReferenceDocument, self.match(category_docs, values['label']),
+                           '{path}.reference_docs[{order}]'.format(path=path, order=order), values)
+            self.reorder_remaining(models.ReferenceDocument, self.remaining(category_docs), len(doc_definitions))
+
+            question_definitions = definition.get('questions') or []
+            category_questions = questions.get(category.pk, {})
+            for order, question_definition in enumerate(question_definitions):
+                question_path = '{path}.questions[{order}]'.format(path=path, order=order)
+                values = dict(self.values(question_definition, 'label', 'description', 'status'),
+                              category=category, order=order)
+                question = self.apply(models.AssessmentQuestion, self.match(category_questions, values['label']),
+                                      question_path, values)
+
+                metric_definitions = question_definition.get('metrics') or []
+                question_metrics = metrics.get(question.pk, {})
+                for metric_order, metric in enumerate(metric_definitions):
+                    metric_path = '{path}.metrics[{order}]'.format(path=question_path, order=metric_order)
+                    metric_choices = self.choices.get(metric.get('choices'))
+                    if metric_choices is None:
+                        self.error(metric_path, 'no choices {key!r}'.format(key=metric.get('choices')))
+                        continue
+                    values = dict(self.values(metric, 'label', 'description', 'status'),
+                                  question=question, choices=metric_choices, order=metric_order)
+                    self.apply(models.AssessmentMetric, self.match(question_metrics, values['label']), metric_path,
+                               values)
+                self.reorder_remaining(models.AssessmentMetric, self.remaining(question_metrics),
+                                       len(metric_definitions))
+            self.reorder_remaining(models.AssessmentQuestion, self.remaining(category_questions),
+                                   len(question_definitions))
+
+    # -----------  Save -------------- #
+
+    def save(self, model):
+        """ Bulk create and bulk update the model's objects - FKs to new objects pick up their new pks """
+        manager = model._base_manager.using(self.using)
+        if self.created[model]:
+            if connections[self.using].features.can_return_rows_from_bulk_insert:
+                manager.bulk_create(self.created[model])
+            else:  # DB backend does not return ids from bulk inserts - they are needed to relate child objects
+                for obj in self.created[model]:
+                    Model.save(obj, force_insert=True, using=self.using)  # skip OrderedModel.save reordering
+        if self.updated[model]:
+            manager.bulk_update(self.updated[model], self.FIELDS[model])
+
+
+def import_definitions(document, using=None, dry_run=False):
+    """ Import a definitions document - raises ValidationError, listing every problem, if it is not valid """
+    return DefinitionImporter(using=using, dry_run=dry_run).run(document)
@@ -0,0 +1,25 @@
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+from assessment.builder import definitions
+
+
+class Command(BaseCommand):
+    help = 'Export the assessment definitions (builder taxonomy) as a JSON or YAML document.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', '-o', default='-', help='Output file path, or - for stdout')
+        parser.add_argument('--format', choices=definitions.FORMATS, dest='definitions_format',
+                            help='Document format - yaml requires PyYAML;  default: from the output file extension')
+
+    def handle(self, *args, **options):
+        output = options['output']
+        definitions_format = options['definitions_format'] or definitions.get_format(output)
+        try:
+            content = definitions.dumps(definitions.export_definitions(), definitions_format)
+        except ImproperlyConfigured as e:
+            raise CommandError(str(e))
+        if output == '-':
+            self.stdout.write(content, ending='')
+        else:
+            with open(output, 'w', encoding='utf-8') as f:
+                f.write(content)
@@ -0,0 +1,36 @@
+import sys
+from django.core.exceptions import ImproperlyConfigured, ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from assessment.builder import definitions
+
+
+class Command(BaseCommand):
+    help = 'Create and update the assessment definitions (builder taxonomy) from a JSON or YAML document.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Path of the definitions document, or - for stdin')
+        parser.add_argument('--format', choices=definitions.FORMATS, dest='definitions_format',
+                            help='Document format - yaml requires PyYAML;  default: from the file extension')
+        parser.add_argument('--dry-run', action='store_true', help='Validate the document but do not save anything')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        definitions_format = options['definitions_format'] or definitions.get_format(path)
+        try:
+            if path == '-':
+                content = sys.stdin.read()
+            else:
+                with open(path, encoding='utf-8') as f:
+                    content = f.read()
+            document = definitions.loads(content, definitions_format)
+            counts = definitions.import_definitions(document, dry_run=options['dry_run'])
+        except (OSError, ValueError, ImproperlyConfigured) as e:
+            raise CommandError('Unable to read {path}: {e}'.format(path=path, e=e))
+        except ValidationError as e:
+            for message in e.messages:
+                self.stderr.write(message)
+            raise CommandError('Invalid definitions - nothing was imported')
+        for label, (created, updated) in counts.items():
+            self.stdout.write('{label}: {created} {action}, {updated} updated'.format(
+                label=label, created=created, updated=updated, action='to create' if options['dry_run'] else 'created'
+            ))
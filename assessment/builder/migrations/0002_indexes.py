@@ -0,0 +1,19 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('builder', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='assessmentmetric',
+            index=models.Index(fields=['question', 'order'], name='builder_metric_order_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='assessmentquestion',
+            index=models.Index(fields=['category', 'order'], name='builder_question_order_idx'),
+        ),
+    ]
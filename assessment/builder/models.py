@@ -1,7 +1,6 @@
 import json
 
 from django.urls import reverse
-from django.utils.functional import cached_property
 from django.utils.text import slugify
 from django.db import models
 from ordered_model.models import OrderedModelManager, OrderedModel
@@ -175,6 +174,9 @@ class AssessmentQuestion(StatusMix, OrderedModel):
         ordering = ('order',)
         verbose_name = 'Question'
         verbose_name_plural = "4. Questions"
+        indexes = [
+            models.Index(fields=['category', 'order'], name='builder_question_order_idx'),
+        ]
 
     def __str__(self):
         return '{label}: {desc}'.format(label=self.label, desc=self.description)
@@ -184,6 +186,37 @@ class AssessmentQuestion(StatusMix, OrderedModel):
         return self.metric_set.count()
 
 
+# Process-wide registry of parsed choice maps:  {MetricChoicesType pk: (choice_map JSON, choice_dict, choices)}
+# Every metric carries its own MetricChoicesType instance, but there are only a handful of distinct choice maps.
+# An entry is only used while its JSON matches the instance's choice_map, so an edit in another process is never missed.
+_parsed_choice_maps = {}
+
+
+def parse_choice_map(choice_map):
+    """ Return (choice_dict, choices) for a JSON choice map:  choice_dict maps choice DB value to choice label """
+    choice_dict = {value: key for key, value in json.loads(choice_map).items()}  # flip JSON mapping
+    return choice_dict, tuple(choice_dict.items())
+
+
+def get_parsed_choice_map(choices_type_id, choice_map):
+    """ Return (choice_dict, choices) for given MetricChoicesType pk and choice_map, parsing only on a registry miss """
+    if choices_type_id is None:
+        return parse_choice_map(choice_map)
+    entry = _parsed_choice_maps.get(choices_type_id)
+    if entry is None or entry[0] != choice_map:
+        entry = (choice_map, *parse_choice_map(choice_map))
+        _parsed_choice_maps[choices_type_id] = entry
+    return entry[1:]
+
+
+def clear_parsed_choice_map(choices_type_id=None):
+    """ Remove the parsed choice map for given MetricChoicesType pk from the registry, or all of them if None """
+    if choices_type_id is None:
+        _parsed_choice_maps.clear()
+    else:
+        _parsed_choice_maps.pop(choices_type_id, None)
+
+
 class MetricChoicesType(models.Model):
     """ metric choice types """
     label = models.CharField(max_length=64,
@@ -200,15 +233,15 @@ class MetricChoicesType(models.Model):
     def __str__(self):
         return '{label}: ({choices})'.format(label=self.label, choices=', '.join(self.choice_dict.values()))
 
-    @cached_property
+    @property
     def choice_dict(self):
-        """ choice dictionary mapping choice DB value to choice label """
-        return {value: key for key, value in json.loads(self.choice_map).items()}  # flip JSON mapping
+        """ choice dictionary mapping choice DB value to choice label - shared, do not modify """
+        return get_parsed_choice_map(self.pk, self.choice_map)[0]
 
-    @cached_property
+    @property
     def choices(self):
         """ Return standard Django choices tuple """
-        return tuple(self.choice_dict.items())
+        return get_parsed_choice_map(self.pk, self.choice_map)[1]
 
     def get_choice_display(self, value):
         return self.choice_dict[value]
@@ -246,6 +279,9 @@ class AssessmentMetric(StatusMix, OrderedModel):
         ordering = ('order',)
         verbose_name = 'Metric'
         verbose_name_plural = "5. Metrics"
+        indexes = [
+            models.Index(fields=['question', 'order'], name='builder_metric_order_idx'),
+        ]
 
     def __str__(self):
         return self.label
@@ -0,0 +1,60 @@
+"""
+    Bulk reordering of the ordered builder models (django-ordered-model).
+    ordered-model moves one object at a time, shifting its neighbours with separate UPDATEs.  Here a complete
+        ordering for a parent (e.g., all the metrics of a question) is applied at once, with a single bulk_update.
+"""
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from assessment.builder import taxonomy
+
+
+def get_siblings(model, parent=None, using=None):
+    """ Return queryset of the model objects ordered with respect to the given parent object (or pk) """
+    queryset = model._base_manager.db_manager(using).all()
+    wrt = model.get_order_with_respect_to()
+    if not wrt:
+        return queryset
+    if parent is None:
+        raise ValidationError('{model} can only be reordered within its {parent}'.format(
+            model=model._meta.verbose_name, parent=' / '.join(wrt)
+        ))
+    field_name, = wrt
+    return queryset.filter(**{field_name: parent})
+
+
+def reorder(model, pks, parent=None, using=None):
+    """
+        Re-number the order of the model objects under parent to follow the sequence of object pks.
+        The sequence must be the complete set of sibling pks, each exactly once - raise ValidationError otherwise.
+        Returns the number of objects whose order changed.
+    """
+    pks = list(pks)
+    order_field_name = model.order_field_name
+    with transaction.atomic(using=using):
+        # ordered-model reads the order_with_respect_to fields on init - load them to avoid a query per object
+        siblings = get_siblings(model, parent, using).select_for_update().only(
+            'pk', order_field_name, *model.get_order_with_respect_to()
+        )
+        objects = {obj.pk: obj for obj in siblings}
+        try:
+            pks = [objects[model._meta.pk.to_python(pk)].pk for pk in pks]
+        except (KeyError, ValidationError):
+            raise ValidationError('Reorder {model}: new order includes an unknown {model}'.format(
+                model=model._meta.verbose_name
+            ))
+        if len(set(pks)) != len(pks) or len(pks) != len(objects):
+            raise ValidationError('Reorder {model}: new order must list each of the {count} objects exactly once'.format(
+                model=model._meta.verbose_name, count=len(objects)
+            ))
+        changed = []
+        for order, pk in enumerate(pks):
+            obj = objects[pk]
+            if getattr(obj, order_field_name) != order:
+                setattr(obj, order_field_name, order)
+                changed.append(obj)
+        model._base_manager.db_manager(using).bulk_update(changed, [order_field_name])
+        if changed:
+            # bulk_update sends no signals - invalidate the taxonomy as builder.signals would on save
+            taxonomy.invalidate()
+            transaction.on_commit(taxonomy.invalidate, using=using)
+    return len(changed)
@@ -0,0 +1,24 @@
+""" Signal receivers that invalidate cached data derived from the builder models """
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from assessment.builder import models, taxonomy
+
+
+@receiver((post_save, post_delete), sender=models.Activity)
+@receiver((post_save, post_delete), sender=models.Topic)
+@receiver((post_save, post_delete), sender=models.AssessmentCategory)
+@receiver((post_save, post_delete), sender=models.AssessmentQuestion)
+@receiver((post_save, post_delete), sender=models.AssessmentMetric)
+@receiver((post_save, post_delete), sender=models.MetricChoicesType)
+def invalidate_taxonomy(sender, **kwargs):
+    """ Any change to the taxonomy invalidates the taxonomy snapshots and category blueprints """
+    taxonomy.invalidate()
+    # again once committed, in case another process cached the old taxonomy before this change was visible to it
+    transaction.on_commit(taxonomy.invalidate)
+
+
+@receiver((post_save, post_delete), sender=models.MetricChoicesType)
+def clear_parsed_choice_map(sender, instance, **kwargs):
+    """ Drop the stale parsed choice map from the process-wide registry """
+    models.clear_parsed_choice_map(instance.pk)
@@ -0,0 +1,79 @@
+/*
+    Drag-and-drop ordering for the builder admin.
+    Rows with a .reorder-handle can be dragged within their table; on drop, the complete order of the rows
+    is posted to the handle's reorder url, which applies it in a single bulk update.
+*/
+'use strict';
+(function() {
+    function csrfToken() {
+        const input = document.querySelector('input[name=csrfmiddlewaretoken]');
+        if (input) {
+            return input.value;
+        }
+        const cookie = document.cookie.split(';').map(c => c.trim()).find(c => c.startsWith('csrftoken='));
+        return cookie ? decodeURIComponent(cookie.substring('csrftoken='.length)) : '';
+    }
+
+    function handleRows(tbody) {
+        return Array.from(tbody.querySelectorAll(':scope > tr')).filter(row => row.querySelector('.reorder-handle'));
+    }
+
+    function saveOrder(tbody) {
+        const rows = handleRows(tbody);
+        const handle = rows[0].querySelector('.reorder-handle');
+        const data = new FormData();
+        data.append('parent', handle.dataset.parent);
+        rows.forEach(row => data.append('order', row.querySelector('.reorder-handle').dataset.pk));
+        fetch(handle.dataset.reorderUrl, {
+            method: 'POST', body: data, credentials: 'same-origin', headers: {'X-CSRFToken': csrfToken()}
+        }).then(response => response.json().then(result => {
+            if (!response.ok) {
+                throw new Error((result.errors || [response.statusText]).join('\n'));
+            }
+            rows.forEach((row, order) => {
+                const cell = row.querySelector('.field-order');
+                if (cell) {
+                    cell.textContent = order;
+                }
+            });
+        })).catch(error => {
+            window.alert('Unable to save the new order: ' + error.message);
+            window.location.reload();
+        });
+    }
+
+    function init(tbody) {
+        let dragging = null;
+        handleRows(tbody).forEach(row => {
+            const handle = row.querySelector('.reorder-handle');
+            // only drag by the handle, so the row's form fields remain usable
+            handle.addEventListener('mousedown', () => row.setAttribute('draggable', 'true'));
+            row.addEventListener('dragstart', event => {
+                dragging = row;
+                event.dataTransfer.effectAllowed = 'move';
+            });
+            row.addEventListener('dragover', event => {
+                if (!dragging || row === dragging) {
+                    return;
+                }
+                event.preventDefault();
+                const rect = row.getBoundingClientRect();
+                const after = event.clientY > rect.top + rect.height / 2;
+                tbody.insertBefore(dragging, after ? row.nextSibling : row);
+            });
+            row.addEventListener('dragend', () => {
+                row.removeAttribute('draggable');
+                if (dragging) {
+                    dragging = null;
+                    saveOrder(tbody);
+                }
+            });
+        });
+    }
+
+    document.addEventListener('DOMContentLoaded', () => {
+        const tables = new Set();
+        document.querySelectorAll('.reorder-handle').forEach(handle => tables.add(handle.closest('tbody')));
+        tables.forEach(tbody => tbody && init(tbody));
+    });
+})();
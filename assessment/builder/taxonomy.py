@@ -0,0 +1,148 @@
+"""
+    Versioned, in-memory snapshot of the active builder taxonomy:
+        activities, topics, categories -> questions -> metrics (with their parsed choices)
+    The taxonomy changes rarely, but is read on almost every request.  Each process holds one snapshot, built in a
+        few queries, and rebuilds it only when the taxonomy version changes.
+    The version is kept in the django cache so any change to the builder models, in any process sharing the cache,
+        invalidates every snapshot (see builder.signals).  Deployments with more than one process MUST configure a
+        default cache shared by all processes - with a process-local cache (LocMemCache), other processes never see
+        the change (see builder.checks) until the version expires:  each version lasts at most VERSION_TIMEOUT
+        seconds, so every process rebuilds its snapshot at least that often, whatever the cache backend.
+    Snapshot objects are model instances shared by all requests in the process - treat them as read-only.
+"""
+import uuid
+from collections import namedtuple
+from types import MappingProxyType
+from django.core.cache import cache
+from django.utils.functional import cached_property
+from assessment.helpers.algorithms import sparse_to_full_matrix, index_vector
+
+
+VERSION_KEY = 'assessment.builder.taxonomy.version'
+VERSION_TIMEOUT = 5 * 60  # backstop for caches that don't share the version between processes
+
+
+def get_version():
+    """ Return the current taxonomy version, starting a new version if there is none """
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, uuid.uuid4().hex, timeout=VERSION_TIMEOUT)
+        # a cache that stores nothing (DummyCache) gets a new version every time - nothing is ever stale
+        version = cache.get(VERSION_KEY) or uuid.uuid4().hex
+    return version
+
+
+def invalidate():
+    """ Start a new taxonomy version - snapshots and data cached under older versions are never used again """
+    cache.set(VERSION_KEY, uuid.uuid4().hex, timeout=VERSION_TIMEOUT)
+
+
+QuestionNode = namedtuple('QuestionNode', ('question', 'metrics'))
+
+
+class TaxonomySnapshot:
+    """ Immutable snapshot of the active taxonomy, in display order """
+    def __init__(self, version, activities, topics, categories, questions, metrics):
+        self.version = version
+        self.activities = tuple(activities)
+        self.topics = tuple(topics)
+        activities_by_id, topics_by_id = self._index(self.activities, 'pk'), self._index(self.topics, 'pk')
+        for category in categories:  # share activity / topic instances so categories don't query for them
+            category.activity = activities_by_id[category.activity_id]
+            category.topic = topics_by_id[category.topic_id]
+        self.categories = tuple(sorted(categories, key=lambda cat: (cat.topic.order, cat.activity.order)))
+
+        self._activities = self._index(self.activities, 'slug')
+        self._topics = self._index(self.topics, 'slug')
+        self._categories = self._index(self.categories, 'slug')
+        self._categories_by_id = self._index(self.categories, 'pk')
+        metrics_by_question = {}
+        for metric in metrics:
+            metrics_by_question.setdefault(metric.question_id, []).append(metric)
+        questions_by_category = {category.pk: [] for category in self.categories}
+        metrics_by_id = {}
+        for question in questions:
+            if question.category_id in questions_by_category:
+                question.category = self._categories_by_id[question.category_id]
+                for metric in metrics_by_question.get(question.pk, ()):
+                    metric.question = question
+                    metrics_by_id[metric.pk] = metric
+                questions_by_category[question.category_id].append(
+                    QuestionNode(question, tuple(metrics_by_question.get(question.pk, ())))
+                )
+        self._questions = MappingProxyType({pk: tuple(nodes) for pk, nodes in questions_by_category.items()})
+        self._metrics_by_id = MappingProxyType(metrics_by_id)
+
+    @staticmethod
+    def _index(objects, attr):
+        return MappingProxyType({getattr(obj, attr): obj for obj in objects})
+
+    def get_activity(self, slug):
+        """ Return the active Activity with given slug, or None """
+        return self._activities.get(slug)
+
+    def get_topic(self, slug):
+        """ Return the active Topic with given slug, or None """
+        return self._topics.get(slug)
+
+    def get_classification(self, model, slug):
+        """ Return the active instance of model (Activity or Topic) with given slug, or None """
+        return {'activity': self._activities, 'topic': self._topics}[model._meta.model_name].get(slug)
+
+    def get_category(self, slug=None, pk=None):
+        """ Return the active AssessmentCategory with given slug or pk, or None """
+        return self._categories_by_id.get(pk) if slug is None else self._categories.get(slug)
+
+    def get_categories(self, activity=None, topic=None):
+        """ Return tuple of active categories, optionally only those for the given Activity and / or Topic """
+        return tuple(
+            category for category in self.categories
+            if (activity is None or category.activity_id == activity.pk) and
+               (topic is None or category.topic_id == topic.pk)
+        )
+
+    def get_metric(self, pk):
+        """ Return the active AssessmentMetric with given pk, with its question and category, or None """
+        return self._metrics_by_id.get(pk)
+
+    def get_questions(self, category):
+        """ Return tuple of (question, metrics) for active questions and metrics in given category, in order """
+        return self._questions.get(category.pk, ())
+
+    @cached_property
+    def matrix(self):
+        """ Return the assessment matrix: tuple of (topic, row), each row with a category (or '') for each activity """
+        rows = sparse_to_full_matrix(self.categories,
+                                     index_vector(self.topics), lambda cat: cat.topic,
+                                     index_vector(self.activities), lambda cat: cat.activity,
+                                     empty_value='')
+        return tuple((topic, tuple(row)) for topic, row in zip(self.topics, rows))
+
+
+def build_snapshot(version=None):
+    """ Return a TaxonomySnapshot of the current active taxonomy, built in one query per model """
+    from assessment.builder import models
+    active_questions = models.AssessmentQuestion._base_manager.filter(status=models.choices.ACTIVE_STATUS)
+    active_metrics = models.AssessmentMetric._base_manager.filter(status=models.choices.ACTIVE_STATUS)
+    return TaxonomySnapshot(
+        version=version,
+        activities=models.Activity.active.order_by('order'),
+        topics=models.Topic.active.order_by('order'),
+        categories=list(models.AssessmentCategory.active.all()),
+        questions=active_questions.order_by('order'),
+        metrics=active_metrics.filter(question__in=active_questions).select_related('choices')
+                              .order_by('question__order', 'order'),
+    )
+
+
+_snapshot = None
+
+
+def get_snapshot():
+    """ Return this process's snapshot of the current taxonomy, rebuilding it if the taxonomy has changed """
+    global _snapshot
+    version = get_version()  # read before building, so a change made during the build is picked up next time
+    snapshot = _snapshot
+    if snapshot is None or snapshot.version != version:
+        snapshot = _snapshot = build_snapshot(version)
+    return snapshot
@@ -0,0 +1,56 @@
+
+import uuid
+from django.core.cache import cache
+from django.test import TestCase
+from assessment.builder import blueprints, taxonomy
+from assessment.tests import base
+
+
+class BlueprintTests(TestCase):
+    """
+        Test cached category blueprints match the category's questions and metrics
+    """
+    def setUp(self):
+        super().setUp()
+        self.categories = base.create_assessment_categories()
+        self.category = self.categories[0]
+        base.create_question_metric_set(self.category, 'Question 1', 2)
+        base.create_question_metric_set(self.category, 'Question 2', 3)
+
+    def expected_blueprint(self, category):
+        questions = category.question_set.order_by('order')
+        return blueprints.CategoryBlueprint(
+            tuple(q.pk for q in questions),
+            tuple(m.pk for q in questions for m in q.metric_set.order_by('order'))
+        )
+
+    def test_get_blueprint(self):
+        self.assertEqual(blueprints.get_blueprint(self.category.pk), self.expected_blueprint(self.category))
+        self.assertEqual(blueprints.get_blueprint(self.categories[1].pk), blueprints.CategoryBlueprint((), ()))
+
+    def test_cached(self):
+        category_ids = [category.pk for category in self.categories]
+        with self.assertNumQueries(1):
+            built = blueprints.get_blueprints(category_ids)
+        with self.assertNumQueries(0):
+            self.assertEqual(blueprints.get_blueprints(category_ids), built)
+
+    def test_question_without_metrics(self):
+        question = base.create_question(self.category, 'Question 3')
+        self.assertEqual(blueprints.get_blueprint(self.category.pk).question_ids[-1], question.pk)
+
+    def test_invalidate_on_change(self):
+        blueprints.get_blueprint(self.category.pk)
+        question = self.category.question_set.first()
+        metric = base.create_metric(question, 'New Metric')
+        self.assertIn(metric.pk, blueprints.get_blueprint(self.category.pk).metric_ids)
+        metric.delete()
+        self.assertNotIn(metric.pk, blueprints.get_blueprint(self.category.pk).metric_ids)
+        question.delete()
+        self.assertEqual(blueprints.get_blueprint(self.category.pk), self.expected_blueprint(self.category))
+
+    def test_invalidate_from_other_process(self):
+        blueprints.get_blueprint(self.category.pk)
+        cache.set(taxonomy.VERSION_KEY, uuid.uuid4().hex, timeout=taxonomy.VERSION_TIMEOUT)  # in another process
+        with self.assertNumQueries(1):
+            blueprints.get_blueprint(self.category.pk)
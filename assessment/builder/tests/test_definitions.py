@@ -0,0 +1,176 @@
+import copy, io, os, tempfile
+from unittest import skipUnless
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from assessment.builder import models, choices, definitions, taxonomy
+from assessment.tests import base
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+
+class DefinitionsTests(TestCase):
+    """
+        The builder taxonomy exports to a definitions document that imports with bulk creates / updates
+    """
+    def setUp(self):
+        super().setUp()
+        self.categories = base.create_assessment_categories()
+        self.category = models.AssessmentCategory.objects.get(slug='activity-1-topic-a')
+        base.create_question_metric_set(self.category, 'Question 1', 2)
+        base.create_question_metric_set(self.category, 'Question 2', 1)
+        base.create_refdoc(self.category, 'Reference')
+
+    def clear_taxonomy(self):
+        models.Activity.objects.all().delete()
+        models.Topic.objects.all().delete()
+        models.MetricChoicesType.objects.all().delete()
+
+    def get_category(self, document, slug='activity-1-topic-a'):
+        return next(category for category in document['categories'] if category['slug'] == slug)
+
+    def test_export(self):
+        with self.assertNumQueries(7):
+            document = definitions.export_definitions()
+        self.assertEqual([activity['slug'] for activity in document['activities']],
+                         list(models.Activity.objects.order_by('order').values_list('slug', flat=True)))
+        self.assertEqual(len(document['categories']), len(self.categories))
+        category = self.get_category(document)
+        self.assertEqual((category['activity'], category['topic']), ('activity-1', 'topic-a'))
+        self.assertEqual([question['label'] for question in category['questions']], ['Question 1', 'Question 2'])
+        metric = category['questions'][0]['metrics'][0]
+        self.assertEqual(metric['label'], 'Metric 0 for question Question 1')
+        choices_type, = [c for c in document['choices'] if c['key'] == metric['choices']]
+        self.assertEqual(choices_type['choice_map'], {'non-compliant': 0, 'needs work': 1, 'fully compliant': 2})
+        self.assertEqual(category['reference_docs'][0]['label'], 'Reference')
+
+    def test_round_trip(self):
+        document = definitions.export_definitions()
+        self.clear_taxonomy()
+        counts = definitions.import_definitions(document)
+        self.assertEqual(counts['builder.AssessmentMetric'], (3, 0))
+        self.assertEqual(counts['builder.AssessmentCategory'], (len(self.categories), 0))
+        self.assertEqual(definitions.export_definitions(), document)
+        category = models.AssessmentCategory.objects.get(slug=self.category.slug)
+        self.assertEqual(list(category.question_set.order_by('order').values_list('label', 'order')),
+                         [('Question 1', 0), ('Question 2', 1)])
+        # nothing changed, nothing to update
+        counts = definitions.import_definitions(document)
+        self.assertEqual(set(counts.values()), {(0, 0)})
+
+    def test_update(self):
+        document = definitions.export_definitions()
+        category = self.get_category(document)
+        category['questions'].reverse()
+        category['questions'][0]['metrics'].append(dict(category['questions'][1]['metrics'][0], label='New metric'))
+        category['description'] = 'New description'
+        document['activities'].reverse()
+        counts = definitions.import_definitions(document)
+        self.assertEqual(counts['builder.AssessmentQuestion'], (0, 2))
+        self.assertEqual(counts['builder.AssessmentMetric'], (1, 0))
+        self.assertEqual(counts['builder.AssessmentCategory'], (0, 1))
+        self.assertEqual(counts['builder.MetricChoicesType'], (0, 0))
+
+        questions = models.AssessmentQuestion.objects.filter(category=self.category).order_by('order')
+        self.assertEqual([question.label for question in questions], ['Question 2', 'Question 1'])
+        self.assertEqual(list(questions[0].metric_set.order_by('order').values_list('label', 'order')),
+                         [('Metric 0 for question Question 2', 0), ('New metric', 1)])
+        self.assertEqual(list(models.Activity.objects.order_by('order').values_list('slug', flat=True)),
+                         ['activity-3', 'activity-2', 'activity-1'])
+        exported = definitions.export_definitions()
+        self.assertEqual(exported['activities'], document['activities'])
+        by_slug = lambda document: {category['slug']: category for category in document['categories']}
+        self.assertEqual(by_slug(exported), by_slug(document))  # categories are in activity order
+
+    def test_partial_update(self):
+        """ Existing objects missing from the document are ordered after those in it, so orders stay unique """
+        document = definitions.export_definitions()
+        category = self.get_category(document)
+        category['questions'] = category['questions'][1:]
+        category['questions'][0]['metrics'].append(dict(category['questions'][0]['metrics'][0], label='New metric'))
+        document['activities'] = document['activities'][-1:]
+        definitions.import_definitions(document)
+        questions = models.AssessmentQuestion.objects.filter(category=self.category).order_by('order')
+        self.assertEqual(list(questions.values_list('label', 'order')), [('Question 2', 0), ('Question 1', 1)])
+        self.assertEqual(list(questions[0].metric_set.order_by('order').values_list('order', flat=True)), [0, 1])
+        self.assertEqual(list(models.Activity.objects.order_by('order').values_list('slug', 'order')),
+                         [('activity-3', 0), ('activity-1', 1), ('activity-2', 2)])
+
+    def test_query_count(self):
+        """ Queries depend on the number of models, not the number of objects """
+        document = definitions.export_definitions()
+        large = copy.deepcopy(document)
+        for category in large['categories']:
+            category['questions'] = self.get_category(document)['questions']
+        self.clear_taxonomy()
+        with CaptureQueriesContext(connection) as queries:
+            definitions.import_definitions(document)
+        self.clear_taxonomy()
+        with CaptureQueriesContext(connection) as large_queries:
+            counts = definitions.import_definitions(large)
+        self.assertEqual(counts['builder.AssessmentMetric'], (3 * len(self.categories), 0))
+        self.assertEqual(len(large_queries), len(queries))
+
+    def test_invalidates_taxonomy(self):
+        document = definitions.export_definitions()
+        self.get_category(document)['status'] = 'retired'
+        self.assertIsNotNone(taxonomy.get_snapshot().get_category(self.category.slug))
+        definitions.import_definitions(document)
+        self.assertIsNone(taxonomy.get_snapshot().get_category(self.category.slug))
+
+    def test_validation(self):
+        document = definitions.export_definitions()
+        choices_path = 'choices[{}]'.format(len(document['choices']))
+        document['choices'].append(dict(key='bad', label='Bad', choice_map={'Too high': 99}))
+        document['activities'].append(dict(document['activities'][0]))
+        category = self.get_category(document)
+        category['status'] = 'unknown'
+        category['questions'][0]['metrics'][0]['choices'] = 'missing'
+        category['questions'][0]['metrics'][1]['label'] = 'x' * 65
+        other = self.get_category(document, 'activity-2-topic-a')
+        other['topic'] = 'topic-z'
+        with self.assertRaises(ValidationError) as cm:
+            definitions.import_definitions(document)
+        path = 'categories[{}]'.format(document['categories'].index(category))
+        self.assertEqual(sorted(message.split(':')[0] for message in cm.exception.messages), sorted([
+            choices_path, 'activities[3]', path, path + '.questions[0].metrics[0]', path + '.questions[0].metrics[1]',
+            'categories[{}]'.format(document['categories'].index(other)),
+        ]))
+        self.assertFalse(models.MetricChoicesType.objects.filter(label='Bad').exists())
+        self.assertEqual(models.AssessmentCategory.objects.get(pk=self.category.pk).status, choices.ACTIVE_STATUS)
+        with self.assertRaises(ValidationError):
+            definitions.import_definitions({'version': 99})
+
+    def test_dry_run(self):
+        document = definitions.export_definitions()
+        self.clear_taxonomy()
+        counts = definitions.import_definitions(document, dry_run=True)
+        self.assertEqual(counts['builder.AssessmentQuestion'], (2, 0))
+        self.assertFalse(models.AssessmentCategory.objects.exists())
+
+    def test_commands(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'definitions.json')
+            call_command('export_definitions', output=path)
+            self.clear_taxonomy()
+            stdout = io.StringIO()
+            call_command('import_definitions', path, stdout=stdout)
+            self.assertIn('builder.AssessmentMetric: 3 created, 0 updated', stdout.getvalue())
+            self.assertEqual(models.AssessmentMetric.objects.count(), 3)
+            with open(path, 'w') as f:
+                f.write('{"version": 1, "activities": [{"slug": "bad slug"}]}')
+            with self.assertRaises(CommandError):
+                call_command('import_definitions', path, stderr=io.StringIO())
+
+    @skipUnless(yaml, 'YAML definitions require PyYAML')
+    def test_yaml(self):
+        document = definitions.export_definitions()
+        content = definitions.dumps(document, 'yaml')
+        self.assertEqual(definitions.loads(content, 'yaml'), document)
+        self.assertEqual(definitions.get_format('definitions.YML'), 'yaml')
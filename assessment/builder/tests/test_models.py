@@ -88,6 +88,21 @@ class MetricChoiceTypeTests(TestCase):
         choice_type = base.create_metric_choice_type('Some Choices', '{"a":0, "b":1, "c":2}' )
         self.assertEqual(choice_type.choices, ((0, 'a'), (1,'b'), (2,'c')))
 
+    def test_parsed_choice_map_shared(self):
+        # Each instance loaded from the DB uses the same parsed choice map
+        instances = list(models.MetricChoicesType.objects.filter(pk=self.choice_type.pk)) * 2
+        instances += list(models.MetricChoicesType.objects.filter(pk=self.choice_type.pk))
+        self.assertTrue(all(c.choice_dict is self.choice_type.choice_dict for c in instances))
+        self.assertEqual(instances[-1].get_choice_display(1), 'needs work')
+
+    def test_parsed_choice_map_invalidated(self):
+        self.assertEqual(self.choice_type.get_choice_display(2), 'fully compliant')
+        other = models.MetricChoicesType.objects.get(pk=self.choice_type.pk)
+        other.choice_map = '{"no":0, "yes":2}'
+        self.assertEqual(other.get_choice_display(2), 'yes')  # unsaved edit
+        other.save()
+        self.assertFalse(models.MetricChoicesType.objects.get(pk=self.choice_type.pk).validate(1))
+
     def test_validate(self):
         for i in self.valid_values:
             self.assertTrue(self.choice_type.validate(i))
@@ -129,6 +144,11 @@ class AssessmentMetricTests(TestCase):
         for i in self.invalid_values:
             self.assertFalse(self.metric.validate(i))
 
+    def test_slug(self):
+        self.assertEqual(self.metric.slug, 'test-metric')
+        self.metric.label = 'Relabelled Metric'
+        self.assertEqual(self.metric.slug, 'relabelled-metric')
+
 
 class ActiveManagerTests(TestCase):
     """
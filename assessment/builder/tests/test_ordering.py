@@ -0,0 +1,97 @@
+from django.core.exceptions import ValidationError
+from django.test import TestCase
+from django.urls import reverse
+from assessment.builder import models, ordering, taxonomy
+from assessment.tests import base
+
+
+class ReorderTests(TestCase):
+    """
+        A complete ordering for a parent is applied in a single bulk update
+    """
+    def setUp(self):
+        super().setUp()
+        self.categories = base.create_assessment_categories()
+        self.category = models.AssessmentCategory.objects.get(slug='activity-1-topic-a')
+        base.create_question_metric_set(self.category, 'Question 1', 5)
+        base.create_question_metric_set(self.category, 'Question 2', 1)
+        self.question = self.category.question_set.get(label='Question 1')
+        self.metrics = list(self.question.metric_set.order_by('order').values_list('pk', flat=True))
+
+    def metric_order(self, question=None):
+        return list((question or self.question).metric_set.order_by('order').values_list('pk', 'order'))
+
+    def test_reorder(self):
+        new_order = list(reversed(self.metrics))
+        # select siblings + bulk update (+ savepoints)
+        with self.assertNumQueries(4):
+            updated = ordering.reorder(models.AssessmentMetric, new_order, self.question)
+        self.assertEqual(updated, 4)  # middle metric stays put
+        self.assertEqual(self.metric_order(), [(pk, order) for order, pk in enumerate(new_order)])
+        with self.assertNumQueries(3):
+            self.assertEqual(ordering.reorder(models.AssessmentMetric, new_order, self.question.pk), 0)
+        # other parents are unaffected
+        other = self.category.question_set.get(label='Question 2')
+        self.assertEqual([order for pk, order in self.metric_order(other)], [0])
+
+    def test_reorder_unordered_parent(self):
+        activities = list(models.Activity.objects.order_by('-order').values_list('pk', flat=True))
+        ordering.reorder(models.Activity, [str(pk) for pk in activities])
+        self.assertEqual(list(models.Activity.objects.values_list('pk', flat=True)), activities)
+        # ordered-model moves still work from the new order
+        models.Activity.objects.get(pk=activities[0]).bottom()
+        self.assertEqual(list(models.Activity.objects.values_list('pk', flat=True)), activities[1:] + activities[:1])
+
+    def test_validation(self):
+        other = models.AssessmentMetric.objects.exclude(question=self.question).first()
+        cases = (
+            self.metrics[:-1],                        # incomplete
+            self.metrics + [self.metrics[0]],         # duplicate
+            self.metrics[:-1] + [other.pk],           # different parent
+            self.metrics[:-1] + ['x'],                # invalid pk
+        )
+        for pks in cases:
+            with self.subTest(pks=pks):
+                with self.assertRaises(ValidationError):
+                    ordering.reorder(models.AssessmentMetric, pks, self.question)
+        with self.assertRaises(ValidationError):
+            ordering.reorder(models.AssessmentMetric, self.metrics)  # parent is required
+        self.assertEqual([pk for pk, order in self.metric_order()], self.metrics)
+
+    def test_invalidates_taxonomy(self):
+        snapshot = taxonomy.get_snapshot()
+        ordering.reorder(models.AssessmentMetric, reversed(self.metrics), self.question)
+        self.assertIsNot(taxonomy.get_snapshot(), snapshot)
+        node = taxonomy.get_snapshot().get_category(self.category.slug)
+        self.assertIsNotNone(node)
+
+    def test_admin_view(self):
+        url = reverse('admin:builder_assessmentmetric_reorder')
+        new_order = list(reversed(self.metrics))
+        user = base.create_user('builder')
+        user.is_staff = True
+        user.save()
+        self.client.login(username=user.username, password='password')
+        data = {'parent': self.question.pk, 'order': new_order}
+        self.assertEqual(self.client.post(url, data).status_code, 403)
+        user.is_superuser = True
+        user.save()
+        self.assertEqual(self.client.get(url).status_code, 405)
+        response = self.client.post(url, data)
+        self.assertEqual(response.json(), {'updated': 4})
+        self.assertEqual([pk for pk, order in self.metric_order()], new_order)
+        response = self.client.post(url, {'parent': self.question.pk, 'order': new_order[1:]})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('errors', response.json())
+        self.assertEqual(self.client.post(url, {'parent': 'x', 'order': new_order}).status_code, 400)
+
+    def test_admin_handles(self):
+        user = base.create_user('builder')
+        user.is_staff = user.is_superuser = True
+        user.save()
+        self.client.login(username=user.username, password='password')
+        response = self.client.get(reverse('admin:builder_assessmentquestion_change', args=[self.question.pk]))
+        self.assertContains(response, 'class="reorder-handle"', count=5)
+        self.assertContains(response, 'builder/admin/reorder.js')
+        response = self.client.get(reverse('admin:builder_activity_changelist'))
+        self.assertContains(response, 'class="reorder-handle"', count=3)
@@ -0,0 +1,96 @@
+
+import time
+from unittest import mock
+from django.core.cache import caches
+from django.test import TestCase, override_settings
+from assessment.builder import models, choices, taxonomy
+from assessment.builder.checks import check_taxonomy_cache
+from assessment.tests import base
+
+
+class TaxonomySnapshotTests(TestCase):
+    """
+        Test the taxonomy snapshot matches the active builder models, and is rebuilt when they change
+    """
+    def setUp(self):
+        super().setUp()
+        self.categories = base.create_assessment_categories()
+        self.category = self.categories[0]
+        base.create_question_metric_set(self.category, 'Question 1', 2)
+        base.create_question_metric_set(self.category, 'Question 2', 1)
+
+    def test_snapshot(self):
+        snapshot = taxonomy.get_snapshot()
+        self.assertEqual(list(snapshot.activities), list(models.Activity.active.order_by('order')))
+        self.assertEqual(list(snapshot.topics), list(models.Topic.active.order_by('order')))
+        self.assertEqual(list(snapshot.categories),
+                         list(models.AssessmentCategory.active.order_by('topic__order', 'activity__order')))
+        self.assertEqual(snapshot.get_category(self.category.slug), self.category)
+        self.assertEqual(snapshot.get_category(pk=self.category.pk), self.category)
+        self.assertEqual(snapshot.get_activity(self.category.activity.slug), self.category.activity)
+        self.assertEqual(snapshot.get_classification(models.Topic, self.category.topic.slug), self.category.topic)
+        self.assertEqual(set(snapshot.get_categories(activity=self.category.activity)),
+                         set(models.AssessmentCategory.active.filter(activity=self.category.activity)))
+
+    def test_questions(self):
+        snapshot = taxonomy.get_snapshot()
+        questions = snapshot.get_questions(self.category)
+        self.assertEqual([node.question for node in questions], list(self.category.question_set.order_by('order')))
+        with self.assertNumQueries(0):
+            for question, metrics in questions:
+                for metric in metrics:
+                    self.assertEqual(metric.question.category, self.category)
+                    self.assertTrue(metric.choices.choices)
+                    self.assertIs(snapshot.get_metric(metric.pk), metric)
+        self.assertEqual(snapshot.get_questions(self.categories[1]), ())
+        self.assertIsNone(snapshot.get_metric(0))
+
+    def test_matrix(self):
+        snapshot = taxonomy.get_snapshot()
+        self.assertEqual([topic for topic, row in snapshot.matrix], list(snapshot.topics))
+        for topic, row in snapshot.matrix:
+            self.assertEqual([cat.activity for cat in row], list(snapshot.activities))
+            self.assertTrue(all(cat.topic == topic for cat in row))
+
+    def test_cached(self):
+        snapshot = taxonomy.get_snapshot()
+        with self.assertNumQueries(0):
+            self.assertIs(taxonomy.get_snapshot(), snapshot)
+            snapshot.get_category(self.category.slug).topic.get_absolute_url()
+
+    def test_invalidated(self):
+        snapshot = taxonomy.get_snapshot()
+        question = self.category.question_set.first()
+        metric = base.create_metric(question, 'New Metric')
+        self.assertIsNot(taxonomy.get_snapshot(), snapshot)
+        self.assertIn(metric, taxonomy.get_snapshot().get_questions(self.category)[0].metrics)
+        inactive = [choice for choice, label in choices.STATUS_CHOICES if choice is not choices.ACTIVE_STATUS]
+        self.category.status = inactive[0]
+        self.category.save()
+        self.assertIsNone(taxonomy.get_snapshot().get_category(self.category.slug))
+
+    def test_version_expires(self):
+        snapshot = taxonomy.get_snapshot()
+        later = time.time() + taxonomy.VERSION_TIMEOUT + 1
+        with mock.patch('time.time', return_value=later):
+            self.assertIsNot(taxonomy.get_snapshot(), snapshot)
+
+
+class TaxonomyCacheTests(TestCase):
+    """
+        Test the taxonomy version requires a cache shared by all processes
+    """
+    def test_process_local_cache_warning(self):
+        warnings = check_taxonomy_cache(None)
+        self.assertEqual([warning.id for warning in warnings], ['builder.W001'])
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+                                           'LOCATION': 'assessment_cache'}})
+    def test_shared_cache(self):
+        self.assertEqual(check_taxonomy_cache(None), [])
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}})
+    def test_dummy_cache(self):
+        with mock.patch.object(taxonomy, 'cache', caches['default']):
+            self.assertNotEqual(taxonomy.get_version(), taxonomy.get_version())
+            self.assertIsNot(taxonomy.get_snapshot(), taxonomy.get_snapshot())
@@ -8,6 +8,10 @@ Functions used to control access to views (Permission Denied returned when false
 
 Each function takes the request user and the view's kwargs as arguments,
     returns True iff user has the required permission for the given object(s).
+
+Results are memoized for each request:  a function is called at most once per (user, kwargs) in a request,
+    so it must not depend on anything else that changes during the request.
+    Set a memoize = False attribute on any function that must be re-evaluated each time it is used.
 """
 from django.apps import apps
 appConfig = apps.get_app_config('assess')
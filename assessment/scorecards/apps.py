@@ -0,0 +1,6 @@
+from django.apps import AppConfig
+
+
+class ScorecardConfig(AppConfig):
+    name = 'assessment.scorecards'
+    verbose_name = 'Assessment Scorecards'
@@ -0,0 +1,153 @@
+"""
+    Vectorized scorecard engine.
+    A scorecard summarizes the MetricScores for a "slice" of assessments into a rows x columns grid of cells,
+        e.g., subjects x categories or topics x activities.
+    All score data for the slice is loaded with a single values_list query into NumPy arrays;
+        sums, applicable counts, means and score classes are then computed for every cell at once.
+"""
+from collections import namedtuple
+import numpy as np
+from django.apps import apps
+from assessment.helpers.algorithms import index_vector
+from assessment.assess import models
+
+appConfig = apps.get_app_config('assess')
+
+Cell = namedtuple('Cell', ('mean', 'count', 'records', 'score_class'))
+
+
+def factorize(*columns):
+    """
+        Return (unique_keys, codes) for the given key column(s): codes index each row's key in the sorted unique_keys
+        >>> keys, codes = factorize(['b', 'a', 'b'])
+        >>> keys.tolist(), codes.tolist()
+        (['a', 'b'], [1, 0, 1])
+    """
+    keys = np.asarray(columns[0]) if len(columns) == 1 else np.rec.fromarrays([np.asarray(c) for c in columns])
+    unique_keys, codes = np.unique(keys, return_inverse=True)
+    return unique_keys, codes.reshape(-1)
+
+
+def score_classes(means, score_classes=None):
+    """
+        Return array of score class names for an array of mean scores - same classification as AssessmentRecord.score_class
+        NaN (no applicable scores) is treated as a zero score.
+        >>> list(score_classes(np.array([0.25, 1.0, np.nan]), [(0.5, 'fail'), (1.0, 'poor'), (np.inf, 'good')]))
+        ['fail', 'poor', 'fail']
+    """
+    score_classes = score_classes or appConfig.settings.SCORE_CLASSES
+    thresholds = np.array([threshold for threshold, _ in score_classes], dtype=float)
+    names = np.array([name for _, name in score_classes], dtype=object)
+    return names[np.searchsorted(thresholds, np.nan_to_num(means, nan=0.0), side='left')]
+
+
+class Scorecard:
+    """
+        Scores summarized into a grid: rows x cols cells, each cell summarizing all applicable MetricScores in it.
+        row_keys, col_keys: sorted unique keys identifying each row and column (tuples for multi-field rows)
+        sums, counts, records: (rows x cols) int arrays - sum of applicable scores, # applicable scores, # assessments
+        means: (rows x cols) float array of mean applicable score, NaN where cell has no applicable scores
+        classes: (rows x cols) object array of score class names
+    """
+    def __init__(self, scores, row_fields, col_field):
+        """
+            scores: MetricScore queryset defining the slice of scores to summarize
+            row_fields: sequence of MetricScore field accessors whose values together identify a row
+            col_field: MetricScore field accessor whose value identifies a column
+            Row and column fields must be attributes of the score's assessment (e.g., its subject or category).
+        """
+        self.row_fields = tuple(row_fields)
+        self.col_field = col_field
+        rows = scores.order_by().values_list(*self.row_fields, self.col_field, 'assessment_id', 'applicable', 'score')
+        self._load(list(rows))
+
+    def _load(self, rows):
+        if not rows:
+            self.row_keys, self.col_keys = [], []
+            self.sums = self.counts = self.records = np.zeros((0, 0), dtype=int)
+            self.means = np.zeros((0, 0), dtype=float)
+            self.classes = np.zeros((0, 0), dtype=object)
+            return
+        num_keys = len(self.row_fields) + 1
+        column = lambda i, dtype: np.fromiter((row[i] for row in rows), dtype=dtype, count=len(rows))
+        assessment_ids = column(num_keys, np.int64)
+        applicable = column(num_keys + 1, bool)
+        scores = column(num_keys + 2, np.int64)
+
+        # row and col keys are attributes of the assessment: factorize them once per assessment, not per score.
+        _, first, assessment_codes = np.unique(assessment_ids, return_index=True, return_inverse=True)
+        samples = [rows[i] for i in first]
+        row_keys, row_codes = factorize(*zip(*(sample[:num_keys - 1] for sample in samples)))
+        col_keys, col_codes = factorize([sample[num_keys - 1] for sample in samples])
+        self.row_keys, self.col_keys = [self._key(key) for key in row_keys], [self._key(key) for key in col_keys]
+
+        shape = (len(self.row_keys), len(self.col_keys))
+        size = shape[0] * shape[1]
+        assessment_cells = row_codes * shape[1] + col_codes
+        cells = assessment_cells[assessment_codes.reshape(-1)]
+        self.sums = np.bincount(cells, weights=scores * applicable, minlength=size).astype(int).reshape(shape)
+        self.counts = np.bincount(cells, weights=applicable, minlength=size).astype(int).reshape(shape)
+        self.records = np.bincount(assessment_cells, minlength=size).reshape(shape)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            self.means = np.where(self.counts > 0, self.sums / self.counts, np.nan)
+        self.classes = score_classes(self.means)
+
+    @property
+    def shape(self):
+        return self.means.shape
+
+    def cell(self, i, j):
+        """ Return a Cell summarizing row i, col j; None if there are no assessments in that cell """
+        if not self.records[i, j]:
+            return None
+        mean = None if np.isnan(self.means[i, j]) else float(self.means[i, j])
+        return Cell(mean, int(self.counts[i, j]), int(self.records[i, j]), self.classes[i, j])
+
+    def rows(self):
+        """ Generate (row_key, [cells]) for each row in the scorecard """
+        for i, key in enumerate(self.row_keys):
+            yield key, [self.cell(i, j) for j in range(len(self.col_keys))]
+
+    def reindex(self, row_keys=None, col_keys=None):
+        """
+            Return a (rows x cols) list of lists of Cells laid out in the given order of row and column keys
+            Keys missing from the scorecard yield empty (None) cells - e.g., to show the full grid of active categories.
+        """
+        row_keys = self.row_keys if row_keys is None else row_keys
+        col_keys = self.col_keys if col_keys is None else col_keys
+        row_index = index_vector(self.row_keys)
+        col_index = index_vector(self.col_keys)
+        return [
+            [self.cell(row_index[r], col_index[c]) if r in row_index and c in col_index else None for c in col_keys]
+            for r in row_keys
+        ]
+
+    @staticmethod
+    def _key(key):
+        """ Normalize numpy scalars and records to plain python values """
+        if isinstance(key, (np.void, tuple)):
+            return tuple(Scorecard._key(value) for value in key)
+        return key.item() if isinstance(key, np.generic) else key
+
+
+def get_subject_fields(prefix='assessment__'):
+    """ Return MetricScore accessors for the subject fields that identify a subject (ASSESSMENT_SUBJECT_ORDER_BY) """
+    subject = appConfig.get_assessment_subject_related_name()
+    return tuple(
+        '{prefix}{subject}__{field}'.format(prefix=prefix, subject=subject, field=field)
+        for field in appConfig.settings.SUBJECT_ORDER_BY
+    )
+
+
+def subject_category_scorecard(records):
+    """ Return a Scorecard of subjects (rows) x categories (cols) for the given AssessmentRecord queryset """
+    subject_fields = get_subject_fields()
+    scores = models.MetricScore._base_manager.filter(assessment__in=records)\
+                                             .filter(**{field + '__isnull': False for field in subject_fields})
+    return Scorecard(scores, subject_fields, 'assessment__category_id')
+
+
+def topic_activity_scorecard(records):
+    """ Return a Scorecard of topics (rows) x activities (cols) for the given AssessmentRecord queryset """
+    scores = models.MetricScore._base_manager.filter(assessment__in=records)
+    return Scorecard(scores, ('assessment__category__topic_id', ), 'assessment__category__activity_id')
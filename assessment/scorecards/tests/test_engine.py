@@ -0,0 +1,124 @@
+import math
+import numpy as np
+from django.test import TestCase
+from django.urls import reverse
+from assessment import settings
+from assessment.assess import models, choices
+from assessment.scorecards import engine
+from assessment.tests import base
+
+
+class BaseScorecardTests(TestCase):
+    """ Shared fixtures: two subjects assessed in two categories of the same activity """
+    def setUp(self):
+        super().setUp()
+        self.categories = base.create_assessment_categories(activity_names=('Activity 1', ), topic_names=('Topic A', 'Topic B'))
+        for category in self.categories:
+            base.create_question_metric_set(category, 'Question 1', 2)
+        self.user = base.create_user('Assessor')
+        self.assessments = {
+            (subject, category.pk): base.create_assessment(self.user, category, subject)
+            for subject in ('Arthur', 'Zaphod') for category in self.categories
+        }
+        self.set_scores(('Arthur', self.categories[0].pk), (2, 2))
+        self.set_scores(('Arthur', self.categories[1].pk), (0, None))
+        self.set_scores(('Zaphod', self.categories[0].pk), (1, 2))
+        self.set_scores(('Zaphod', self.categories[1].pk), (None, None))
+
+    def set_scores(self, key, scores):
+        """ score value None marks the score as not applicable """
+        for metric_score, score in zip(self.assessments[key].score_set.all(), scores):
+            metric_score.applicable = score is not None
+            metric_score.score = score or 0
+            metric_score.save()
+
+
+class EngineTests(BaseScorecardTests):
+    """
+        Test vectorized scorecard computations
+    """
+    def test_factorize(self):
+        keys, codes = engine.factorize(['b', 'a', 'b'], [1, 2, 1])
+        self.assertEqual(len(keys), 2)
+        self.assertEqual(list(codes), [1, 0, 1])
+
+    def test_score_classes(self):
+        means = np.array([0, 0.5, 0.75, 1.0, 1.25, 2, np.nan])
+        expected = [models.AssessmentRecord(avg_score=None if math.isnan(m) else m).score_class for m in means]
+        self.assertEqual(list(engine.score_classes(means)), expected)
+
+    def test_subject_category_scorecard(self):
+        scorecard = engine.subject_category_scorecard(models.AssessmentRecord.objects.all())
+        self.assertEqual(scorecard.row_keys, ['Arthur', 'Zaphod'])
+        self.assertEqual(set(scorecard.col_keys), set(c.pk for c in self.categories))
+        cells = scorecard.reindex(col_keys=[c.pk for c in self.categories])
+        self.assertEqual(cells[0][0].mean, 2)
+        self.assertEqual(cells[0][1].mean, 0)
+        self.assertEqual(cells[0][1].count, 1)
+        self.assertEqual(cells[1][0].mean, 1.5)
+        self.assertIsNone(cells[1][1].mean)
+        self.assertEqual(cells[1][1].count, 0)
+        self.assertEqual(cells[1][1].records, 1)
+
+    def test_cells_match_records(self):
+        scorecard = engine.subject_category_scorecard(models.AssessmentRecord.objects.all())
+        for (subject, category), record in self.assessments.items():
+            cell = scorecard.reindex([subject], [category])[0][0]
+            record = models.AssessmentRecord.objects.get(pk=record.pk)
+            self.assertEqual(cell.mean, record.avg_score)
+            self.assertEqual(cell.count, record.score_count)
+            self.assertEqual(cell.score_class, record.score_class)
+
+    def test_topic_activity_scorecard(self):
+        scorecard = engine.topic_activity_scorecard(models.AssessmentRecord.objects.all())
+        self.assertEqual(scorecard.shape, (2, 1))
+        cells = scorecard.reindex(row_keys=[c.topic_id for c in self.categories])
+        self.assertEqual(cells[0][0].mean, 7 / 4)
+        self.assertEqual(cells[0][0].records, 2)
+        self.assertEqual(cells[1][0].score_class, settings.ASSESSMENT_SCORE_CLASSES[0][1])
+
+    def test_reindex_missing_keys(self):
+        scorecard = engine.topic_activity_scorecard(models.AssessmentRecord.objects.all())
+        self.assertEqual(scorecard.reindex(row_keys=[-1], col_keys=scorecard.col_keys), [[None]])
+
+    def test_single_query(self):
+        records = models.AssessmentRecord.objects.all()
+        with self.assertNumQueries(1):
+            engine.subject_category_scorecard(records)
+
+    def test_empty(self):
+        scorecard = engine.subject_category_scorecard(models.AssessmentRecord.objects.none())
+        self.assertEqual(scorecard.shape, (0, 0))
+        self.assertEqual(list(scorecard.rows()), [])
+
+
+class ScorecardViewTests(BaseScorecardTests):
+    """
+        Test scorecard views render for authenticated users
+    """
+    def setUp(self):
+        super().setUp()
+        self.client.login(username=self.user.username, password='password')
+
+    def test_matrix_view(self):
+        response = self.client.get(reverse('assessment.scorecards:matrix'))
+        self.assertEqual(response.status_code, 200, "Scorecard view returned non-success status code.")
+        self.assertContains(response, self.categories[0].topic.label)
+
+    def test_activity_view(self):
+        activity = self.categories[0].activity
+        response = self.client.get(reverse('assessment.scorecards:activity', args=(activity.slug,)))
+        self.assertEqual(response.status_code, 200, "Scorecard view returned non-success status code.")
+        self.assertContains(response, 'Zaphod')
+
+    def test_drafts_excluded(self):
+        models.AssessmentRecord.objects.filter(assessment_type='qa').update(status=choices.DRAFT_STATUS)
+        topic = self.categories[0].topic
+        response = self.client.get(reverse('assessment.scorecards:topic', args=(topic.slug,)))
+        self.assertEqual(response.status_code, 200, "Scorecard view returned non-success status code.")
+        self.assertNotContains(response, 'Zaphod')
+
+    def test_permission_denied(self):
+        self.client.logout()
+        response = self.client.get(reverse('assessment.scorecards:matrix'))
+        self.assertEqual(response.status_code, 403, "View returned non-denied status code for anonymous user.")
@@ -0,0 +1,12 @@
+from django.urls import path
+from . import views
+
+app_name = 'assessment.scorecards'
+
+urlpatterns = [
+    path('', views.TopicActivityScorecardView.as_view(), name='matrix'),
+
+    path('activity/<slug:slug>/', views.ActivityScorecardView.as_view(), name='activity'),
+
+    path('topic/<slug:slug>/', views.TopicScorecardView.as_view(), name='topic'),
+]
@@ -0,0 +1,101 @@
+from django.utils.functional import cached_property
+from django.shortcuts import get_object_or_404
+from django.views import generic
+from assessment.builder import taxonomy
+from assessment.assess import models
+from assessment.assess.permissions import permissions, permission_required, get_permissions_context
+from . import engine
+
+
+class BaseScorecardView(generic.TemplateView):
+    """ Render a scorecard grid summarizing the complete assessments in some slice of the assessment matrix """
+    template_name = 'scorecards/scorecard.html'
+
+    def get_records(self):
+        """ Return queryset of AssessmentRecords summarized by this scorecard """
+        return models.AssessmentRecord._base_manager.filter(status=models.choices.COMPLETE_STATUS)
+
+    def get_scorecard(self):
+        raise NotImplementedError
+
+    def get_row_labels(self, scorecard):
+        """ Return (row_keys, row_labels) in display order """
+        raise NotImplementedError
+
+    def get_columns(self, scorecard):
+        """ Return (col_keys, col_objects) in display order """
+        raise NotImplementedError
+
+    def get_context_data(self, **kwargs):
+        scorecard = self.get_scorecard()
+        row_keys, row_labels = self.get_row_labels(scorecard)
+        col_keys, columns = self.get_columns(scorecard)
+        kwargs['scorecard'] = scorecard
+        kwargs['columns'] = columns
+        kwargs['rows'] = zip(row_labels, scorecard.reindex(row_keys, col_keys))
+        return super().get_context_data(**get_permissions_context(self), **kwargs)
+
+
+@permission_required(permissions.user_can_view_assessments)
+class TopicActivityScorecardView(BaseScorecardView):
+    """ Scorecard for the whole assessment matrix: topics x activities """
+
+    def get_scorecard(self):
+        return engine.topic_activity_scorecard(self.get_records())
+
+    @cached_property
+    def topics(self):
+        return taxonomy.get_snapshot().topics
+
+    def get_row_labels(self, scorecard):
+        return [topic.pk for topic in self.topics], self.topics
+
+    def get_columns(self, scorecard):
+        activities = taxonomy.get_snapshot().activities
+        return [activity.pk for activity in activities], activities
+
+
+class AbstractGroupScorecardView(BaseScorecardView):
+    """ Scorecard for the categories of a single Activity or Topic: subjects x categories """
+    group_model = None  # Sub-classes MUST define the concrete group-type model
+    slug_filter = ''    # Sub-classes MUST define the category field that relates categories to the group
+
+    @cached_property
+    def group(self):
+        slug = self.kwargs['slug']
+        return taxonomy.get_snapshot().get_classification(self.group_model, slug) or \
+            get_object_or_404(self.group_model.objects, slug=slug)
+
+    @cached_property
+    def categories(self):
+        # Note: in topic, activity order - so ordered by the other classification within the group
+        return taxonomy.get_snapshot().get_categories(**{self.slug_filter: self.group})
+
+    def get_records(self):
+        return super().get_records().filter(category__in=self.categories)
+
+    def get_scorecard(self):
+        return engine.subject_category_scorecard(self.get_records())
+
+    def get_row_labels(self, scorecard):
+        labels = [' '.join(str(value) for value in key) if isinstance(key, tuple) else key for key in scorecard.row_keys]
+        return scorecard.row_keys, labels
+
+    def get_columns(self, scorecard):
+        return [category.pk for category in self.categories], self.categories
+
+    def get_context_data(self, **kwargs):
+        kwargs['group'] = self.group
+        return super().get_context_data(**kwargs)
+
+
+@permission_required(permissions.user_can_view_assessments)
+class ActivityScorecardView(AbstractGroupScorecardView):
+    group_model = models.Activity
+    slug_filter = 'activity'
+
+
+@permission_required(permissions.user_can_view_assessments)
+class TopicScorecardView(AbstractGroupScorecardView):
+    group_model = models.Topic
+    slug_filter = 'topic'
@@ -32,3 +32,16 @@ ASSESSMENT_SCORE_CLASSES.sort()
 # Configurable permisssions module
 # provide dotted-path to python module with permissions functions -- see permissions.py
 ASSESSMENT_PERMISSIONS = getattr(settings, 'ASSESSMENT_PERMISSIONS', 'assessment.permissions')
+
+# Content-addressed storage for SupportingDoc file attachments.
+# When True, each distinct attachment is stored once, under support_docs/<sha256 digest>/, and shared (reference counted)
+#   by every SupportingDoc with the same content.  The stored file is deleted with its last SupportingDoc.
+#   Run the sweep_document_blobs command periodically to delete files left behind by rolled back transactions.
+ASSESSMENT_DEDUPLICATE_FILES = getattr(settings, 'ASSESSMENT_DEDUPLICATE_FILES', False)
+
+# Serving backend for SupportingDoc file downloads, once the user's permission has been checked:
+#   'django' streams the file from the Django worker (with range requests);  'apache' hands it off with an X-Sendfile
+#   header;  'nginx' with an X-Accel-Redirect to ASSESSMENT_X_ACCEL_REDIRECT_URL, an internal location aliased to the
+#   file storage root;  or a dotted path to a server class - see assess.servers
+ASSESSMENT_FILE_SERVER = getattr(settings, 'ASSESSMENT_FILE_SERVER', 'django')
+ASSESSMENT_X_ACCEL_REDIRECT_URL = getattr(settings, 'ASSESSMENT_X_ACCEL_REDIRECT_URL', '/private-x-accel-redirect/')
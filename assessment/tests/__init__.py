@@ -38,4 +38,4 @@ def run_tests():
     django.setup()
     runner = get_runner(settings,"django.test.runner.DiscoverRunner")
     test_suite = runner(verbosity=2, interactive=True, failfast=False)
-    return test_suite.run_tests(['assessment', 'assessment.builder', 'assessment.assess', ])
+    return test_suite.run_tests(['assessment', 'assessment.builder', 'assessment.assess', 'assessment.scorecards', ])
@@ -34,6 +34,7 @@ INSTALLED_APPS = [
     'private_storage',
     'assessment.builder.apps.BuilderConfig',
     'assessment.assess.apps.PrivateAssessConfig',
+    'assessment.scorecards.apps.ScorecardConfig',
     'django_tables2',
     'django_filters',
 ]
@@ -81,6 +82,10 @@ DATABASES = {
 }
 
 
+# Tests run in a single process, so the default per-process cache is fine for the taxonomy version (see builder.checks)
+SILENCED_SYSTEM_CHECKS = ['builder.W001']
+
+
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
 
@@ -4,10 +4,14 @@ from django.urls import path, include
 
 
 urlpatterns = [
+    path('admin/', admin.site.urls),
+
     # path('builder/', include('assessment.builder.urls')),
 
     path('assessments/', include('assessment.assess.urls')),
 
+    path('scorecards/', include('assessment.scorecards.urls')),
+
     path('accounts/', include('django.contrib.auth.urls')),
 
     path('private-media/', include('private_storage.urls')),
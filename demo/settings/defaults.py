@@ -41,6 +41,7 @@ INSTALLED_APPS = [
     'private_storage',
     'assessment.builder.apps.BuilderConfig',
     'assessment.assess.apps.PrivateAssessConfig',
+    'assessment.scorecards.apps.ScorecardConfig',
     'django_tables2',
     'django_filters',
 ]
@@ -24,6 +24,8 @@ urlpatterns = [
 
     path('assessments/', include('assessment.assess.urls')),
 
+    path('scorecards/', include('assessment.scorecards.urls')),
+
     path('admin/', admin.site.urls),
 
     path('accounts/', include('django.contrib.auth.urls')),
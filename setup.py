@@ -39,7 +39,7 @@ setup(
     name=NAME,
     version=VERSION,
     packages=find_packages(include=['assessment', 'assessment.*']),
-    python_requires='>=3.5, <4',
+    python_requires='>=3.8, <4',
     install_requires = INSTALL_REQUIREMENTS + [
         'setuptools-git',    # apparently needed to handle include_package_data from git repo?
     ],